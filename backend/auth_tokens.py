@@ -0,0 +1,172 @@
+"""Stateless signed session tokens.
+
+Access and refresh tokens are ``<payload>.<signature>`` strings where the
+payload is base64url-encoded JSON and the signature is an HMAC-SHA256 over it,
+keyed with AUTH_TOKEN_SECRET. Without that secret no token is issued or
+accepted: a per-process random key would make every worker reject the others'
+tokens and log everyone out on restart. Tokens carry the employee id, company id and role so authenticated requests
+can be authorized without touching MongoDB or running bcrypt again.
+
+Revoked token ids (jti) are kept in a small in-process map and, when
+REDIS_URL is configured, mirrored to Redis with a TTL equal to the remaining
+token lifetime so every worker sees the revocation.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+try:
+    from .cache import get_redis, redis_configured  # type: ignore
+except Exception:
+    from cache import get_redis, redis_configured
+
+logger = logging.getLogger(__name__)
+
+ACCESS_TOKEN_TTL = int(os.environ.get("AUTH_ACCESS_TOKEN_TTL", str(15 * 60)))
+REFRESH_TOKEN_TTL = int(os.environ.get("AUTH_REFRESH_TOKEN_TTL", str(14 * 24 * 60 * 60)))
+REVOKED_KEY_PREFIX = "auth:revoked:"
+
+_secret: Optional[bytes] = None
+_revoked: Dict[str, float] = {}  # jti -> exp
+
+
+class TokenError(Exception):
+    """Raised when a token is malformed, tampered with, expired or revoked."""
+
+
+def _get_secret() -> bytes:
+    global _secret
+    if _secret is None:
+        configured = os.environ.get("AUTH_TOKEN_SECRET")
+        if not configured:
+            raise TokenError("AUTH_TOKEN_SECRET is not set; session tokens are disabled")
+        _secret = configured.encode("utf-8")
+    return _secret
+
+
+def tokens_configured() -> bool:
+    return bool(_secret or os.environ.get("AUTH_TOKEN_SECRET"))
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload_b64: str) -> str:
+    digest = hmac.new(_get_secret(), payload_b64.encode("ascii"), hashlib.sha256).digest()
+    return _b64encode(digest)
+
+
+def _encode(claims: Dict[str, Any]) -> str:
+    payload_b64 = _b64encode(json.dumps(claims, separators=(",", ":"), sort_keys=True).encode("utf-8"))
+    return f"{payload_b64}.{_sign(payload_b64)}"
+
+
+def _int_claim(value: Any, field: str) -> int:
+    # legacy employee documents may carry non-numeric ids; never mint a token for id 0
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise TokenError(f"employee has no numeric {field}")
+
+
+def _issue(employee: Dict[str, Any], token_type: str, ttl: int) -> str:
+    now = int(time.time())
+    claims = {
+        "sub": _int_claim(employee.get("id"), "id"),
+        "eid": str(employee.get("employee_id", "")),
+        "cid": _int_claim(employee.get("company_id") or 1, "company_id"),
+        "rol": str(employee.get("rol", "")),
+        "typ": token_type,
+        "iat": now,
+        "exp": now + ttl,
+        "jti": uuid.uuid4().hex,
+    }
+    return _encode(claims)
+
+
+def issue_token_pair(employee: Dict[str, Any]) -> Dict[str, Any]:
+    """Return a fresh access/refresh token pair for an employee document.
+
+    Raises TokenError when the document has no numeric id or company id, or
+    when AUTH_TOKEN_SECRET is not set.
+    """
+    return {
+        "access_token": _issue(employee, "access", ACCESS_TOKEN_TTL),
+        "refresh_token": _issue(employee, "refresh", REFRESH_TOKEN_TTL),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_TTL,
+    }
+
+
+def decode_token(token: str, expected_type: str = "access") -> Dict[str, Any]:
+    """Verify signature, expiry, type and revocation; return the claims."""
+    if not token or token.count(".") != 1:
+        raise TokenError("malformed token")
+    payload_b64, signature = token.split(".", 1)
+    try:
+        valid = hmac.compare_digest(_sign(payload_b64), signature)
+    except (UnicodeEncodeError, TypeError):
+        # non-ASCII input can be neither signed nor compared
+        raise TokenError("invalid token")
+    if not valid:
+        raise TokenError("invalid signature")
+    try:
+        claims = json.loads(_b64decode(payload_b64))
+        expires = float(claims.get("exp", 0))
+    except Exception:
+        raise TokenError("malformed token")
+
+    if claims.get("typ") != expected_type:
+        raise TokenError("wrong token type")
+    if expires <= time.time():
+        raise TokenError("token expired")
+    if is_revoked(claims.get("jti", "")):
+        raise TokenError("token revoked")
+    return claims
+
+
+def refresh_token_pair(refresh_token: str) -> Dict[str, Any]:
+    """Rotate a refresh token: revoke it and issue a new pair with the same identity."""
+    claims = decode_token(refresh_token, expected_type="refresh")
+    revoke(claims["jti"], claims["exp"])
+    employee = {"id": claims["sub"], "employee_id": claims["eid"], "company_id": claims["cid"], "rol": claims["rol"]}
+    return issue_token_pair(employee)
+
+
+def revoke(jti: str, exp: float) -> None:
+    """Add a token id to the revocation list until the token would expire anyway."""
+    now = time.time()
+    # prune expired entries so the local map stays small
+    for key in [k for k, v in _revoked.items() if v <= now]:
+        _revoked.pop(key, None)
+    _revoked[jti] = float(exp)
+
+    if redis_configured():
+        ttl = max(int(exp - now), 1)
+        try:
+            get_redis().set(f"{REVOKED_KEY_PREFIX}{jti}", "1", ex=ttl)
+        except Exception:
+            logger.exception("Failed to store revoked token id in Redis")
+
+
+def is_revoked(jti: str) -> bool:
+    if jti in _revoked:
+        return True
+    if redis_configured():
+        try:
+            return bool(get_redis().exists(f"{REVOKED_KEY_PREFIX}{jti}"))
+        except Exception:
+            # fail open on Redis outages; tokens are short-lived
+            logger.exception("Failed to check token revocation in Redis")
+    return False
@@ -10,9 +10,36 @@ import redis
 
 REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
 
+_client: Optional[redis.Redis] = None
+_async_client = None
+
+
+def redis_configured() -> bool:
+    """True when REDIS_URL was set explicitly.
+
+    Hot-path helpers (token revocation, throttling, ...) only talk to Redis when
+    it was configured on purpose, so a missing local Redis never adds connect
+    timeouts to API requests.
+    """
+    return bool(os.environ.get("REDIS_URL"))
+
 
 def get_redis() -> redis.Redis:
-    return redis.from_url(REDIS_URL, decode_responses=True)
+    # Reuse one client (and its connection pool) per process
+    global _client
+    if _client is None:
+        _client = redis.from_url(REDIS_URL, decode_responses=True)
+    return _client
+
+
+def get_async_redis():
+    """redis.asyncio client for code running on the API event loop (one per process)."""
+    global _async_client
+    if _async_client is None:
+        import redis.asyncio as aioredis
+
+        _async_client = aioredis.from_url(REDIS_URL, decode_responses=True)
+    return _async_client
 
 
 def cache_get(key: str) -> Optional[Any]:
@@ -34,3 +61,11 @@ def cache_set(key: str, value: Any, expire_seconds: int = 3600) -> None:
         # fallback to string conversion
         payload = str(value)
     r.set(key, payload, ex=expire_seconds)
+
+
+def get_queue(name: str = "default"):
+    """Return an RQ queue. RQ stores pickled payloads, so it needs a
+    connection without decode_responses."""
+    from rq import Queue
+
+    return Queue(name, connection=redis.from_url(REDIS_URL))
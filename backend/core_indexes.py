@@ -0,0 +1,43 @@
+import logging
+
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+
+async def _create_unique_or_plain(coll, keys, name, **kwargs):
+    """Create a unique index; fall back to a plain one when existing data has duplicates."""
+    try:
+        await coll.create_index(keys, name=name, unique=True, **kwargs)
+    except OperationFailure as e:
+        logger.warning('Unique index %s on %s could not be created (%s); creating non-unique index', name, coll.name, e)
+        await coll.create_index(keys, name=f'{name}_nonunique', **kwargs)
+
+
+async def ensure_core_indexes(db):
+    """Ensure indexes used by hot lookups outside the POS module. Non-destructive.
+
+    Safe to call on startup next to ensure_pos_collections.
+    """
+    try:
+        # login / auth_login by (employee_id, company_id); the employee_id prefix
+        # also serves pin_login and check_user which look up by employee_id only
+        await _create_unique_or_plain(db.employees, [('employee_id', 1), ('company_id', 1)], 'employees_employee_company')
+        # login by email; documents without an email are left out of the index
+        await _create_unique_or_plain(
+            db.employees, [('email', 1)], 'employees_email',
+            partialFilterExpression={'email': {'$type': 'string'}},
+        )
+        await db.employees.create_index([('id', 1)], name='employees_id')
+        # latest count per product (stok_export) and per-product count history
+        await db.stok_sayim.create_index([('urun_id', 1), ('tarih', -1), ('id', -1)], name='stok_sayim_urun_tarih')
+        # stok imports upsert on (company_id, ad); one product per name and company
+        await _create_unique_or_plain(db.stok_urun, [('company_id', 1), ('ad', 1)], 'stok_urun_company_ad')
+        # low-stock set: /stok/low reads per company, crossings check by stok_urun id
+        await db.stok_low_stock.create_index([('company_id', 1)], name='stok_low_stock_company')
+        await db.stok_low_stock.create_index([('stok_urun_id', 1)], name='stok_low_stock_urun')
+        # background import status polling (/imports/{job_id})
+        await db.import_jobs.create_index([('id', 1)], name='import_jobs_id', unique=True)
+        logger.info('Core indexes ensured')
+    except Exception:
+        logger.exception('Failed to ensure core indexes')
@@ -0,0 +1,157 @@
+"""Optional in-memory directory of non-secret employee fields.
+
+Enabled with EMPLOYEE_DIRECTORY_CACHE=true. PIN-login terminals and user
+checks resolve employees from memory instead of querying Mongo. Password
+hashes are never cached; only a `has_password` flag is kept.
+
+The directory is loaded lazily, patched by employee writes in this process
+and fully reloaded every EMPLOYEE_DIRECTORY_TTL seconds. Employee writes in
+the API call `publish_change()` and bulk writers outside it (RQ jobs, the
+password migration) call `invalidate_everywhere()`; both bump a generation
+counter in Redis, and API workers compare it at most every
+EMPLOYEE_DIRECTORY_SYNC seconds and reload when it moved. Without Redis
+only the TTL brings other workers' writes in, so it defaults to 30 seconds
+instead of 300.
+"""
+import asyncio
+import os
+import time
+import logging
+from typing import Any, Dict, List, Optional
+
+try:
+    from .cache import get_redis, redis_configured  # type: ignore
+except Exception:
+    from cache import get_redis, redis_configured
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = "employee_directory:generation"
+PUBLIC_FIELDS = ("id", "employee_id", "company_id", "ad", "soyad", "rol", "email", "pozisyon")
+
+
+def directory_enabled() -> bool:
+    return os.environ.get("EMPLOYEE_DIRECTORY_CACHE", "false").lower() == "true"
+
+
+def _public_entry(doc: Dict[str, Any]) -> Dict[str, Any]:
+    entry = {k: doc.get(k) for k in PUBLIC_FIELDS}
+    entry["has_password"] = bool(doc.get("password"))
+    return entry
+
+
+class EmployeeDirectory:
+    def __init__(self, ttl_seconds: Optional[float] = None):
+        default_ttl = "300" if redis_configured() else "30"
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.environ.get("EMPLOYEE_DIRECTORY_TTL", default_ttl))
+        self._by_id: Dict[Any, Dict[str, Any]] = {}
+        self._by_employee_id: Dict[str, List[Dict[str, Any]]] = {}
+        self.sync_seconds = float(os.environ.get("EMPLOYEE_DIRECTORY_SYNC", "5"))
+        self._loaded_at: Optional[float] = None
+        self._generation: Optional[str] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _index(self, entry: Dict[str, Any]) -> None:
+        self._by_id[entry["id"]] = entry
+        self._by_employee_id.setdefault(str(entry.get("employee_id")), []).append(entry)
+
+    def _unindex(self, emp_id: Any) -> None:
+        old = self._by_id.pop(emp_id, None)
+        if old is None:
+            return
+        key = str(old.get("employee_id"))
+        remaining = [e for e in self._by_employee_id.get(key, []) if e["id"] != emp_id]
+        if remaining:
+            self._by_employee_id[key] = remaining
+        else:
+            self._by_employee_id.pop(key, None)
+
+    def _fresh(self) -> bool:
+        return self._loaded_at is not None and (time.monotonic() - self._loaded_at) < self.ttl_seconds
+
+    def _shared_generation(self) -> Optional[str]:
+        if not redis_configured():
+            return None
+        try:
+            return get_redis().get(GENERATION_KEY)
+        except Exception as e:
+            logger.warning("Employee directory generation check failed: %s", e)
+            return self._generation
+
+    def _invalidated_elsewhere(self) -> bool:
+        now = time.monotonic()
+        if now - self._checked_at < self.sync_seconds:
+            return False
+        self._checked_at = now
+        return self._shared_generation() != self._generation
+
+    async def ensure_loaded(self, db) -> None:
+        if self._fresh() and not self._invalidated_elsewhere():
+            return
+        seen = self._loaded_at
+        async with self._lock:
+            if self._loaded_at != seen:
+                return  # reloaded by another request while this one waited
+            # read the generation before the employees so a bump during the load triggers another reload
+            self._generation = self._shared_generation()
+            self._checked_at = time.monotonic()
+            # projection keeps password hashes out of memory; `password: 1` is only
+            # used to compute has_password and is dropped by _public_entry
+            docs = await db.employees.find({}, {"_id": 0, "password": 1, **{f: 1 for f in PUBLIC_FIELDS}}).to_list(None)
+            self._by_id = {}
+            self._by_employee_id = {}
+            for d in docs:
+                self._index(_public_entry(d))
+            self._loaded_at = time.monotonic()
+            logger.info("Employee directory loaded with %s entries", len(self._by_id))
+
+    def lookup(self, employee_id: str, company_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        candidates = self._by_employee_id.get(str(employee_id)) or []
+        if company_id is not None:
+            candidates = [e for e in candidates if e.get("company_id") == company_id]
+        return dict(candidates[0]) if candidates else None
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def upsert(self, doc: Dict[str, Any]) -> None:
+        """Refresh one employee after a write; ignored until the directory is loaded."""
+        if self._loaded_at is None or doc.get("id") is None:
+            return
+        self._unindex(doc["id"])
+        self._index(_public_entry(doc))
+
+    def remove(self, emp_id: Any) -> None:
+        self._unindex(emp_id)
+
+    def invalidate(self) -> None:
+        """Drop everything; the next lookup reloads from Mongo."""
+        self._by_id = {}
+        self._by_employee_id = {}
+        self._loaded_at = None
+
+    def publish_change(self) -> None:
+        """Tell the other workers an employee changed (after upsert/remove patched this copy)."""
+        if not redis_configured():
+            return
+        try:
+            generation = get_redis().incr(GENERATION_KEY)
+        except Exception as e:
+            logger.warning("Employee directory change not published: %s", e)
+            return
+        # this copy already has the change; skip our own bump unless someone else's came before it
+        if self._generation is not None and str(generation) == str(int(self._generation) + 1):
+            self._generation = str(generation)
+
+    def invalidate_everywhere(self) -> None:
+        """Drop this copy and make every worker reload within EMPLOYEE_DIRECTORY_SYNC seconds."""
+        self.invalidate()
+        if redis_configured():
+            try:
+                get_redis().incr(GENERATION_KEY)
+            except Exception as e:
+                logger.warning("Employee directory invalidation not published: %s", e)
+
+
+employee_directory = EmployeeDirectory()
@@ -0,0 +1,151 @@
+"""Order event hub for kitchen screens and table views.
+
+Order code publishes small events (order.created, order.paid, order.printed);
+screens hold one SSE or WebSocket connection and receive the events for their
+company instead of polling /pos/order/{id}.
+
+With REDIS_URL configured every event goes through the Redis channel
+"pos:events" and each API worker runs one listener that fans the channel out
+to its own subscribers, so an event published by any worker (or by the RQ
+print worker) reaches every screen. Without Redis, events are delivered to
+subscribers of the publishing process only.
+"""
+import asyncio
+import json
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Set
+
+try:
+    from .cache import REDIS_URL, redis_configured  # type: ignore
+except Exception:
+    from cache import REDIS_URL, redis_configured
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "pos:events"
+
+
+class Subscription:
+    """One connected screen. Slow consumers lose their oldest events, never block publishers.
+
+    A subscription belongs to exactly one company; events without a matching
+    company id (including events with none) are never delivered to it.
+    """
+
+    def __init__(self, company_id: int, types: Optional[Set[str]] = None, maxsize: int = 200):
+        if company_id is None:
+            raise ValueError("event subscriptions need a company_id")
+        self.company_id = company_id
+        self.types = types
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def wants(self, event: Dict[str, Any]) -> bool:
+        if event.get("company_id") != self.company_id:
+            return False
+        return self.types is None or event.get("type") in self.types
+
+    def offer(self, event: Dict[str, Any]) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+
+class EventHub:
+    def __init__(self, use_redis: Optional[bool] = None):
+        self.use_redis = redis_configured() if use_redis is None else use_redis
+        self._subscribers: Set[Subscription] = set()
+        self._listener: Optional[asyncio.Task] = None
+        self._redis = None
+        self.published = 0
+
+    def _client(self):
+        if self._redis is None:
+            import redis.asyncio as aioredis
+
+            self._redis = aioredis.from_url(REDIS_URL, decode_responses=True)
+        return self._redis
+
+    def _deliver(self, event: Dict[str, Any]) -> None:
+        for sub in list(self._subscribers):
+            if sub.wants(event):
+                sub.offer(event)
+
+    async def publish(self, event_type: str, company_id: Optional[int], **data: Any) -> Dict[str, Any]:
+        event = {
+            "id": uuid.uuid4().hex,
+            "type": event_type,
+            "company_id": company_id,
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "data": data,
+        }
+        self.published += 1
+        if self.use_redis:
+            try:
+                await self._client().publish(CHANNEL, json.dumps(event, default=str))
+                return event
+            except Exception:
+                logger.exception("Redis publish failed for %s; delivering locally", event_type)
+        self._deliver(event)
+        return event
+
+    def subscribe(self, company_id: int, types: Optional[Set[str]] = None) -> Subscription:
+        sub = Subscription(company_id, types)
+        self._subscribers.add(sub)
+        if self.use_redis and (self._listener is None or self._listener.done()):
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        self._subscribers.discard(sub)
+
+    async def _listen(self) -> None:
+        while self._subscribers:
+            try:
+                pubsub = self._client().pubsub()
+                await pubsub.subscribe(CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        self._deliver(json.loads(message["data"]))
+                    except Exception:
+                        logger.exception("Dropping malformed POS event")
+                    if not self._subscribers:
+                        break
+                await pubsub.unsubscribe(CHANNEL)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("POS event listener lost Redis; reconnecting")
+                await asyncio.sleep(1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "redis" if self.use_redis else "memory",
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "dropped": sum(s.dropped for s in self._subscribers),
+        }
+
+
+event_hub = EventHub()
+
+
+async def publish_order_event(event_type: str, order: Dict[str, Any]) -> None:
+    """Best-effort publish of an order event; never fails the caller."""
+    try:
+        await event_hub.publish(
+            event_type,
+            order.get("company_id"),
+            order_id=order.get("id"),
+            adisyon_no=order.get("adisyon_no"),
+            table=order.get("table"),
+            status=order.get("status"),
+            total=order.get("total"),
+        )
+    except Exception:
+        logger.exception("Failed to publish %s for order %s", event_type, order.get("id"))
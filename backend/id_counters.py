@@ -0,0 +1,25 @@
+"""Atomic numeric id allocation.
+
+Collections keyed by a numeric `id` take new ids from one `counters`
+document per collection instead of max(id)+1, which hands the same id to
+concurrent writers. A range is reserved with a single $inc; a missing
+counter is seeded from the collection's current max id with $max, so
+concurrent seeders can only agree. Ids of failed inserts are skipped, never
+reused.
+"""
+from pymongo import ReturnDocument
+
+COUNTERS = "counters"
+
+
+async def allocate_ids(db, collection_name: str, count: int = 1) -> int:
+    """Reserve `count` consecutive ids and return the first."""
+    for _ in range(2):
+        counter = await db[COUNTERS].find_one_and_update(
+            {"_id": collection_name}, {"$inc": {"seq": count}}, return_document=ReturnDocument.AFTER
+        )
+        if counter is not None:
+            return counter["seq"] - count + 1
+        last = await db[collection_name].find_one({}, sort=[("id", -1)], projection={"_id": 0, "id": 1})
+        await db[COUNTERS].update_one({"_id": collection_name}, {"$max": {"seq": int(last["id"]) if last and "id" in last else 0}}, upsert=True)
+    raise RuntimeError(f"id counter for {collection_name} could not be seeded")
@@ -0,0 +1,155 @@
+"""Idempotency-Key handling for non-repeatable POST endpoints.
+
+The first request with a key claims it by inserting a "pending" document into
+`idempotency_keys` (the key is the `_id`, so only one insert can win). When
+the handler finishes, its response is stored on that document and every retry
+with the same key gets the stored response back without running the handler
+again. Documents expire through a TTL index on `expires_at`.
+
+Concurrent duplicates wait for the first request instead of racing it: in the
+same process they await its future directly, and across workers they poll
+the claim document until it is completed. A claim whose handler raised is
+deleted, so the client's next retry runs normally; a claim left pending for
+longer than POS_IDEMPOTENCY_LOCK_SECONDS (a crashed worker) is taken over.
+A claim whose handler succeeded but whose response could not be stored is
+marked "unknown": retries get a 409 until it expires instead of running the
+handler a second time.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "idempotency_keys"
+
+# claim id -> (request fingerprint, future resolved with the response or None on failure)
+_inflight: Dict[str, Tuple[str, asyncio.Future]] = {}
+
+
+def _setting(name: str, default: str) -> float:
+    return float(os.environ.get(name, default))
+
+
+def fingerprint(body: Any) -> str:
+    return hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _check_same_request(stored: str, current: str) -> None:
+    if stored != current:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request body")
+
+
+async def _claim(db, claim_id: str, scope: str, fp: str) -> Optional[Dict[str, Any]]:
+    """Insert the pending claim; returns the existing document if another request holds the key."""
+    now = datetime.now(timezone.utc)
+    doc = {
+        "_id": claim_id,
+        "scope": scope,
+        "fingerprint": fp,
+        "status": "pending",
+        "created_at": now,
+        "expires_at": now + timedelta(seconds=_setting("POS_IDEMPOTENCY_TTL", "86400")),
+    }
+    try:
+        await db[COLLECTION].insert_one(doc)
+        return None
+    except DuplicateKeyError:
+        existing = await db[COLLECTION].find_one({"_id": claim_id})
+        # deleted between our insert and read: report it as free so the caller retries
+        return existing or {"status": "released"}
+
+
+async def _wait_for_other_worker(db, claim_id: str, fp: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """Poll a claim held elsewhere. Returns ("done", response) or ("retry", None)."""
+    deadline = asyncio.get_running_loop().time() + _setting("POS_IDEMPOTENCY_WAIT_SECONDS", "30")
+    lock_seconds = _setting("POS_IDEMPOTENCY_LOCK_SECONDS", "60")
+    delay = 0.05
+    while True:
+        doc = await db[COLLECTION].find_one({"_id": claim_id})
+        if doc is None:
+            return "retry", None
+        _check_same_request(doc.get("fingerprint"), fp)
+        if doc.get("status") == "done":
+            return "done", doc.get("response")
+        if doc.get("status") == "unknown":
+            raise HTTPException(
+                status_code=409,
+                detail="The request with this Idempotency-Key was processed but its response was lost; check its outcome before retrying",
+            )
+
+        created = doc.get("created_at")
+        if created is not None and created.tzinfo is None:
+            created = created.replace(tzinfo=timezone.utc)
+        if created is not None and datetime.now(timezone.utc) - created > timedelta(seconds=lock_seconds):
+            # the holder died mid-request; release its claim and try to take over
+            await db[COLLECTION].delete_one({"_id": claim_id, "status": "pending", "created_at": doc.get("created_at")})
+            logger.warning("Taking over abandoned idempotency claim %s", claim_id)
+            return "retry", None
+
+        if asyncio.get_running_loop().time() >= deadline:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still being processed")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+
+async def run_idempotent(
+    db,
+    scope: str,
+    key: str,
+    body: Any,
+    handler: Callable[[], Awaitable[Dict[str, Any]]],
+) -> Tuple[Dict[str, Any], bool]:
+    """Run `handler` at most once per (scope, key). Returns (response, replayed)."""
+    claim_id = f"{scope}:{key}"
+    fp = fingerprint(body)
+
+    for _ in range(3):
+        inflight = _inflight.get(claim_id)
+        if inflight is not None:
+            _check_same_request(inflight[0], fp)
+            response = await asyncio.shield(inflight[1])
+            if response is not None:
+                return response, True
+            continue
+
+        existing = await _claim(db, claim_id, scope, fp)
+        if existing is not None:
+            if existing.get("status") == "released":
+                continue
+            outcome, response = await _wait_for_other_worker(db, claim_id, fp)
+            if outcome == "done":
+                return response, True
+            continue
+
+        future = asyncio.get_running_loop().create_future()
+        _inflight[claim_id] = (fp, future)
+        try:
+            response = await handler()
+        except BaseException:
+            _inflight.pop(claim_id, None)
+            future.set_result(None)
+            await db[COLLECTION].delete_one({"_id": claim_id, "status": "pending"})
+            raise
+
+        try:
+            await db[COLLECTION].update_one({"_id": claim_id}, {"$set": {"status": "done", "response": response}})
+        except Exception:
+            # releasing the claim, or letting it be taken over, would run the handler twice
+            logger.exception("Failed to store idempotent response for %s", claim_id)
+            try:
+                await db[COLLECTION].update_one({"_id": claim_id, "status": "pending"}, {"$set": {"status": "unknown"}})
+            except Exception:
+                logger.exception("Failed to mark idempotency claim %s as unknown; it can be taken over once stale", claim_id)
+        future.set_result(response)
+        _inflight.pop(claim_id, None)
+        return response, False
+
+    raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still being processed")
@@ -0,0 +1,542 @@
+"""Optional reservation ledger for hot POS ingredients.
+
+With POS_INVENTORY_LEDGER_SKUS set (comma-separated stok_urun ids, or "*"
+for every ingredient), orders no longer `$inc` those `stok_urun` rows one by
+one. The ledger keeps the authoritative available quantity in Redis, shared
+by every worker, and every change is journaled in `pos_inventory_journal`
+before a counter moves:
+
+- reserve: the deduction is inserted as a "reserved" entry, then one Lua
+  call checks and decrements every counter and marks, in the same hash,
+  which (entry, ingredient) pairs it applied;
+- commit: once the order is stored the entry becomes "committed";
+- release: if the order failed, the counters get back exactly what the
+  marks say was taken and the entry is deleted.
+
+A reserved entry names the write that consumes it (`link`: the collection
+and field where that write stores the entry id, e.g. an order's
+`ledger_token`). Entries still reserved after
+POS_INVENTORY_RESERVATION_TIMEOUT seconds belong to a worker that died
+between its steps; the flusher reconciles them, committing those whose
+write exists and releasing the rest, so Redis and Mongo never drift apart.
+
+Every POS_INVENTORY_FLUSH_SECONDS the flusher claims committed entries, sums
+them per ingredient and applies them to `stok_urun` with one bulk_write.
+Each row's `$inc` adds the flush id to the row in the same update, and the
+ids are pulled only after the entries are marked flushed, so re-running a
+flush after a crash never applies it twice. Counters are rebuilt as `mevcut`
+plus the unflushed committed entries plus the reserved entries that were
+applied; a counter evicted from Redis is rebuilt the same way on the next
+reserve.
+
+Redis is used through redis.asyncio, so no ledger call blocks the event
+loop. Without REDIS_URL the ledger stays disabled and every ingredient takes
+the conditional `$inc` path: per-worker counters would each sell the full
+stock. The in-memory mode (use_redis=False) is for a single process only.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+try:
+    from .cache import get_async_redis, redis_configured  # type: ignore
+except Exception:
+    from cache import get_async_redis, redis_configured
+
+logger = logging.getLogger(__name__)
+
+JOURNAL = "pos_inventory_journal"
+FLUSH_TAG_FIELD = "_ledger_flushes"
+# ids of entries whose stok_urun write happened, kept until the entry is flushed
+REF_FIELD = "_ledger_refs"
+# link for entries consumed by a write to the stok_urun row itself (a transfer)
+STOCK_LINK = {"coll": "stok_urun", "field": REF_FIELD}
+REDIS_KEY = "inventory_ledger:available"
+RESERVED = "reserved"
+COMMITTED = "committed"
+
+MISSING = "?"
+
+# ARGV: check flag, then (entry id, stok_urun id, delta) triples. Applies every
+# delta whose mark is not set yet and sets the mark; with the check flag it
+# applies nothing and returns the shortfall list if a counter would go
+# negative (a counter seeded with this entry already marked is checked as it
+# stands). Returns MISSING followed by the counters that are gone (evicted hash).
+_APPLY_LUA = """
+local missing = {'?'}
+for i = 2, #ARGV, 3 do
+  if redis.call('HEXISTS', KEYS[1], ARGV[i + 1]) == 0 then
+    table.insert(missing, ARGV[i + 1])
+  end
+end
+if #missing > 1 then return missing end
+local short = {}
+if ARGV[1] == '1' then
+  local need = {}
+  local sids = {}
+  for i = 2, #ARGV, 3 do
+    local sid = ARGV[i + 1]
+    if need[sid] == nil then
+      need[sid] = 0
+      table.insert(sids, sid)
+    end
+    if redis.call('HEXISTS', KEYS[1], 't:' .. ARGV[i] .. ':' .. sid) == 0 then
+      need[sid] = need[sid] - tonumber(ARGV[i + 2])
+    end
+  end
+  for _, sid in ipairs(sids) do
+    local have = tonumber(redis.call('HGET', KEYS[1], sid))
+    if have < math.max(need[sid], 0) then
+      table.insert(short, sid)
+      table.insert(short, tostring(have))
+    end
+  end
+  if #short > 0 then return short end
+end
+for i = 2, #ARGV, 3 do
+  if redis.call('HSETNX', KEYS[1], 't:' .. ARGV[i] .. ':' .. ARGV[i + 1], '1') == 1 then
+    redis.call('HINCRBYFLOAT', KEYS[1], ARGV[i + 1], ARGV[i + 2])
+  end
+end
+return short
+"""
+
+# undo the deltas whose mark is still set; a counter that is gone is skipped,
+# its rebuild from Mongo already excludes the released entry
+_RELEASE_LUA = """
+for i = 1, #ARGV, 3 do
+  if redis.call('HDEL', KEYS[1], 't:' .. ARGV[i] .. ':' .. ARGV[i + 1]) == 1
+     and redis.call('HEXISTS', KEYS[1], ARGV[i + 1]) == 1 then
+    redis.call('HINCRBYFLOAT', KEYS[1], ARGV[i + 1], -tonumber(ARGV[i + 2]))
+  end
+end
+return 0
+"""
+
+# ARGV: (stok_urun id, quantity, comma-separated applied entry ids) triples.
+# Another worker may already own a live counter; only a counter created here
+# takes the marks of the reserved entries its quantity includes.
+_SEED_LUA = """
+for i = 1, #ARGV, 3 do
+  if redis.call('HSETNX', KEYS[1], ARGV[i], ARGV[i + 1]) == 1 then
+    for token in string.gmatch(ARGV[i + 2], '[^,]+') do
+      redis.call('HSET', KEYS[1], 't:' .. token .. ':' .. ARGV[i], '1')
+    end
+  end
+end
+return 0
+"""
+
+
+def _hot_skus() -> Optional[set]:
+    raw = os.environ.get("POS_INVENTORY_LEDGER_SKUS", "").strip()
+    if not raw:
+        return set()
+    if raw == "*":
+        return None
+    return {int(x) for x in raw.split(",") if x.strip()}
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+def _mark(token: str, sid: int) -> str:
+    return f"t:{token}:{sid}"
+
+
+def _triples(entries: Iterable[Dict[str, Any]]) -> List[Tuple[str, int, float]]:
+    return [(e["_id"], int(sid), float(delta)) for e in entries for sid, delta in e["deltas"]]
+
+
+class InventoryLedger:
+    def __init__(
+        self,
+        hot_skus: Optional[Iterable[int]] = (),
+        use_redis: Optional[bool] = None,
+        flush_seconds: Optional[float] = None,
+        reservation_timeout: Optional[float] = None,
+    ):
+        # None means every ingredient is hot; an empty set disables the ledger
+        self.hot_skus = None if hot_skus is None else set(hot_skus)
+        self.use_redis = redis_configured() if use_redis is None else use_redis
+        self.flush_seconds = flush_seconds if flush_seconds is not None else float(os.environ.get("POS_INVENTORY_FLUSH_SECONDS", "2"))
+        self.reservation_timeout = (
+            reservation_timeout if reservation_timeout is not None
+            else float(os.environ.get("POS_INVENTORY_RESERVATION_TIMEOUT", "300"))
+        )
+        self._available: Dict[int, float] = {}
+        self._marks: set = set()
+        self._loaded: set = set()
+        self._lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self._scripts: Dict[str, Any] = {}
+
+    @classmethod
+    def from_env(cls) -> "InventoryLedger":
+        hot = _hot_skus()
+        if (hot is None or hot) and not redis_configured():
+            logger.warning("POS_INVENTORY_LEDGER_SKUS is set but REDIS_URL is not; the inventory ledger stays disabled")
+            hot = set()
+        return cls(hot_skus=hot)
+
+    @property
+    def enabled(self) -> bool:
+        return self.hot_skus is None or bool(self.hot_skus)
+
+    def manages(self, sid: int) -> bool:
+        return self.hot_skus is None or sid in self.hot_skus
+
+    def split(self, requirements: Dict[int, float]) -> Tuple[Dict[int, float], Dict[int, float]]:
+        """Split ingredient requirements into (ledger-managed, regular)."""
+        hot, cold = {}, {}
+        for sid, need in requirements.items():
+            (hot if self.manages(sid) else cold)[sid] = need
+        return hot, cold
+
+    # --- counters (Redis or this process) ---
+
+    def _script(self, name: str, source: str):
+        if name not in self._scripts:
+            self._scripts[name] = get_async_redis().register_script(source)
+        return self._scripts[name]
+
+    async def _seed(self, base: Dict[int, Tuple[float, List[str]]]) -> None:
+        if self.use_redis:
+            args: List[Any] = []
+            for sid, (qty, applied) in base.items():
+                args += [sid, qty, ",".join(applied)]
+            await self._script("seed", _SEED_LUA)(keys=[REDIS_KEY], args=args)
+            return
+        for sid, (qty, applied) in base.items():
+            if sid not in self._available:
+                self._available[sid] = qty
+                self._marks.update((token, sid) for token in applied)
+
+    async def _apply(self, triples: List[Tuple[str, int, float]], check: bool) -> List[Any]:
+        """Apply unmarked deltas; returns [] or the shortfall list or MISSING + gone counters."""
+        if self.use_redis:
+            args: List[Any] = ["1" if check else "0"]
+            for token, sid, delta in triples:
+                args += [token, sid, delta]
+            return [_text(v) for v in await self._script("apply", _APPLY_LUA)(keys=[REDIS_KEY], args=args)]
+        # no await between check and update: atomic within the event loop
+        todo = [(t, sid, d) for t, sid, d in triples if (t, sid) not in self._marks]
+        if check:
+            need: Dict[int, float] = {sid: 0.0 for _, sid, _ in triples}
+            for _, sid, delta in todo:
+                need[sid] -= delta
+            short = []
+            for sid, n in need.items():
+                if self._available.get(sid, 0.0) < max(n, 0.0):
+                    short += [str(sid), str(self._available.get(sid, 0.0))]
+            if short:
+                return short
+        for token, sid, delta in todo:
+            self._marks.add((token, sid))
+            self._available[sid] = self._available.get(sid, 0.0) + delta
+        return []
+
+    async def _unapply(self, triples: List[Tuple[str, int, float]]) -> None:
+        if not triples:
+            return
+        if self.use_redis:
+            args: List[Any] = []
+            for token, sid, delta in triples:
+                args += [token, sid, delta]
+            await self._script("release", _RELEASE_LUA)(keys=[REDIS_KEY], args=args)
+            return
+        for token, sid, delta in triples:
+            if (token, sid) in self._marks:
+                self._marks.discard((token, sid))
+                self._available[sid] = self._available.get(sid, 0.0) - delta
+
+    async def _forget_marks(self, triples: List[Tuple[str, int, float]]) -> None:
+        """Drop the marks of committed entries; the journal accounts for them from now on."""
+        if not triples:
+            return
+        if self.use_redis:
+            try:
+                await get_async_redis().hdel(REDIS_KEY, *[_mark(token, sid) for token, sid, _ in triples])
+            except Exception:
+                logger.exception("Failed to drop inventory ledger marks")
+            return
+        self._marks.difference_update((token, sid) for token, sid, _ in triples)
+
+    async def _base_quantities(self, db, sids: List[int], pending_ids: Iterable[str] = ()) -> Dict[int, Tuple[float, List[str]]]:
+        """`mevcut` plus unflushed committed entries plus applied reservations, with those reservations' ids.
+
+        `pending_ids` are the caller's own entries, journaled but not applied yet.
+        """
+        skip = set(pending_ids)
+        # read the journal before stok_urun: an entry flushed in between is
+        # then counted twice (conservative) instead of not at all
+        pending: Dict[int, float] = {sid: 0.0 for sid in sids}
+        applied: Dict[int, List[str]] = {sid: [] for sid in sids}
+        # entries journaled before `sids` existed are few and flushed within seconds
+        query = {"flushed": False, "$or": [{"sids": {"$in": sids}}, {"sids": {"$exists": False}}]}
+        async for entry in db[JOURNAL].find(query, {"deltas": 1, "state": 1, "apply_on": 1}):
+            reserved = entry.get("state") == RESERVED
+            if reserved and (entry.get("apply_on") == "commit" or entry["_id"] in skip):
+                continue  # a staged credit reaches the counter only when committed
+            for sid, delta in entry.get("deltas", []):
+                if sid in pending:
+                    pending[sid] += delta
+                    if reserved:
+                        applied[sid].append(entry["_id"])
+        docs = await db.stok_urun.find({"id": {"$in": sids}}, {"_id": 0, "id": 1, "mevcut": 1}).to_list(None)
+        mevcut = {d["id"]: float(d.get("mevcut", 0)) for d in docs}
+        return {sid: (mevcut.get(sid, 0.0) + pending[sid], applied[sid]) for sid in sids}
+
+    async def _ensure_loaded(self, db, sids: Iterable[int], pending_ids: Iterable[str] = ()) -> None:
+        missing = [sid for sid in dict.fromkeys(sids) if sid not in self._loaded]
+        if not missing:
+            return
+        async with self._lock:
+            missing = [sid for sid in missing if sid not in self._loaded]
+            if not missing:
+                return
+            await self._seed(await self._base_quantities(db, missing, pending_ids))
+            self._loaded.update(missing)
+        self._start_flusher(db)
+
+    async def _apply_loaded(self, db, triples: List[Tuple[str, int, float]], check: bool) -> List[Any]:
+        tokens = {token for token, _, _ in triples}
+        await self._ensure_loaded(db, [sid for _, sid, _ in triples], tokens)
+        result = await self._apply(triples, check)
+        if result and result[0] == MISSING:
+            gone = [int(sid) for sid in result[1:]]
+            logger.warning("Inventory ledger counters missing from Redis, re-seeding: %s", gone)
+            self._loaded.difference_update(gone)
+            await self._ensure_loaded(db, gone, tokens)
+            result = await self._apply(triples, check)
+            if result and result[0] == MISSING:
+                raise RuntimeError(f"inventory ledger counters {result[1:]} vanished while re-seeding")
+        return result
+
+    # --- journal entries ---
+
+    @staticmethod
+    def _entry(deltas: Dict[int, float], link: Optional[Dict[str, Any]], apply_on: str) -> Dict[str, Any]:
+        return {
+            "_id": uuid.uuid4().hex,
+            "state": RESERVED,
+            "apply_on": apply_on,
+            "deltas": [[sid, delta] for sid, delta in deltas.items()],
+            "sids": sorted(deltas),
+            "link": link,
+            "order_id": None,
+            "flush_id": None,
+            "flushed": False,
+            "created_at": datetime.now(timezone.utc),
+        }
+
+    async def reserve(self, db, requirements: Dict[int, float],
+                      link: Optional[Dict[str, Any]] = None) -> Tuple[Optional[str], List[Dict]]:
+        """Atomically take every requirement or none. Returns (token, insufficient).
+
+        `link` is {"coll": ..., "field": ...}: the write that makes the
+        reservation final stores the token in that field (checked if its
+        worker dies before committing). With STOCK_LINK the write `$addToSet`s
+        the token into REF_FIELD of the stok_urun row.
+        """
+        if not requirements:
+            return None, []
+        entry = self._entry({sid: -need for sid, need in requirements.items()}, link, "reserve")
+        insufficient = await self._reserve(db, [entry], requirements)
+        return (None if insufficient else entry["_id"]), insufficient
+
+    async def reserve_many(self, db, parts: List[Tuple[Dict[int, float], Optional[Dict[str, Any]]]]) -> Tuple[List[Optional[str]], List[Dict]]:
+        """Reserve several (requirements, link) parts all-or-nothing: one journal insert, one counter update."""
+        entries = [self._entry({sid: -need for sid, need in reqs.items()}, link, "reserve") if reqs else None for reqs, link in parts]
+        needed: Dict[int, float] = {}
+        for reqs, _ in parts:
+            for sid, need in reqs.items():
+                needed[sid] = needed.get(sid, 0.0) + need
+        insufficient = await self._reserve(db, [e for e in entries if e is not None], needed)
+        if insufficient:
+            return [None] * len(parts), insufficient
+        return [e["_id"] if e else None for e in entries], []
+
+    async def _reserve(self, db, entries: List[Dict[str, Any]], needed: Dict[int, float]) -> List[Dict]:
+        if not entries:
+            return []
+        # journaled before any counter moves, so a crash after this point is reconciled
+        await db[JOURNAL].insert_many([dict(e) for e in entries], ordered=True)
+        try:
+            short = await self._apply_loaded(db, _triples(entries), check=True)
+        except Exception:
+            await self._release_entries(db, entries)
+            raise
+        if not short:
+            return []
+        await self._release_entries(db, entries)
+        return [
+            {"stok_urun_id": int(short[i]), "needed": needed[int(short[i])], "available": float(short[i + 1])}
+            for i in range(0, len(short), 2)
+        ]
+
+    async def stage_credit(self, db, sid: int, quantity: float) -> str:
+        """Journal a credit to one ingredient's unassigned pool and return its token.
+
+        The stok_urun write that frees the stock must `$addToSet` the token
+        into REF_FIELD: that is how a reconcile tells whether it happened.
+        The counter takes the credit in commit_credit.
+        """
+        entry = self._entry({sid: quantity}, STOCK_LINK, "commit")
+        await db[JOURNAL].insert_one(dict(entry))
+        return entry["_id"]
+
+    async def _release_entries(self, db, entries: List[Dict[str, Any]]) -> None:
+        await self._unapply(_triples(entries))
+        await db[JOURNAL].delete_many({"_id": {"$in": [e["_id"] for e in entries]}, "state": RESERVED})
+
+    async def _commit_entries(self, db, entries: List[Dict[str, Any]], order_id=None) -> None:
+        deferred = [e for e in entries if e.get("apply_on") == "commit"]
+        if deferred:
+            await self._apply_loaded(db, _triples(deferred), check=False)
+        update: Dict[str, Any] = {"state": COMMITTED}
+        if order_id is not None:
+            update["order_id"] = order_id
+        ids = [e["_id"] for e in entries]
+        res = await db[JOURNAL].update_many({"_id": {"$in": ids}, "state": RESERVED}, {"$set": update})
+        if res.matched_count < len(ids):
+            # reconciled away before this worker committed (it outlived the reservation timeout)
+            logger.error("Inventory ledger entries %s were released before their commit", ids)
+        await self._forget_marks(_triples(entries))
+
+    async def release(self, db, token: Optional[str], requirements: Dict[int, float]) -> None:
+        """Give a reservation back (the order failed)."""
+        await self.release_many(db, [(token, requirements)])
+
+    async def release_many(self, db, parts: List[Tuple[Optional[str], Dict[int, float]]]) -> None:
+        entries = [{"_id": t, "deltas": [[sid, -need] for sid, need in reqs.items()]} for t, reqs in parts if t]
+        if entries:
+            await self._release_entries(db, entries)
+
+    async def commit(self, db, token: Optional[str], requirements: Dict[int, float], order_id=None) -> None:
+        """Make a reservation final; applied to stok_urun by the next flush."""
+        if token is None:
+            return
+        await self._commit_entries(db, [{"_id": token, "deltas": [[sid, -need] for sid, need in requirements.items()]}], order_id)
+
+    async def commit_many(self, db, parts: List[Tuple[Optional[str], Dict[int, float]]]) -> None:
+        entries = [{"_id": t, "deltas": [[sid, -need] for sid, need in reqs.items()]} for t, reqs in parts if t]
+        if entries:
+            await self._commit_entries(db, entries)
+
+    async def commit_credit(self, db, token: str, sid: int, quantity: float) -> None:
+        """Make a staged credit final: the counter takes it now, `mevcut` on the next flush."""
+        await self._commit_entries(db, [{"_id": token, "apply_on": "commit", "deltas": [[sid, quantity]]}])
+
+    async def discard_credit(self, db, token: str) -> None:
+        """Drop a staged credit whose stok_urun write did not happen."""
+        await db[JOURNAL].delete_many({"_id": token, "state": RESERVED})
+
+    async def reconcile(self, db) -> Dict[str, int]:
+        """Settle reservations left behind by a worker that died between reserve and commit/release."""
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.reservation_timeout)
+        stale = await db[JOURNAL].find({"state": RESERVED, "created_at": {"$lt": cutoff}}).to_list(None)
+        stats = {"committed": 0, "released": 0}
+        for entry in stale:
+            link = entry.get("link")
+            done = bool(link) and await db[link["coll"]].find_one({link["field"]: entry["_id"]}, {"_id": 1}) is not None
+            if done:
+                await self._commit_entries(db, [entry])
+                stats["committed"] += 1
+            else:
+                await self._release_entries(db, [entry])
+                stats["released"] += 1
+        if stale:
+            logger.warning("Reconciled abandoned inventory reservations: %s", stats)
+        return stats
+
+    async def available(self, sid: int) -> Optional[float]:
+        return (await self.available_many([sid])).get(sid)
+
+    async def available_many(self, sids: Iterable[int]) -> Dict[int, float]:
+        """Live counters for the ingredients this worker has loaded (others are left out)."""
+        sids = [sid for sid in dict.fromkeys(sids) if sid in self._loaded]
+        if not sids:
+            return {}
+        if self.use_redis:
+            values = await get_async_redis().hmget(REDIS_KEY, sids)
+            return {sid: float(v) for sid, v in zip(sids, values) if v is not None}
+        return {sid: self._available[sid] for sid in sids if sid in self._available}
+
+    # --- write-back to stok_urun ---
+
+    async def _apply_flush(self, db, flush_id: str) -> int:
+        totals: Dict[int, float] = {}
+        ids: List[str] = []
+        async for entry in db[JOURNAL].find({"flush_id": flush_id, "flushed": False}, {"deltas": 1}):
+            ids.append(entry["_id"])
+            for sid, delta in entry.get("deltas", []):
+                totals[sid] = totals.get(sid, 0.0) + delta
+        if totals:
+            # the tag is set by the same update as the $inc: a row either has both or neither
+            ops = [
+                UpdateOne({"id": sid, FLUSH_TAG_FIELD: {"$ne": flush_id}}, {"$inc": {"mevcut": delta}, "$addToSet": {FLUSH_TAG_FIELD: flush_id}})
+                for sid, delta in totals.items()
+            ]
+            await db.stok_urun.bulk_write(ops, ordered=False)
+        await db[JOURNAL].update_many({"flush_id": flush_id}, {"$set": {"flushed": True}})
+        if totals:
+            # entries are flushed now, nothing can re-apply this id; a crash right here only leaves the tags behind
+            await db.stok_urun.update_many(
+                {"id": {"$in": list(totals)}},
+                {"$pull": {FLUSH_TAG_FIELD: flush_id, REF_FIELD: {"$in": ids}}},
+            )
+        return len(ids)
+
+    async def flush(self, db) -> int:
+        """Apply committed entries to stok_urun. Returns the number of entries flushed."""
+        flushed = 0
+        # claims left behind by a flusher that died mid-way
+        stale_before = datetime.now(timezone.utc) - timedelta(seconds=max(30.0, self.flush_seconds * 10))
+        stale = await db[JOURNAL].find(
+            {"flushed": False, "flush_id": {"$ne": None}, "claimed_at": {"$lt": stale_before}},
+            {"_id": 0, "flush_id": 1},
+        ).to_list(None)
+        for flush_id in {e["flush_id"] for e in stale}:
+            logger.warning("Re-applying abandoned inventory flush %s", flush_id)
+            flushed += await self._apply_flush(db, flush_id)
+
+        flush_id = uuid.uuid4().hex
+        # entries written before reservations existed have no state and are committed
+        claimed = await db[JOURNAL].update_many(
+            {"flushed": False, "flush_id": None, "state": {"$ne": RESERVED}},
+            {"$set": {"flush_id": flush_id, "claimed_at": datetime.now(timezone.utc)}},
+        )
+        if claimed.modified_count:
+            flushed += await self._apply_flush(db, flush_id)
+        return flushed
+
+    def _start_flusher(self, db) -> None:
+        if self._flusher is not None and not self._flusher.done():
+            return
+        self._flusher = asyncio.get_running_loop().create_task(self._flush_loop(db))
+
+    async def _flush_loop(self, db) -> None:
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.reconcile(db)
+                await self.flush(db)
+            except Exception:
+                logger.exception("Inventory ledger flush failed")
+
+    async def close(self, db) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        if self.enabled:
+            await self.flush(db)
+
+
+inventory_ledger = InventoryLedger.from_env()
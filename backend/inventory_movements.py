@@ -0,0 +1,343 @@
+"""Append-only inventory movement ledger.
+
+Every stock change appends one `pos_inventory_movements` document: order
+deductions ("sale"), compensations ("rollback"), moves between inventory
+locations ("transfer"), stock counts ("count") and XLSX imports ("import").
+Counts and imports carry the quantity that was observed (`count`), which
+wins when folding but never changes `stok_urun.mevcut`; the others carry a
+signed `delta`. `refType` names the
+kind of record `refId` points at: "order" (orders.id), "deduction" (the
+token of a deduction that was compensated), "transfer", "count"
+(stok_sayim.id) or "import" (file name). A movement's content is never
+changed after insert; compaction only flips its claim flags.
+
+Request handlers never wait on these writes. `movement_log.record(...)`
+appends to an in-process buffer and a background task writes it with one
+insert_many per POS_MOVEMENT_BATCH documents, at least every
+POS_MOVEMENT_FLUSH_SECONDS. Documents get their ObjectId when recorded, so a
+retried batch never stores a movement twice.
+
+`compact_movements` folds movements, oldest first, into one
+`pos_stock_levels` snapshot per (stok_urun, location); balances live only
+there. History is an indexed range read. Current stock is the snapshot plus
+the few movements not folded yet; stock at an earlier time is the
+snapshot's opening quantity folded with every movement up to that time, so
+the answer does not depend on when compaction ran. A snapshot that does
+not exist yet is opened from the current `stok_urun.mevcut`; the first
+count re-anchors it exactly.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+try:
+    from .inventory_ledger import JOURNAL, RESERVED  # type: ignore
+except Exception:
+    from inventory_ledger import JOURNAL, RESERVED
+
+logger = logging.getLogger(__name__)
+
+MOVEMENTS = os.environ.get("POS_INVENTORY_MOVEMENTS_COLL", "pos_inventory_movements")
+LEVELS = os.environ.get("POS_STOCK_LEVELS_COLL", "pos_stock_levels")
+COMPACTION_TAG_FIELD = "_compactions"
+COMPACTION_TAG_KEEP = 20
+DUPLICATE_KEY = 11000
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class MovementLog:
+    """Buffers movement documents and writes them in batches off the request path."""
+
+    def __init__(self, batch_size: Optional[int] = None, flush_seconds: Optional[float] = None, max_buffer: int = 50000):
+        self.batch_size = batch_size or int(os.environ.get("POS_MOVEMENT_BATCH", "500"))
+        self.flush_seconds = flush_seconds if flush_seconds is not None else float(os.environ.get("POS_MOVEMENT_FLUSH_SECONDS", "1"))
+        self.max_buffer = max_buffer
+        self._buffer: deque = deque()
+        self._writer: Optional[asyncio.Task] = None
+        self._loop = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.written = 0
+        self.dropped = 0
+
+    def record(
+        self,
+        db,
+        stok_urun_id: int,
+        reason: str,
+        delta: Optional[float] = None,
+        count: Optional[float] = None,
+        company_id: Optional[int] = None,
+        location_id: Optional[int] = None,
+        ref_type: Optional[str] = None,
+        ref_id: Any = None,
+        at: Optional[datetime] = None,
+    ) -> None:
+        """Queue one movement; returns immediately."""
+        self._append({
+            "_id": ObjectId(),
+            "productVariantId": stok_urun_id,
+            "locationId": location_id,
+            "companyId": company_id,
+            "reason": reason,
+            "delta": delta,
+            "count": count,
+            "refType": ref_type,
+            "refId": ref_id,
+            "createdAt": at or _now(),
+            "compactionId": None,
+            "compacted": False,
+        })
+        self._wake(db)
+
+    def record_many(self, db, deltas: Dict[int, float], reason: str, **kwargs: Any) -> None:
+        """Queue one movement per ingredient with a shared reason and reference."""
+        at = kwargs.pop("at", None) or _now()
+        for sid, delta in deltas.items():
+            if delta:
+                self.record(db, sid, reason, delta=delta, at=at, **kwargs)
+
+    def _append(self, doc: Dict[str, Any]) -> None:
+        if len(self._buffer) >= self.max_buffer:
+            # Mongo has been unreachable for a long time; keep the newest history
+            self._buffer.popleft()
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning("Inventory movement buffer full; %s movements dropped", self.dropped)
+        self._buffer.append(doc)
+
+    def _wake(self, db) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no loop (sync caller): the next flush or close writes it
+        if self._writer is None or self._writer.done() or self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._writer = loop.create_task(self._write_loop(db))
+        elif len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _write_loop(self, db) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush(db)
+            except Exception:
+                logger.exception("Inventory movement write failed")
+
+    async def flush(self, db) -> int:
+        """Write everything buffered. Returns the number of movements stored."""
+        stored = 0
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            try:
+                await db[MOVEMENTS].insert_many(batch, ordered=False)
+                stored += len(batch)
+            except BulkWriteError as bwe:
+                # a duplicate _id means an earlier attempt already stored that movement
+                failed = {e["index"] for e in bwe.details.get("writeErrors", []) if e.get("code") != DUPLICATE_KEY}
+                stored += len(batch) - len(failed)
+                if failed:
+                    self._buffer.extendleft(reversed([d for i, d in enumerate(batch) if i in failed]))
+                    logger.warning("%s inventory movements not stored; retrying later", len(failed))
+                    break
+            except Exception:
+                self._buffer.extendleft(reversed(batch))
+                logger.exception("Failed to store %s inventory movements; retrying later", len(batch))
+                break
+        self.written += stored
+        return stored
+
+    async def close(self, db) -> None:
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+        await self.flush(db)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"buffered": len(self._buffer), "written": self.written, "dropped": self.dropped}
+
+
+movement_log = MovementLog()
+
+
+def _fold(quantity: float, movements: Iterable[Dict[str, Any]]) -> Tuple[float, int]:
+    """Apply movements in order. Returns (quantity, movements applied)."""
+    applied = 0
+    for m in movements:
+        if m.get("count") is not None:
+            quantity = float(m["count"])
+        else:
+            quantity += float(m.get("delta") or 0)
+        applied += 1
+    return quantity, applied
+
+
+async def _current_quantity(db, sid: int, location_id: Optional[int] = None) -> float:
+    """A location's pool, or `mevcut` plus committed inventory-ledger entries not yet written back to it.
+
+    Reserved entries are left out: their order has not stored its sale movement yet.
+    """
+    doc = await db.stok_urun.find_one({"id": sid}, {"_id": 0, "mevcut": 1, "locations": 1})
+    if location_id is not None:
+        return float(((doc or {}).get("locations") or {}).get(str(location_id)) or 0)
+    quantity = float((doc or {}).get("mevcut") or 0)
+    # entries journaled before `sids` existed are few and flushed within seconds
+    query = {"flushed": False, "state": {"$ne": RESERVED}, "$or": [{"sids": sid}, {"sids": {"$exists": False}}]}
+    async for entry in db[JOURNAL].find(query, {"_id": 0, "deltas": 1}):
+        for entry_sid, delta in entry.get("deltas", []):
+            if entry_sid == sid:
+                quantity += delta
+    return quantity
+
+
+async def _opening_quantity(db, sid: int, location_id: Optional[int]) -> float:
+    """Quantity before every unfolded movement, for a snapshot created now.
+
+    Movements still buffered in an API worker have changed `mevcut` but are
+    not subtracted here, so the opening is off by them. compact_movements
+    writes this process's buffer first; other workers' buffers are flushed
+    within POS_MOVEMENT_FLUSH_SECONDS, and the first count re-anchors the
+    snapshot exactly.
+    """
+    pending = 0.0
+    async for m in db[MOVEMENTS].find({"productVariantId": sid, "locationId": location_id, "compacted": False}, {"delta": 1}):
+        pending += float(m.get("delta") or 0)
+    return await _current_quantity(db, sid, location_id) - pending
+
+
+async def _apply_compaction(db, compaction_id: str) -> int:
+    moves = await db[MOVEMENTS].find(
+        {"compactionId": compaction_id, "compacted": False}
+    ).sort([("createdAt", 1), ("_id", 1)]).to_list(None)
+    groups: Dict[Tuple[int, Optional[int]], List[Dict[str, Any]]] = {}
+    for m in moves:
+        groups.setdefault((m["productVariantId"], m.get("locationId")), []).append(m)
+    if not groups:
+        return 0
+
+    snapshots = {
+        (s["productVariantId"], s.get("locationId")): s
+        async for s in db[LEVELS].find({"productVariantId": {"$in": list({sid for sid, _ in groups})}})
+    }
+    level_ops = []
+    for (sid, location_id), group in groups.items():
+        snapshot = snapshots.get((sid, location_id))
+        if snapshot and compaction_id in snapshot.get(COMPACTION_TAG_FIELD, []):
+            continue  # applied before a crash
+        opening = float(snapshot["quantity"]) if snapshot else await _opening_quantity(db, sid, location_id)
+        quantity, _ = _fold(opening, group)
+        update: Dict[str, Any] = {
+            "$set": {"quantity": quantity, "lastMovementId": group[-1]["_id"], "updatedAt": _now()},
+            # a movement stored late can be folded after newer ones
+            "$max": {"asOf": group[-1]["createdAt"]},
+            "$push": {COMPACTION_TAG_FIELD: {"$each": [compaction_id], "$slice": -COMPACTION_TAG_KEEP}},
+        }
+        if not snapshot:
+            update["$setOnInsert"] = {"companyId": group[0].get("companyId"), "opening": opening, "openedAt": group[0]["createdAt"]}
+        level_ops.append(UpdateOne({"productVariantId": sid, "locationId": location_id}, update, upsert=True))
+
+    if level_ops:
+        await db[LEVELS].bulk_write(level_ops, ordered=False)
+    await db[MOVEMENTS].update_many({"compactionId": compaction_id}, {"$set": {"compacted": True}})
+    return len(moves)
+
+
+async def compact_movements(db, limit: int = 5000, stale_seconds: float = 300) -> Dict[str, int]:
+    """Fold up to `limit` unfolded movements into `pos_stock_levels`.
+
+    Run one compactor at a time (the RQ job or the endpoint); batches claimed
+    by a compactor that died are re-applied once they are `stale_seconds` old.
+    """
+    # movements buffered here already changed `mevcut`; store them before openings are read from it
+    await movement_log.flush(db)
+    folded = 0
+    stale_before = _now() - timedelta(seconds=stale_seconds)
+    stale = await db[MOVEMENTS].find(
+        {"compacted": False, "compactionId": {"$ne": None}, "claimedAt": {"$lt": stale_before}},
+        {"_id": 0, "compactionId": 1},
+    ).to_list(None)
+    for compaction_id in {m["compactionId"] for m in stale}:
+        logger.warning("Re-applying abandoned movement compaction %s", compaction_id)
+        folded += await _apply_compaction(db, compaction_id)
+
+    ids = [m["_id"] for m in await db[MOVEMENTS].find(
+        {"compacted": False, "compactionId": None}, {"_id": 1}
+    ).sort("createdAt", 1).limit(limit).to_list(None)]
+    if ids:
+        compaction_id = uuid.uuid4().hex
+        await db[MOVEMENTS].update_many(
+            {"_id": {"$in": ids}, "compactionId": None},
+            {"$set": {"compactionId": compaction_id, "claimedAt": _now()}},
+        )
+        folded += await _apply_compaction(db, compaction_id)
+    remaining = await db[MOVEMENTS].count_documents({"compacted": False})
+    logger.info("Compacted %s inventory movements (%s still pending)", folded, remaining)
+    return {"compacted": folded, "pending": remaining}
+
+
+def _public(movement: Dict[str, Any]) -> Dict[str, Any]:
+    out = {k: v for k, v in movement.items() if k not in ("_id", "compactionId", "claimedAt")}
+    out["id"] = str(movement["_id"])
+    return out
+
+
+async def movement_history(
+    db,
+    stok_urun_id: int,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    location_id: Optional[int] = None,
+    limit: int = 100,
+) -> List[Dict[str, Any]]:
+    """Movements for one ingredient in [since, until), newest first."""
+    q: Dict[str, Any] = {"productVariantId": stok_urun_id, "locationId": location_id}
+    window = {k: v for k, v in (("$gte", since), ("$lt", until)) if v}
+    if window:
+        q["createdAt"] = window
+    docs = await db[MOVEMENTS].find(q).sort([("createdAt", -1), ("_id", -1)]).limit(limit).to_list(None)
+    return [_public(d) for d in docs]
+
+
+async def stock_at(db, stok_urun_id: int, at: Optional[datetime] = None, location_id: Optional[int] = None) -> Dict[str, Any]:
+    """Stock of one ingredient at `at` (default now) from snapshots and movements."""
+    at = at or _now()
+    key = {"productVariantId": stok_urun_id, "locationId": location_id}
+    snapshot = await db[LEVELS].find_one(key)
+    if snapshot and snapshot.get("asOf") and at >= snapshot["asOf"]:
+        # everything folded so far happened before `at`: start from the snapshot
+        quantity, source = float(snapshot["quantity"]), "snapshot"
+        q = {**key, "compacted": False, "createdAt": {"$lte": at}}
+    elif snapshot:
+        if snapshot.get("openedAt") and at < snapshot["openedAt"]:
+            return {"stok_urun_id": stok_urun_id, "location_id": location_id, "at": at, "quantity": None, "source": "before_history"}
+        quantity, source = float(snapshot["opening"]), "opening"
+        q = {**key, "createdAt": {"$lte": at}}
+    else:
+        quantity, source = await _opening_quantity(db, stok_urun_id, location_id), "opening"
+        q = {**key, "compacted": False, "createdAt": {"$lte": at}}
+    movements = await db[MOVEMENTS].find(q).sort([("createdAt", 1), ("_id", 1)]).to_list(None)
+    quantity, applied = _fold(quantity, movements)
+    return {
+        "stok_urun_id": stok_urun_id,
+        "location_id": location_id,
+        "at": at,
+        "quantity": round(quantity, 6),
+        "source": source,
+        "folded_movements": applied,
+    }
@@ -0,0 +1,179 @@
+"""Sliding-window login attempt throttling.
+
+Every login attempt is counted per client IP and per account (employee_id or
+email). Attempts over the limit are rejected before any database or bcrypt
+work. Counters live in process memory; when REDIS_URL is configured they are
+kept in Redis sorted sets instead so all API workers share one window, with
+the check and the insert done in one Lua script so concurrent attempts cannot
+overshoot the limit.
+
+X-Forwarded-For is honoured only when the connecting peer is listed in
+TRUSTED_PROXIES (comma-separated addresses or CIDR ranges); otherwise any
+client could pick the address it is throttled under.
+"""
+import ipaddress
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+try:
+    from .cache import get_redis, redis_configured  # type: ignore
+except Exception:
+    from cache import get_redis, redis_configured
+
+logger = logging.getLogger(__name__)
+
+# prune, check and record in one step; returns nil when allowed, else the
+# seconds until the oldest hit leaves the window (as a string: Lua numbers
+# are truncated to integers on the way out)
+_HIT_LUA = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, now - window)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+  local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+  return tostring(tonumber(oldest[2]) + window - now)
+end
+redis.call('ZADD', KEYS[1], now, ARGV[4])
+redis.call('EXPIRE', KEYS[1], math.ceil(window) + 1)
+return false
+"""
+
+
+def _parse_networks(raw: str) -> List[Any]:
+    networks = []
+    for part in raw.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(part, strict=False))
+        except ValueError:
+            logger.warning("Ignoring invalid TRUSTED_PROXIES entry %r", part)
+    return networks
+
+
+TRUSTED_PROXIES = _parse_networks(os.environ.get("TRUSTED_PROXIES", ""))
+
+
+def _trusted(address: Optional[str], networks: List[Any]) -> bool:
+    try:
+        ip = ipaddress.ip_address((address or "").strip())
+    except ValueError:
+        return False
+    return any(ip in net for net in networks)
+
+
+def client_ip(peer: Optional[str], forwarded_for: Optional[str], trusted: Optional[List[Any]] = None) -> Optional[str]:
+    """The address to throttle: the peer, or the nearest untrusted X-Forwarded-For hop behind trusted proxies."""
+    networks = TRUSTED_PROXIES if trusted is None else trusted
+    if not forwarded_for or not _trusted(peer, networks):
+        return peer
+    hops = [h.strip() for h in forwarded_for.split(",") if h.strip()]
+    # walk from the right: each trusted proxy appended the address it saw
+    for hop in reversed(hops):
+        if not _trusted(hop, networks):
+            return hop
+    return hops[0] if hops else peer
+
+
+class SlidingWindowLimiter:
+    """Allow at most `limit` hits per key within the trailing `window_seconds`."""
+
+    def __init__(self, name: str, limit: int, window_seconds: float, use_redis: Optional[bool] = None):
+        self.name = name
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.use_redis = redis_configured() if use_redis is None else use_redis
+        self._hits: Dict[str, Deque[float]] = {}
+        self._script = None
+        self.allowed = 0
+        self.rejected = 0
+
+    def _hit_local(self, key: str, now: float) -> Optional[float]:
+        hits = self._hits.setdefault(key, deque())
+        cutoff = now - self.window_seconds
+        while hits and hits[0] <= cutoff:
+            hits.popleft()
+        if len(hits) >= self.limit:
+            return hits[0] + self.window_seconds - now
+        hits.append(now)
+        return None
+
+    def _hit_redis(self, key: str, now: float) -> Optional[float]:
+        if self._script is None:
+            self._script = get_redis().register_script(_HIT_LUA)
+        retry_after = self._script(
+            keys=[f"login_throttle:{self.name}:{key}"],
+            args=[now, self.window_seconds, self.limit, f"{now}:{uuid.uuid4().hex[:8]}"],
+        )
+        return float(retry_after) if retry_after is not None else None
+
+    def hit(self, key: str) -> Optional[float]:
+        """Record an attempt. Returns None if allowed, else seconds until retry."""
+        now = time.time()
+        retry_after = None
+        if self.use_redis:
+            try:
+                retry_after = self._hit_redis(key, now)
+            except Exception:
+                logger.exception("Redis login throttle failed; using in-memory window")
+                retry_after = self._hit_local(key, now)
+        else:
+            retry_after = self._hit_local(key, now)
+
+        if retry_after is None:
+            self.allowed += 1
+        else:
+            self.rejected += 1
+        return retry_after
+
+    def prune(self) -> None:
+        cutoff = time.time() - self.window_seconds
+        for key in [k for k, v in self._hits.items() if not v or v[-1] <= cutoff]:
+            self._hits.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "window_seconds": self.window_seconds,
+            "backend": "redis" if self.use_redis else "memory",
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "tracked_keys": len(self._hits),
+        }
+
+
+class LoginThrottle:
+    def __init__(self):
+        window = float(os.environ.get("LOGIN_THROTTLE_WINDOW", "60"))
+        self.enabled = os.environ.get("LOGIN_THROTTLE_ENABLED", "true").lower() == "true"
+        self.per_ip = SlidingWindowLimiter("ip", int(os.environ.get("LOGIN_THROTTLE_IP_LIMIT", "30")), window)
+        self.per_account = SlidingWindowLimiter("account", int(os.environ.get("LOGIN_THROTTLE_ACCOUNT_LIMIT", "10")), window)
+        self._checks = 0
+
+    def check(self, client_ip: Optional[str], account: Optional[str]) -> Optional[float]:
+        """Count one login attempt; return seconds to wait if it must be rejected."""
+        if not self.enabled:
+            return None
+        self._checks += 1
+        if self._checks % 1000 == 0:
+            self.per_ip.prune()
+            self.per_account.prune()
+
+        if client_ip:
+            retry_after = self.per_ip.hit(client_ip)
+            if retry_after is not None:
+                return retry_after
+        if account:
+            return self.per_account.hit(account.strip().lower())
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "per_ip": self.per_ip.stats(), "per_account": self.per_account.stats()}
+
+
+login_throttle = LoginThrottle()
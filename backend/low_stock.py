@@ -0,0 +1,148 @@
+"""Incremental low-stock tracking.
+
+`stok_low_stock` holds one document per (company, stok_urun) that is at or
+below its `min_stok`. Code that changes stock (order deduction, stock count,
+import) reports the pool quantities it just produced via `observe`; only a
+threshold crossing writes to the set and publishes "stock.low" or
+"stock.recovered" on the event hub, so `/stok/low` is an O(k) read instead
+of a scan of every product.
+
+Order paths report the stock they read before their conditional deduction
+minus what they took. A concurrent deduction can make that estimate high,
+so a crossing can be reported one mutation late, never falsely.
+Quantities are totals across pools (`mevcut` plus every location).
+"""
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    from .event_hub import event_hub  # type: ignore
+except Exception:
+    from event_hub import event_hub
+
+logger = logging.getLogger(__name__)
+
+LOW = "stok_low_stock"
+META_FIELDS = {"_id": 0, "id": 1, "company_id": 1, "ad": 1, "min_stok": 1, "mevcut": 1, "locations": 1}
+
+
+def _low_id(company_id: int, sid: int) -> str:
+    return f"{company_id}:{sid}"
+
+
+def total_quantity(doc: Dict[str, Any]) -> float:
+    """Stock across the unassigned pool and every location."""
+    return float(doc.get("mevcut") or 0) + sum(float(q or 0) for q in (doc.get("locations") or {}).values())
+
+
+def _pool(doc: Dict[str, Any], location_id: Optional[int]) -> float:
+    if location_id is None:
+        return float(doc.get("mevcut") or 0)
+    return float((doc.get("locations") or {}).get(str(location_id)) or 0)
+
+
+def is_low(quantity: float, min_stok: Any) -> bool:
+    return bool(min_stok) and float(min_stok) > 0 and quantity <= float(min_stok)
+
+
+class LowStockTracker:
+    def __init__(self, meta_ttl: Optional[float] = None):
+        self.meta_ttl = meta_ttl if meta_ttl is not None else float(os.environ.get("STOK_LOW_META_TTL", "60"))
+        self._meta: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+
+    def remember(self, docs: Iterable[Dict[str, Any]]) -> None:
+        """Cache stok_urun metadata the caller has already read."""
+        now = time.monotonic()
+        for d in docs:
+            if "min_stok" in d and "company_id" in d:
+                self._meta[d["id"]] = (now, d)
+
+    def forget(self, sid: int) -> None:
+        self._meta.pop(sid, None)
+
+    async def _meta_for(self, db, sids: List[int]) -> Dict[int, Dict[str, Any]]:
+        now = time.monotonic()
+        fresh = {sid: m for sid, (at, m) in ((s, self._meta[s]) for s in sids if s in self._meta) if now - at < self.meta_ttl}
+        missing = [sid for sid in sids if sid not in fresh]
+        if missing:
+            docs = await db.stok_urun.find({"id": {"$in": missing}}, META_FIELDS).to_list(None)
+            self.remember(docs)
+            fresh.update({d["id"]: d for d in docs})
+        return fresh
+
+    async def observe(self, db, quantities: Dict[int, float], location_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Report new quantities of one pool (None: unassigned `mevcut`); returns the crossings.
+
+        The other pools are taken from the cached stok_urun metadata.
+        """
+        if not quantities:
+            return []
+        sids = list(quantities)
+        meta = await self._meta_for(db, sids)
+        flagged = {
+            d["stok_urun_id"]
+            for d in await db[LOW].find({"stok_urun_id": {"$in": sids}}, {"_id": 0, "stok_urun_id": 1}).to_list(None)
+        }
+        crossings = []
+        for sid, quantity in quantities.items():
+            m = meta.get(sid)
+            if m is None:
+                continue
+            company_id = int(m.get("company_id") or 1)
+            quantity = round(total_quantity(m) - _pool(m, location_id) + quantity, 6)
+            low = is_low(quantity, m.get("min_stok"))
+            if low and sid not in flagged:
+                res = await db[LOW].update_one(
+                    {"_id": _low_id(company_id, sid)},
+                    {"$setOnInsert": {"company_id": company_id, "stok_urun_id": sid, "since": datetime.now(timezone.utc).isoformat()}},
+                    upsert=True,
+                )
+                if res.upserted_id is not None:
+                    crossings.append({"type": "stock.low", "company_id": company_id, "stok_urun_id": sid,
+                                      "ad": m.get("ad"), "quantity": quantity, "min_stok": m.get("min_stok")})
+            elif not low and sid in flagged:
+                res = await db[LOW].delete_one({"_id": _low_id(company_id, sid)})
+                if res.deleted_count:
+                    crossings.append({"type": "stock.recovered", "company_id": company_id, "stok_urun_id": sid,
+                                      "ad": m.get("ad"), "quantity": quantity, "min_stok": m.get("min_stok")})
+        for c in crossings:
+            try:
+                await event_hub.publish(c["type"], c["company_id"], stok_urun_id=c["stok_urun_id"], ad=c["ad"],
+                                        quantity=c["quantity"], min_stok=c["min_stok"])
+            except Exception:
+                logger.exception("Failed to publish %s for stok_urun %s", c["type"], c["stok_urun_id"])
+        return crossings
+
+    async def low_items(self, db, company_id: int) -> List[Dict[str, Any]]:
+        """The company's low-stock items with their current quantities (two indexed reads)."""
+        flagged = await db[LOW].find({"company_id": company_id}, {"_id": 0}).to_list(None)
+        if not flagged:
+            return []
+        since = {f["stok_urun_id"]: f.get("since") for f in flagged}
+        docs = await db.stok_urun.find({"id": {"$in": list(since)}}, META_FIELDS).to_list(None)
+        items = [
+            {"stok_urun_id": d["id"], "ad": d.get("ad"), "min_stok": d.get("min_stok"),
+             "mevcut": round(total_quantity(d), 6), "since": since[d["id"]]}
+            for d in docs
+        ]
+        return sorted(items, key=lambda i: (i["mevcut"] - float(i["min_stok"] or 0), i["ad"] or ""))
+
+    async def rebuild(self, db, company_id: Optional[int] = None) -> int:
+        """Recompute the set with one scan (first deployment, or after manual edits); no events."""
+        q: Dict[str, Any] = {} if company_id is None else {"company_id": company_id}
+        low = {}
+        async for d in db.stok_urun.find(q, META_FIELDS):
+            if is_low(total_quantity(d), d.get("min_stok")):
+                cid = int(d.get("company_id") or 1)
+                low[_low_id(cid, d["id"])] = {"company_id": cid, "stok_urun_id": d["id"], "since": datetime.now(timezone.utc).isoformat()}
+        await db[LOW].delete_many(q)
+        if low:
+            await db[LOW].insert_many([{"_id": lid, **doc} for lid, doc in low.items()])
+        self._meta.clear()
+        return len(low)
+
+
+low_stock = LowStockTracker()
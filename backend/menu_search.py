@@ -0,0 +1,114 @@
+"""In-memory menu search for kiosk typeahead.
+
+Built from the POS catalog snapshot and rebuilt whenever the snapshot revision
+changes. Names are folded the Turkish way (İ -> i, I -> ı) and then stripped
+of diacritics (ı/ş/ğ/ü/ö/ç -> i/s/g/u/o/c), so "ISKENDER", "iskender" and
+"İskender" all find "İskender Kebap". Each word is indexed by its prefixes
+(typeahead) and by its trigrams (typos such as "lahamcun").
+"""
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+_TR_LOWER = str.maketrans({"I": "ı", "İ": "i"})
+_ASCII_FOLD = str.maketrans({"ı": "i", "ş": "s", "ğ": "g", "ü": "u", "ö": "o", "ç": "c", "â": "a", "î": "i", "û": "u"})
+MAX_PREFIX = 12
+FUZZY_THRESHOLD = 0.45
+# shorter words share too many trigrams with unrelated names to be useful
+FUZZY_MIN_WORD = 4
+
+
+def fold(text: str) -> str:
+    return text.translate(_TR_LOWER).lower().translate(_ASCII_FOLD)
+
+
+def _words(text: str) -> List[str]:
+    return ["".join(ch for ch in w if ch.isalnum()) for w in fold(text).split()]
+
+
+def _trigrams(word: str) -> Set[str]:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class MenuSearchIndex:
+    def __init__(self):
+        self.version: Optional[int] = None
+        self._items: Dict[Any, Dict[str, Any]] = {}
+        self._names: Dict[Any, str] = {}
+        self._prefix: Dict[str, Set[Any]] = {}
+        self._trigram: Dict[str, Set[Any]] = {}
+
+    def build(self, items: List[Dict[str, Any]], version: Optional[int] = None) -> None:
+        prefix: Dict[str, Set[Any]] = {}
+        trigram: Dict[str, Set[Any]] = {}
+        names = {}
+        for item in items:
+            item_id = item.get("id")
+            text = f"{item.get('name') or ''} {item.get('description') or ''}"
+            names[item_id] = fold(item.get("name") or "")
+            for word in _words(text):
+                if not word:
+                    continue
+                for n in range(1, min(len(word), MAX_PREFIX) + 1):
+                    prefix.setdefault(word[:n], set()).add(item_id)
+                for gram in _trigrams(word):
+                    trigram.setdefault(gram, set()).add(item_id)
+        self._items = {item.get("id"): item for item in items}
+        self._names, self._prefix, self._trigram = names, prefix, trigram
+        self.version = version
+
+    def _prefix_hits(self, word: str) -> Set[Any]:
+        hits = self._prefix.get(word[:MAX_PREFIX], set())
+        if len(word) > MAX_PREFIX:
+            # prefixes are only indexed up to MAX_PREFIX characters
+            hits = {i for i in hits if any(w.startswith(word) for w in self._names[i].split())}
+        return hits
+
+    def _fuzzy_scores(self, word: str) -> Dict[Any, float]:
+        grams = _trigrams(word)
+        shared: Dict[Any, int] = {}
+        for gram in grams:
+            for item_id in self._trigram.get(gram, ()):
+                shared[item_id] = shared.get(item_id, 0) + 1
+        return {i: n / len(grams) for i, n in shared.items() if n / len(grams) >= FUZZY_THRESHOLD}
+
+    def search(self, query: str, category_id: Optional[int] = None, kiosk: Optional[bool] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        words = [w for w in _words(query) if w]
+        if not words:
+            return []
+
+        scored: List[Tuple[float, int, str, Any]] = []
+        exact: Optional[Set[Any]] = None
+        for word in words:
+            hits = self._prefix_hits(word)
+            exact = hits if exact is None else exact & hits
+        for item_id in exact or ():
+            name = self._names[item_id]
+            # name starting with the query ranks above a later-word match
+            scored.append((2.0 if name.startswith(words[0]) else 1.5, len(name), name, item_id))
+
+        if len(scored) < limit and all(len(w) >= FUZZY_MIN_WORD for w in words):
+            # typo tolerance: every query word must fuzzily match some word of the item
+            fuzzy: Optional[Dict[Any, float]] = None
+            for word in words:
+                scores = self._fuzzy_scores(word)
+                fuzzy = scores if fuzzy is None else {i: min(s, scores[i]) for i, s in fuzzy.items() if i in scores}
+            seen = {entry[3] for entry in scored}
+            for item_id, score in (fuzzy or {}).items():
+                if item_id not in seen:
+                    scored.append((score, len(self._names[item_id]), self._names[item_id], item_id))
+
+        scored.sort(key=lambda e: (-e[0], e[1], e[2]))
+        results = []
+        for _, _, _, item_id in scored:
+            item = self._items[item_id]
+            if category_id is not None and item.get("category_id") != category_id:
+                continue
+            if kiosk is not None and item.get("kiosk") != kiosk and item.get("kiosk_featured") != kiosk:
+                continue
+            results.append(item)
+            if len(results) >= limit:
+                break
+        return results
+
+
+menu_index = MenuSearchIndex()
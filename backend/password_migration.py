@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""Bulk migration that sets default bcrypt passwords for employees without one.
+
+Employees missing a hash are streamed in id order and processed in batches:
+each batch is hashed in parallel on a process pool and written with a single
+`bulk_write`. The last processed id and the run's counters are checkpointed
+in the `migrations` collection so an interrupted run resumes where it
+stopped and its progress can be read from there.
+
+Usage:
+  MONGO_URL and DB_NAME are read from the environment.
+  Run: python3 -m backend.password_migration [--batch-size 500] [--workers 4] [--restart]
+
+The same entrypoint is exposed as an RQ job (tasks.migrate_passwords_job),
+which POST /api/migrate-passwords enqueues; without REDIS_URL the endpoint
+runs it as a task on the API worker (start_local_migration), hashing still on
+a process pool. Every runner tells API workers to reload their employee
+directory when passwords were set.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+import bcrypt
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+_local_run: Optional[asyncio.Task] = None
+
+# Default passwords for known demo users; everyone else gets user<employee_id>
+DEFAULT_PASSWORDS = {
+    "1000": "admin123",
+    "1001": "mehmet123",
+    "1002": "zeynep123",
+    "1003": "ayse123",
+    "1004": "ali123",
+    "2001": "arda2024"
+}
+
+MISSING_PASSWORD_QUERY = {"$or": [{"password": {"$exists": False}}, {"password": None}, {"password": ""}]}
+CHECKPOINT_ID = "password_migration"
+
+
+def default_password_for(employee_id: Any) -> str:
+    return DEFAULT_PASSWORDS.get(employee_id, f"user{employee_id}")
+
+
+def _hash_password(password: str) -> str:
+    # module-level so it can be pickled into pool workers
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+
+async def _write_batch(db, loop, executor: Executor, batch) -> int:
+    hashes = await asyncio.gather(*[
+        loop.run_in_executor(executor, _hash_password, default_password_for(e.get("employee_id")))
+        for e in batch
+    ])
+    # re-check "missing" in the filter so a password set meanwhile is never overwritten
+    ops = [
+        UpdateOne({"$and": [{"id": e["id"]}, MISSING_PASSWORD_QUERY]}, {"$set": {"password": h}})
+        for e, h in zip(batch, hashes)
+    ]
+    result = await db.employees.bulk_write(ops, ordered=False)
+    return result.modified_count
+
+
+async def migrate_missing_passwords(
+    db,
+    batch_size: int = 500,
+    workers: Optional[int] = None,
+    resume: bool = True,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """Hash and store default passwords for every employee without one.
+
+    Returns counters: processed, updated, elapsed_seconds, rate_per_second.
+    """
+    started = time.monotonic()
+    last_id = None
+    if resume:
+        checkpoint = await db.migrations.find_one({"_id": CHECKPOINT_ID})
+        if checkpoint and not checkpoint.get("completed"):
+            last_id = checkpoint.get("last_id")
+            logger.info("Resuming password migration after employee id %s", last_id)
+
+    query = dict(MISSING_PASSWORD_QUERY)
+    if last_id is not None:
+        query = {"$and": [MISSING_PASSWORD_QUERY, {"id": {"$gt": last_id}}]}
+
+    total = await db.employees.count_documents(query)
+    stats = {"total": total, "processed": 0, "updated": 0, "elapsed_seconds": 0.0, "rate_per_second": 0.0}
+
+    loop = asyncio.get_running_loop()
+    cursor = db.employees.find(query, {"_id": 0, "id": 1, "employee_id": 1}).sort("id", 1).batch_size(batch_size)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        batch = []
+
+        async def flush():
+            stats["updated"] += await _write_batch(db, loop, executor, batch)
+            stats["processed"] += len(batch)
+            elapsed = time.monotonic() - started
+            stats["elapsed_seconds"] = round(elapsed, 2)
+            stats["rate_per_second"] = round(stats["processed"] / elapsed, 1) if elapsed > 0 else 0.0
+            await db.migrations.update_one(
+                {"_id": CHECKPOINT_ID},
+                {"$set": {"last_id": batch[-1]["id"], "completed": False, "stats": dict(stats), "updated_at": datetime.now(timezone.utc).isoformat()}},
+                upsert=True,
+            )
+            logger.info("Password migration: %s/%s processed (%s/s)", stats["processed"], total, stats["rate_per_second"])
+            if progress:
+                progress(dict(stats))
+            batch.clear()
+
+        async for employee in cursor:
+            if employee.get("id") is None:
+                continue
+            batch.append(employee)
+            if len(batch) >= batch_size:
+                await flush()
+        if batch:
+            await flush()
+
+    elapsed = time.monotonic() - started
+    stats["elapsed_seconds"] = round(elapsed, 2)
+    stats["rate_per_second"] = round(stats["processed"] / elapsed, 1) if elapsed > 0 else 0.0
+    await db.migrations.update_one(
+        {"_id": CHECKPOINT_ID},
+        {"$set": {"completed": True, "stats": dict(stats), "updated_at": datetime.now(timezone.utc).isoformat()}},
+        upsert=True,
+    )
+    return stats
+
+
+def invalidate_directories() -> None:
+    """Make every API worker reload its employee directory (passwords changed)."""
+    try:
+        from .employee_directory import employee_directory  # type: ignore
+    except Exception:
+        from employee_directory import employee_directory
+    employee_directory.invalidate_everywhere()
+
+
+async def _run_local(db, batch_size: int) -> None:
+    try:
+        stats = await migrate_missing_passwords(db, batch_size=batch_size)
+    except Exception:
+        # the checkpoint keeps the last written batch; the next run resumes there
+        logger.exception("In-process password migration failed")
+        return
+    if stats["updated"]:
+        invalidate_directories()
+    logger.info("Password migration finished: %s", stats)
+
+
+def start_local_migration(db, batch_size: int = 500) -> bool:
+    """Run the migration as a task on this process's event loop (no RQ).
+
+    Returns False when one is already running here.
+    """
+    global _local_run
+    if _local_run is not None and not _local_run.done():
+        return False
+    _local_run = asyncio.get_running_loop().create_task(_run_local(db, batch_size))
+    return True
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description="Set default passwords for employees without one")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=None, help="hashing processes (default: CPU count)")
+    parser.add_argument("--restart", action="store_true", help="ignore the saved checkpoint")
+    args = parser.parse_args(argv)
+
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    client = AsyncIOMotorClient(os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[os.getenv("DB_NAME", "mevcut_db")]
+    try:
+        stats = await migrate_missing_passwords(db, batch_size=args.batch_size, workers=args.workers, resume=not args.restart)
+        if stats["updated"]:
+            invalidate_directories()
+        print(f"Done: {stats}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,9 +1,32 @@
+from fastapi import Header, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
-from datetime import datetime, timezone
+from datetime import date, datetime, timedelta, timezone
+import asyncio
+import base64
+import json
+import os
+import uuid
+
+from pymongo import DeleteOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 
 # Import shared objects from server; server imports this module after api_router is defined
-from .server import api_router, db, logger, get_next_id, client
+from .server import api_router, db, logger, get_next_id, allocate_ids, client
+from .pos_recipes import recipe_table, CompiledMenuItem
+from .pos_catalog import catalog
+from .menu_search import menu_index
+from .print_queue import enqueue_print, print_status
+from .idempotency import run_idempotent
+from .inventory_ledger import REF_FIELD as LEDGER_REF_FIELD, STOCK_LINK as LEDGER_STOCK_LINK, inventory_ledger
+from .inventory_movements import movement_log
+from . import inventory_movements
+from .event_hub import event_hub, publish_order_event
+from . import sales_rollups
+from .table_board import table_board
+from .scan_index import scan_index, location_quantity
+from .low_stock import low_stock
 
 
 class MenuItemCreate(BaseModel):
@@ -15,12 +38,26 @@ class MenuItemCreate(BaseModel):
     # If recipe is provided, this menu item will reduce stock when ordered
     recipe: Optional[List[Dict[str, Any]]] = None  # list of { "stok_urun_id": int, "quantity": float }
     active: bool = True
+    # scanner codes resolved by /pos/scan/{code}
+    barcode: Optional[str] = None
+    sku: Optional[str] = None
 
 
 class MenuItem(MenuItemCreate):
     id: int
 
 
+class MenuItemUpdate(BaseModel):
+    name: Optional[str] = None
+    price: Optional[float] = None
+    description: Optional[str] = None
+    category_id: Optional[int] = None
+    recipe: Optional[List[Dict[str, Any]]] = None
+    active: Optional[bool] = None
+    barcode: Optional[str] = None
+    sku: Optional[str] = None
+
+
 class OrderItemCreate(BaseModel):
     menu_item_id: int
     quantity: int = 1
@@ -32,6 +69,8 @@ class OrderCreate(BaseModel):
     customer: Optional[str] = None
     items: List[OrderItemCreate]
     note: Optional[str] = None
+    # deduct from this inventory location's pool instead of the unassigned `mevcut`
+    location_id: Optional[int] = None
 
 
 class Order(BaseModel):
@@ -51,19 +90,545 @@ def _compute_order_total(items: List[Dict[str, Any]]) -> float:
     return round(sum([it.get("price", 0) * it.get("quantity", 1) for it in items]), 2)
 
 
-def _trigger_print(order: Dict[str, Any]) -> bool:
-    """Placeholder for thermal printer integration.
+def _build_order_lines(items: List[OrderItemCreate], menu: Dict[int, CompiledMenuItem]):
+    """Return (order_items, ingredient_requirements) for the requested items.
+
+    `menu` is the compiled recipe table; ingredient_requirements maps
+    stok_urun_id -> total quantity needed.
+    """
+    order_items = []
+    ingredient_requirements: Dict[int, float] = {}
+
+    for it in items:
+        m = menu.get(int(it.menu_item_id))
+        if not m or not m.active:
+            raise Exception(f"Menu item {it.menu_item_id} not found or inactive")
+
+        qty = int(it.quantity or 1)
+        order_items.append({"menu_item_id": m.id, "name": m.name, "price": m.price, "quantity": qty})
+
+        for sid, per_unit in m.ingredients:
+            ingredient_requirements[sid] = ingredient_requirements.get(sid, 0) + per_unit * qty
+
+    return order_items, ingredient_requirements
+
+
+# Stock is kept per pool on the stok_urun document: `mevcut` is the unassigned
+# pool and `locations.<location_id>` the pool held at each inventory location.
+# An order draws from exactly one pool, so a deduction stays a single
+# conditional $inc per ingredient.
+def _stock_field(location_id: Optional[int]) -> str:
+    return f"locations.{location_id}" if location_id is not None else "mevcut"
+
+
+def _pool_quantity(doc: Dict[str, Any], location_id: Optional[int]) -> float:
+    if location_id is None:
+        return float(doc.get("mevcut", doc.get("min_stok", 0)))
+    return location_quantity(doc, location_id)
+
+
+async def _check_stock(ingredient_requirements: Dict[int, float], session=None, location_id: Optional[int] = None):
+    """Load every required stok_urun with one $in query and compare in memory.
+
+    Returns (insufficient, stock_docs) where stock_docs maps id -> document.
+    """
+    if not ingredient_requirements:
+        return [], {}
+    docs = await db.stok_urun.find(
+        {"id": {"$in": list(ingredient_requirements.keys())}},
+        {"_id": 0, "id": 1, "ad": 1, "mevcut": 1, "locations": 1, "min_stok": 1, "company_id": 1},
+        session=session,
+    ).to_list(None)
+    stock_docs = {d["id"]: d for d in docs}
+
+    insufficient = []
+    for sid, need in ingredient_requirements.items():
+        doc = stock_docs.get(sid)
+        current = _pool_quantity(doc, location_id) if doc else 0
+        if current < need:
+            insufficient.append({"stok_urun_id": sid, "needed": need, "available": current})
+    return insufficient, stock_docs
+
+
+async def _rollback_stock(applied: Dict[int, float], location_id: Optional[int] = None, stubs: Optional[List[Any]] = None) -> None:
+    """Re-credit deductions that were applied, in a single bulk_write.
+
+    `applied` must only hold ingredients whose conditional $inc matched; the
+    compensation state lives with the caller, never in the stok_urun rows.
+    `stubs` are `_id`s of rows a deduction upserted for a missing ingredient.
+    """
+    if not applied and not stubs:
+        return
+    field = _stock_field(location_id)
+    ops: List[Any] = [UpdateOne({"id": sid}, {"$inc": {field: need}}) for sid, need in applied.items()]
+    ops += [DeleteOne({"_id": oid}) for oid in stubs or []]
+    try:
+        await db.stok_urun.bulk_write(ops, ordered=False)
+    except Exception:
+        logger.exception("Failed to roll back stock deduction %s", applied)
+
+
+async def _deduct_stock(ingredient_requirements: Dict[int, float], location_id: Optional[int] = None):
+    """Decrement all ingredients with one ordered bulk_write of conditional $inc ops.
 
-    Replace this with a call to CUPS, network printer, or a background job queue that talks to a local printing service.
-    For now we log and return True to indicate success.
+    Returns (token, insufficient). On success insufficient is empty and token
+    is the deduction reference used in the movement log. Each op upserts when
+    its stock is short: the unique index on stok_urun.id turns that into a
+    duplicate-key write error, so the BulkWriteError names the first op that
+    did not match, everything before it was applied and nothing after it ran.
+    An ingredient with no row at all comes back as an upserted stub instead
+    and is deleted again. Only then are the applied ones rolled back in one
+    bulk op and the current shortfall re-read.
     """
+    if not ingredient_requirements:
+        return None, []
+    field = _stock_field(location_id)
+    sids = list(ingredient_requirements)
+    ops = [
+        UpdateOne({"id": sid, field: {"$gte": need}}, {"$inc": {field: -need}}, upsert=True)
+        for sid, need in ingredient_requirements.items()
+    ]
+    error = None
     try:
-        logger.info("[POS PRINT] Printing adisyon %s for table=%s total=%s", order.get("adisyon_no"), order.get("table"), order.get("total"))
-        # TODO: enqueue print job in Redis or call external print service
-        return True
+        result = await db.stok_urun.bulk_write(ops, ordered=True)
+        ran, upserted = len(ops), dict(result.upserted_ids or {})
+    except BulkWriteError as e:
+        first = e.details["writeErrors"][0]
+        ran = first["index"]
+        upserted = {u["index"]: u["_id"] for u in e.details.get("upserted", [])}
+        if first.get("code") != 11000:
+            error = e
+    if ran == len(ops) and not upserted:
+        return uuid.uuid4().hex[:16], []
+
+    # failed to decrement (insufficient stock, a missing row or a write error)
+    applied = {sids[i]: ingredient_requirements[sids[i]] for i in range(ran) if i not in upserted}
+    await _rollback_stock(applied, location_id=location_id, stubs=list(upserted.values()))
+    if error is not None:
+        raise error
+    insufficient, _ = await _check_stock(ingredient_requirements, location_id=location_id)
+    if not insufficient:
+        # stock recovered between the deduction and the re-read; report the race
+        insufficient = [{"stok_urun_id": sid, "needed": need, "available": None} for sid, need in ingredient_requirements.items()]
+    return None, insufficient
+
+
+async def _catalog_changed(menu: bool = False) -> None:
+    """Invalidate per-process caches after a catalog write (menu, categories, zones, tables)."""
+    if menu:
+        recipe_table.invalidate()
+    await catalog.mark_changed(db)
+
+
+async def _trigger_print(order: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Queue the adisyon for printing; the printer I/O runs in the print worker."""
+    try:
+        return await enqueue_print(db, order)
     except Exception:
-        logger.exception("Failed to trigger print for order %s", order.get("id"))
-        return False
+        logger.exception("Failed to queue print for order %s", order.get("id"))
+        return None
+
+
+# --- Order engine ---
+# Cached result of the replica-set / transaction capability probe (None = not probed yet)
+_transactions_supported: Optional[bool] = None
+
+
+async def detect_transaction_support() -> bool:
+    """Probe once whether the deployment supports multi-document transactions.
+
+    Transactions need a replica set or a sharded cluster (mongos). The answer is
+    cached for the lifetime of the process; POS_USE_TRANSACTIONS=false disables them.
+    """
+    global _transactions_supported
+    if _transactions_supported is None:
+        if os.environ.get("POS_USE_TRANSACTIONS", "true").lower() != "true":
+            _transactions_supported = False
+        else:
+            try:
+                hello = await client.admin.command("hello")
+                _transactions_supported = bool(hello.get("setName") or hello.get("msg") == "isdbgrid")
+            except Exception:
+                logger.exception("Failed to probe MongoDB transaction support")
+                _transactions_supported = False
+        logger.info("POS order engine: transactions %s", "enabled" if _transactions_supported else "not available, using bulk conditional path")
+    return _transactions_supported
+
+
+class OrderRejected(Exception):
+    """Raised inside the order pipeline to abort with an API error payload."""
+
+    def __init__(self, error: str, details: Any = None, outcome_unknown: bool = False):
+        super().__init__(error)
+        self.error = error
+        self.details = details
+        # the order may have been stored after all
+        self.outcome_unknown = outcome_unknown
+
+
+# an order stores its inventory ledger reservation, so an abandoned one can be settled
+ORDER_LEDGER_LINK = {"coll": "orders", "field": "ledger_token"}
+
+
+def _new_order_doc(order_id: int, oc: OrderCreate, order_items: List[Dict[str, Any]], payment: Optional[Dict[str, Any]],
+                   ledger_token: Optional[str] = None) -> Dict[str, Any]:
+    total = _compute_order_total(order_items)
+    now = datetime.now(timezone.utc).isoformat()
+    order_doc = {
+        "id": order_id,
+        "adisyon_no": order_id,
+        "company_id": int(oc.company_id or 1),
+        "table": oc.table,
+        "customer": oc.customer,
+        "items": order_items,
+        "total": total,
+        "note": oc.note,
+        "status": "paid" if payment and float(payment.get("amount", 0)) >= total else "open",
+        "created_at": now,
+        "payments": []
+    }
+    if oc.location_id is not None:
+        order_doc["location_id"] = oc.location_id
+    if ledger_token:
+        order_doc["ledger_token"] = ledger_token
+    if payment:
+        order_doc["payments"].append({
+            "method": payment.get("method"),
+            "amount": float(payment.get("amount", 0)),
+            "details": payment.get("details") or {},
+            "recorded_at": now
+        })
+    return order_doc
+
+
+async def _place_order_transactional(order_id, oc, order_items, ingredient_requirements, payment, ledger_token=None):
+    """Stock check, deduction and insert in one multi-document transaction.
+
+    `order_id` comes from the shared counter outside the transaction: taking
+    it inside would make every concurrent order transaction write the same
+    counter document and abort on write conflicts. An aborted or rejected
+    order therefore leaves a gap in the ids (see id_counters).
+    Returns (order_doc, stock_docs read before the deduction).
+    """
+    async with await client.start_session() as session:
+        async with session.start_transaction():
+            insufficient, stock_docs = await _check_stock(ingredient_requirements, session=session, location_id=oc.location_id)
+            if insufficient:
+                raise OrderRejected("insufficient_stock", insufficient)
+
+            if ingredient_requirements:
+                field = _stock_field(oc.location_id)
+                ops = [
+                    UpdateOne({"id": sid, field: {"$gte": need}}, {"$inc": {field: -need}})
+                    for sid, need in ingredient_requirements.items()
+                ]
+                res = await db.stok_urun.bulk_write(ops, ordered=True, session=session)
+                if res.modified_count != len(ops):
+                    raise RuntimeError("concurrent_stock_update")
+
+            order_doc = _new_order_doc(order_id, oc, order_items, payment, ledger_token)
+            await db.orders.insert_one(dict(order_doc), session=session)
+    return order_doc, stock_docs
+
+
+async def _place_order_bulk(order_id, oc, order_items, ingredient_requirements, payment, ledger_token=None):
+    """Non-transactional path: bulk conditional deduction with compensating rollback."""
+    insufficient, stock_docs = await _check_stock(ingredient_requirements, location_id=oc.location_id)
+    if insufficient:
+        raise OrderRejected("insufficient_stock", insufficient)
+
+    try:
+        deduction_token, insufficient = await _deduct_stock(ingredient_requirements, location_id=oc.location_id)
+    except Exception as e:
+        logger.exception("Unexpected error during stock deduction: %s", e)
+        raise OrderRejected("stock_update_failed", str(e))
+    if insufficient:
+        raise OrderRejected("insufficient_stock", insufficient)
+
+    try:
+        order_doc = _new_order_doc(order_id, oc, order_items, payment, ledger_token)
+        await db.orders.insert_one(dict(order_doc))
+    except Exception as e:
+        # compensate the deduction so failed inserts don't leak stock
+        await _rollback_stock(ingredient_requirements, location_id=oc.location_id)
+        ref = {"company_id": oc.company_id, "location_id": oc.location_id, "ref_type": "deduction", "ref_id": deduction_token}
+        movement_log.record_many(db, {sid: -need for sid, need in ingredient_requirements.items()}, "sale", **ref)
+        movement_log.record_many(db, ingredient_requirements, "rollback", **ref)
+        logger.exception("Failed to insert order: %s", e)
+        raise OrderRejected("order_insert_failed", str(e))
+    return order_doc, stock_docs
+
+
+async def place_order(oc: OrderCreate, payment: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Single order pipeline behind /pos/order and /pos/order-pay."""
+    menu = await recipe_table.resolve(db, [it.menu_item_id for it in oc.items])
+    order_items, ingredient_requirements = _build_order_lines(oc.items, menu)
+
+    # hot ingredients are reserved in the inventory ledger; the rest go to stok_urun directly.
+    # The ledger only tracks the unassigned pool, so location orders bypass it.
+    if oc.location_id is None:
+        hot, ingredient_requirements = inventory_ledger.split(ingredient_requirements)
+    else:
+        hot = {}
+    ledger_token, insufficient = await inventory_ledger.reserve(db, hot, link=ORDER_LEDGER_LINK)
+    if insufficient:
+        return {"success": False, "error": "insufficient_stock", "details": insufficient}
+
+    order_doc = None
+    stock_docs: Dict[int, Dict[str, Any]] = {}
+    try:
+        # ids are unique and increasing, not dense: a rejected or failed order skips its id.
+        # The fallback below reuses it, so falling back costs no extra gap.
+        order_id = await allocate_ids("orders")
+        if await detect_transaction_support():
+            try:
+                order_doc, stock_docs = await _place_order_transactional(order_id, oc, order_items, ingredient_requirements, payment, ledger_token)
+            except OrderRejected:
+                raise
+            except Exception as tx_e:
+                if getattr(tx_e, "has_error_label", None) and tx_e.has_error_label("UnknownTransactionCommitResult"):
+                    # the commit may have succeeded; retrying on the other path could double-deduct
+                    logger.exception("Order transaction commit result unknown")
+                    raise OrderRejected("stock_update_failed", str(tx_e), outcome_unknown=True)
+                logger.info("Transaction failed, falling back to non-transactional flow: %s", tx_e)
+        if order_doc is None:
+            order_doc, stock_docs = await _place_order_bulk(order_id, oc, order_items, ingredient_requirements, payment, ledger_token)
+    except OrderRejected as rejected:
+        if not rejected.outcome_unknown:
+            # otherwise the ledger's reconcile looks for the order and settles the reservation
+            await inventory_ledger.release(db, ledger_token, hot)
+        return {"success": False, "error": rejected.error, "details": rejected.details}
+    except Exception:
+        await inventory_ledger.release(db, ledger_token, hot)
+        raise
+
+    try:
+        await inventory_ledger.commit(db, ledger_token, hot, order_doc["id"])
+    except Exception:
+        # the order carries the token: the ledger's reconcile commits the reservation later
+        logger.exception("Failed to commit ledger reservation for order %s", order_doc["id"])
+
+    _record_sale(order_doc, {**hot, **ingredient_requirements})
+    # the stock read before the conditional deduction, minus what it took
+    levels = {sid: _pool_quantity(stock_docs[sid], oc.location_id) - need for sid, need in ingredient_requirements.items() if sid in stock_docs}
+    await _observe_low_stock(stock_docs, levels, oc.location_id, hot)
+    await _after_order_created(order_doc)
+    return {"success": True, "order": order_doc}
+
+
+def _record_sale(order_doc: Dict[str, Any], requirements: Dict[int, float]) -> None:
+    """Append the order's ingredient deductions (ledger-managed ones included) to the movement log."""
+    movement_log.record_many(
+        db, {sid: -need for sid, need in requirements.items()}, "sale",
+        company_id=order_doc.get("company_id"), location_id=order_doc.get("location_id"), ref_type="order", ref_id=order_doc["id"],
+    )
+
+
+async def _observe_low_stock(stock_docs: Dict[int, Dict[str, Any]], levels: Dict[int, float], location_id: Optional[int] = None, hot=()) -> None:
+    """Report post-deduction pool levels to the low-stock tracker; ledger-managed ones come from the ledger."""
+    try:
+        low_stock.remember(stock_docs.values())
+        levels = {**levels, **await inventory_ledger.available_many(hot)}
+        await low_stock.observe(db, levels, location_id)
+    except Exception:
+        logger.exception("Low-stock check failed")
+
+
+async def _after_order_created(order_doc: Dict[str, Any], print_ticket: bool = True) -> None:
+    """Rollups, events and printing for a stored order; all best-effort."""
+    try:
+        await sales_rollups.record_order(db, order_doc)
+    except Exception:
+        # the rollup rebuild job recovers missed increments
+        logger.exception("Failed to update sales rollup for order %s", order_doc["id"])
+
+    try:
+        await table_board.order_opened(db, order_doc)
+    except Exception:
+        logger.exception("Failed to update table board for order %s", order_doc["id"])
+
+    await publish_order_event("order.created", order_doc)
+    if order_doc["status"] == "paid":
+        await publish_order_event("order.paid", order_doc)
+
+    if print_ticket:
+        # Queue the print best-effort; never blocks on the printer
+        await _trigger_print(order_doc)
+
+
+# --- Offline bulk sync ---
+BULK_SYNC_MAX_ORDERS = 500
+
+
+class BulkOrderEntry(OrderCreate):
+    client_order_id: str
+    client_created_at: Optional[str] = None
+    payment: Optional[Dict[str, Any]] = None
+
+
+class BulkOrdersRequest(BaseModel):
+    orders: List[BulkOrderEntry]
+    print_tickets: bool = False
+
+
+def _client_timestamp(value: Optional[str]) -> Optional[str]:
+    if not value:
+        return None
+    try:
+        ts = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(timezone.utc).isoformat()
+
+
+async def _place_individually(entries: List[BulkOrderEntry], results: Dict[str, Dict[str, Any]]) -> None:
+    for e in entries:
+        single = await place_order(OrderCreate(**e.model_dump(include=set(OrderCreate.model_fields))), e.payment)
+        if single["success"]:
+            await db.orders.update_one({"id": single["order"]["id"]}, {"$set": {"client_order_id": e.client_order_id}})
+            results[e.client_order_id] = {"client_order_id": e.client_order_id, "status": "created", "order_id": single["order"]["id"]}
+        else:
+            results[e.client_order_id] = {"client_order_id": e.client_order_id, "status": "rejected", "error": single["error"], "details": single["details"]}
+
+
+async def place_orders_bulk(entries: List[BulkOrderEntry], print_tickets: bool = False) -> List[Dict[str, Any]]:
+    """Replay a terminal's offline backlog.
+
+    Orders already stored (same client_order_id) are reported as duplicates.
+    The rest are checked against one stock read in client time order, the
+    accepted ones are deducted with one bulk_write and stored with one
+    insert_many. If the batch deduction loses a race with live traffic, the
+    accepted orders fall back to the single-order pipeline one by one, as do
+    orders drawing from an inventory location.
+    """
+    results: Dict[str, Dict[str, Any]] = {}
+    ids = [e.client_order_id for e in entries]
+    existing = await db.orders.find({"client_order_id": {"$in": ids}}, {"_id": 0, "id": 1, "client_order_id": 1}).to_list(None)
+    for o in existing:
+        results[o["client_order_id"]] = {"client_order_id": o["client_order_id"], "status": "duplicate", "order_id": o["id"]}
+
+    pending: List[BulkOrderEntry] = []
+    for e in entries:
+        if e.client_order_id in results or any(p.client_order_id == e.client_order_id for p in pending):
+            results.setdefault(e.client_order_id, {"client_order_id": e.client_order_id, "status": "duplicate", "order_id": None})
+            continue
+        pending.append(e)
+    pending.sort(key=lambda e: _client_timestamp(e.client_created_at) or "")
+    located = [e for e in pending if e.location_id is not None]
+    pending = [e for e in pending if e.location_id is None]
+
+    menu = await recipe_table.resolve(db, [it.menu_item_id for e in pending for it in e.items])
+    lines: Dict[str, Any] = {}
+    total_reqs: Dict[int, float] = {}
+    for e in pending:
+        try:
+            order_items, reqs = _build_order_lines(e.items, menu)
+        except Exception as ex:
+            results[e.client_order_id] = {"client_order_id": e.client_order_id, "status": "rejected", "error": "invalid_items", "details": str(ex)}
+            continue
+        lines[e.client_order_id] = (order_items, reqs)
+        for sid, need in reqs.items():
+            total_reqs[sid] = total_reqs.get(sid, 0) + need
+
+    # walk the backlog against one stock snapshot; hot ingredients are checked by the ledger reserve below
+    _, cold_total = inventory_ledger.split(total_reqs)
+    _, stock_docs = await _check_stock(cold_total)
+    available = {sid: float(d.get("mevcut", d.get("min_stok", 0))) for sid, d in stock_docs.items()}
+    accepted: List[BulkOrderEntry] = []
+    batch_reqs: Dict[int, float] = {}
+    for e in pending:
+        if e.client_order_id not in lines:
+            continue
+        _, cold = inventory_ledger.split(lines[e.client_order_id][1])
+        short = [{"stok_urun_id": sid, "needed": need, "available": available.get(sid, 0.0)}
+                 for sid, need in cold.items() if available.get(sid, 0.0) < need]
+        if short:
+            results[e.client_order_id] = {"client_order_id": e.client_order_id, "status": "rejected", "error": "insufficient_stock", "details": short}
+            continue
+        for sid, need in cold.items():
+            available[sid] -= need
+        for sid, need in lines[e.client_order_id][1].items():
+            batch_reqs[sid] = batch_reqs.get(sid, 0) + need
+        accepted.append(e)
+
+    hot, cold_batch = inventory_ledger.split(batch_reqs)
+    # one ledger reservation per order, so each can be settled against its own order document
+    hot_parts = [inventory_ledger.split(lines[e.client_order_id][1])[0] for e in accepted]
+    ledger_tokens, hot_short = await inventory_ledger.reserve_many(db, [(part, ORDER_LEDGER_LINK) for part in hot_parts])
+    token, cold_short = (None, [])
+    if not hot_short:
+        token, cold_short = await _deduct_stock(cold_batch)
+        if cold_short:
+            await inventory_ledger.release_many(db, list(zip(ledger_tokens, hot_parts)))
+    if hot_short or cold_short:
+        # live orders changed stock meanwhile: settle the accepted orders one by one
+        logger.info("Bulk stock deduction raced live orders; placing %s orders individually", len(accepted))
+        await _place_individually(accepted + located, results)
+        return [results[i] for i in dict.fromkeys(ids)]
+
+    next_id = await allocate_ids("orders", len(accepted)) if accepted else 0
+    docs = []
+    for n, e in enumerate(accepted):
+        order_doc = _new_order_doc(next_id + n, e, lines[e.client_order_id][0], e.payment, ledger_tokens[n])
+        client_ts = _client_timestamp(e.client_created_at)
+        if client_ts:
+            order_doc["created_at"] = client_ts
+            for p in order_doc["payments"]:
+                p["recorded_at"] = client_ts
+        order_doc["client_order_id"] = e.client_order_id
+        order_doc["synced_at"] = datetime.now(timezone.utc).isoformat()
+        docs.append(order_doc)
+
+    failed: set = set()
+    insert_unknown = False
+    if docs:
+        try:
+            await db.orders.insert_many([dict(d) for d in docs], ordered=False)
+        except BulkWriteError as bwe:
+            failed = {err["index"] for err in bwe.details.get("writeErrors", [])}
+            logger.warning("Bulk order insert: %s of %s orders not stored", len(failed), len(docs))
+        except Exception:
+            logger.exception("Bulk order insert failed")
+            failed = set(range(len(docs)))
+            insert_unknown = True
+
+    refund: Dict[int, float] = {}
+    for n, (e, order_doc) in enumerate(zip(accepted, docs)):
+        if n in failed:
+            for sid, need in lines[e.client_order_id][1].items():
+                refund[sid] = refund.get(sid, 0) + need
+            results[e.client_order_id] = {"client_order_id": e.client_order_id, "status": "rejected", "error": "order_insert_failed"}
+            continue
+        results[e.client_order_id] = {"client_order_id": e.client_order_id, "status": "created", "order_id": order_doc["id"]}
+    if refund:
+        _, cold_refund = inventory_ledger.split(refund)
+        # every batch deduction matched, so the failed orders' share can be re-credited as is
+        if cold_refund:
+            await _rollback_stock(cold_refund)
+            ref = {"ref_type": "deduction", "ref_id": token}
+            movement_log.record_many(db, {sid: -need for sid, need in cold_refund.items()}, "sale", **ref)
+            movement_log.record_many(db, cold_refund, "rollback", **ref)
+    settled = [(ledger_tokens[n], hot_parts[n]) for n in range(len(accepted))]
+    try:
+        if not insert_unknown:
+            # otherwise some orders may be stored: the ledger's reconcile checks each one
+            await inventory_ledger.release_many(db, [part for n, part in enumerate(settled) if n in failed])
+        await inventory_ledger.commit_many(db, [part for n, part in enumerate(settled) if n not in failed])
+    except Exception:
+        # every order carries its token: the ledger's reconcile settles what is left reserved
+        logger.exception("Failed to settle ledger reservations for bulk sync")
+
+    for n, (e, order_doc) in enumerate(zip(accepted, docs)):
+        if n not in failed:
+            _record_sale(order_doc, lines[e.client_order_id][1])
+            await _after_order_created(order_doc, print_ticket=print_tickets)
+    refunded = cold_refund if refund else {}
+    levels = {sid: available[sid] + refunded.get(sid, 0) for sid in cold_batch if sid in available}
+    await _observe_low_stock(stock_docs, levels, hot=hot)
+    await _place_individually(located, results)
+    return [results[i] for i in dict.fromkeys(ids)]
 
 
 @api_router.post("/pos/menu-item")
@@ -77,32 +642,63 @@ async def create_menu_item(payload: MenuItemCreate):
         "category_id": int(payload.category_id) if payload.category_id is not None else None,
         "recipe": payload.recipe or [],
         "active": bool(payload.active),
+        "barcode": payload.barcode,
+        "sku": payload.sku,
         "created_at": datetime.now(timezone.utc).isoformat(),
     }
     await db.menu_items.insert_one(doc)
+    await _catalog_changed(menu=True)
     return doc
 
 
+@api_router.put("/pos/menu-item/{menu_item_id}")
+async def update_menu_item(menu_item_id: int, payload: MenuItemUpdate):
+    update = {k: v for k, v in payload.dict().items() if v is not None}
+    if "price" in update:
+        update["price"] = float(update["price"])
+    if not update:
+        raise Exception("No fields to update")
+    await db.menu_items.update_one({"id": menu_item_id}, {"$set": update})
+    await _catalog_changed(menu=True)
+    return await db.menu_items.find_one({"id": menu_item_id}, {"_id": 0})
+
+
 @api_router.get("/pos/menu-items")
-async def list_menu_items(search: Optional[str] = None, category_id: Optional[int] = None, kiosk: Optional[bool] = None):
-    """List menu items with optional filters: search (text or regex on name), category_id, kiosk flag."""
-    q = {}
+async def list_menu_items(search: Optional[str] = None, category_id: Optional[int] = None, kiosk: Optional[bool] = None, limit: int = 20):
+    """List menu items with optional filters: search (Turkish-aware prefix/fuzzy on name), category_id, kiosk flag.
+
+    Served from the in-memory catalog snapshot; `limit` applies to search results.
+    """
+    await catalog.ensure_fresh(db)
+    if search:
+        if menu_index.version != catalog.revision:
+            menu_index.build(catalog.items("menu_items"), catalog.revision)
+        return menu_index.search(search, category_id=category_id, kiosk=kiosk, limit=max(1, min(limit, 100)))
+
+    items = catalog.items("menu_items")
     if category_id is not None:
-        q['category_id'] = int(category_id)
+        items = [m for m in items if m.get("category_id") == int(category_id)]
     if kiosk is not None:
         # kiosk may be stored as boolean field 'kiosk' or 'kiosk_featured'
-        q['$or'] = [{'kiosk': bool(kiosk)}, {'kiosk_featured': bool(kiosk)}]
-    if search:
-        # try text search if index exists, otherwise fallback to case-insensitive regex
-        try:
-            q['$text'] = {'$search': search}
-        except Exception:
-            q['name'] = {'$regex': search, '$options': 'i'}
-
-    items = await db.menu_items.find(q).to_list(None)
+        items = [m for m in items if m.get("kiosk") == bool(kiosk) or m.get("kiosk_featured") == bool(kiosk)]
     return items
 
 
+@api_router.get("/pos/catalog")
+async def get_catalog(request: Request, since: Optional[str] = None):
+    """Versioned POS catalog (menu items, categories, zones, tables) served from memory.
+
+    Without `since` (or with a version this worker can't diff from) the full
+    snapshot is returned; otherwise only the changes after `since`. The ETag is
+    the snapshot version, so an unchanged catalog answers 304.
+    """
+    await catalog.ensure_fresh(db)
+    etag = f'"{catalog.token}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(catalog.delta(since), headers={"ETag": etag})
+
+
 # --- Categories endpoints ---
 @api_router.post("/pos/categories")
 async def create_category(payload: Dict[str, Any]):
@@ -112,13 +708,14 @@ async def create_category(payload: Dict[str, Any]):
     next_id = await get_next_id("pos_categories")
     doc = {"id": next_id, "name": name, "created_at": datetime.now(timezone.utc).isoformat()}
     await db.pos_categories.insert_one(doc)
+    await _catalog_changed()
     return doc
 
 
 @api_router.get("/pos/categories")
 async def list_categories():
-    cats = await db.pos_categories.find({}).to_list(None)
-    return cats
+    await catalog.ensure_fresh(db)
+    return catalog.items("categories")
 
 
 @api_router.put("/pos/categories/{category_id}")
@@ -127,6 +724,7 @@ async def update_category(category_id: int, payload: Dict[str, Any]):
     if not name:
         raise Exception("Category name required")
     await db.pos_categories.update_one({"id": category_id}, {"$set": {"name": name}})
+    await _catalog_changed()
     return await db.pos_categories.find_one({"id": category_id})
 
 
@@ -135,6 +733,7 @@ async def delete_category(category_id: int):
     await db.pos_categories.delete_one({"id": category_id})
     # Optionally unset category_id on menu items
     await db.menu_items.update_many({"category_id": category_id}, {"$set": {"category_id": None}})
+    await _catalog_changed(menu=True)
     return {"deleted": True}
 
 
@@ -147,19 +746,21 @@ async def create_zone(payload: Dict[str, Any]):
     next_id = await get_next_id("pos_zones")
     doc = {"id": next_id, "name": name, "created_at": datetime.now(timezone.utc).isoformat()}
     await db.pos_zones.insert_one(doc)
+    await _catalog_changed()
     return doc
 
 
 @api_router.get("/pos/zones")
 async def list_zones():
-    zones = await db.pos_zones.find({}).to_list(None)
-    return zones
+    await catalog.ensure_fresh(db)
+    return catalog.items("zones")
 
 
 @api_router.put("/pos/zones/{zone_id}")
 async def update_zone(zone_id: int, payload: Dict[str, Any]):
     name = payload.get("name")
     await db.pos_zones.update_one({"id": zone_id}, {"$set": {"name": name}})
+    await _catalog_changed()
     return await db.pos_zones.find_one({"id": zone_id})
 
 
@@ -168,6 +769,7 @@ async def delete_zone(zone_id: int):
     await db.pos_zones.delete_one({"id": zone_id})
     # unset zone on tables
     await db.pos_tables.update_many({"zone_id": zone_id}, {"$set": {"zone_id": None}})
+    await _catalog_changed()
     return {"deleted": True}
 
 
@@ -180,13 +782,14 @@ async def create_table(payload: Dict[str, Any]):
     next_id = await get_next_id("pos_tables")
     doc = {"id": next_id, "name": name, "zone_id": int(zone_id) if zone_id else None, "created_at": datetime.now(timezone.utc).isoformat()}
     await db.pos_tables.insert_one(doc)
+    await _catalog_changed()
     return doc
 
 
 @api_router.get("/pos/tables")
 async def list_tables():
-    tables = await db.pos_tables.find({}).to_list(None)
-    return tables
+    await catalog.ensure_fresh(db)
+    return catalog.items("tables")
 
 
 @api_router.put("/pos/tables/{table_id}")
@@ -197,15 +800,105 @@ async def update_table(table_id: int, payload: Dict[str, Any]):
     if "zone_id" in payload:
         update["zone_id"] = int(payload.get("zone_id")) if payload.get("zone_id") is not None else None
     await db.pos_tables.update_one({"id": table_id}, {"$set": update})
+    await _catalog_changed()
     return await db.pos_tables.find_one({"id": table_id})
 
 
 @api_router.delete("/pos/tables/{table_id}")
 async def delete_table(table_id: int):
     await db.pos_tables.delete_one({"id": table_id})
+    await _catalog_changed()
     return {"deleted": True}
 
 
+# --- Inventory locations & scanning ---
+class StockTransfer(BaseModel):
+    stok_urun_id: int
+    quantity: float
+    # None is the unassigned `mevcut` pool
+    from_location_id: Optional[int] = None
+    to_location_id: Optional[int] = None
+
+
+@api_router.post("/pos/locations")
+async def create_location(payload: Dict[str, Any]):
+    name = payload.get("name")
+    if not name:
+        raise HTTPException(status_code=400, detail="Location name required")
+    next_id = await get_next_id("pos_inventory_locations")
+    doc = {"id": next_id, "name": name, "company_id": int(payload.get("company_id") or 1), "created_at": datetime.now(timezone.utc).isoformat()}
+    await db.pos_inventory_locations.insert_one(dict(doc))
+    return doc
+
+
+@api_router.get("/pos/locations")
+async def list_locations(company_id: int = 1):
+    return await db.pos_inventory_locations.find({"company_id": company_id}, {"_id": 0}).sort("id", 1).to_list(None)
+
+
+@api_router.post("/pos/stock/transfer")
+async def transfer_stock(payload: StockTransfer):
+    """Move stock of one ingredient between the unassigned pool and inventory locations."""
+    if payload.quantity <= 0 or payload.from_location_id == payload.to_location_id:
+        raise HTTPException(status_code=400, detail="Transfer needs a positive quantity and two different pools")
+    sid, qty = payload.stok_urun_id, payload.quantity
+    src, dst = _stock_field(payload.from_location_id), _stock_field(payload.to_location_id)
+    ledger_managed = bool(inventory_ledger.split({sid: qty})[0])
+
+    if payload.from_location_id is None and ledger_managed:
+        # the ledger owns this ingredient's unassigned pool: take it there, the flush writes `mevcut` back
+        token, short = await inventory_ledger.reserve(db, {sid: qty}, link=LEDGER_STOCK_LINK)
+        if short:
+            raise HTTPException(status_code=409, detail={"error": "insufficient_stock", "details": short})
+        try:
+            result = await db.stok_urun.update_one({"id": sid}, {"$inc": {dst: qty}, "$addToSet": {LEDGER_REF_FIELD: token}})
+        except Exception:
+            await inventory_ledger.release(db, token, {sid: qty})
+            raise
+        if not result.matched_count:
+            await inventory_ledger.release(db, token, {sid: qty})
+            raise HTTPException(status_code=404, detail="Stock item not found")
+        await inventory_ledger.commit(db, token, {sid: qty})
+    else:
+        credit = None
+        update: Dict[str, Any] = {"$inc": {src: -qty, dst: qty}}
+        if payload.to_location_id is None and ledger_managed:
+            # the counter takes the credit, `mevcut` gets it from the flush; the tag tells a reconcile the move happened
+            credit = await inventory_ledger.stage_credit(db, sid, qty)
+            update = {"$inc": {src: -qty}, "$addToSet": {LEDGER_REF_FIELD: credit}}
+        result = await db.stok_urun.update_one({"id": sid, src: {"$gte": qty}}, update)
+        if not result.modified_count:
+            if credit:
+                await inventory_ledger.discard_credit(db, credit)
+            insufficient, docs = await _check_stock({sid: qty}, location_id=payload.from_location_id)
+            if sid not in docs:
+                raise HTTPException(status_code=404, detail="Stock item not found")
+            raise HTTPException(status_code=409, detail={"error": "insufficient_stock", "details": insufficient})
+        if credit:
+            await inventory_ledger.commit_credit(db, credit, sid, qty)
+
+    ref = {"ref_type": "transfer", "ref_id": uuid.uuid4().hex}
+    movement_log.record(db, sid, "transfer", delta=-qty, location_id=payload.from_location_id, **ref)
+    movement_log.record(db, sid, "transfer", delta=qty, location_id=payload.to_location_id, **ref)
+    scan_index.invalidate_stock()
+    return {"success": True, "stok_urun_id": sid, "quantity": qty,
+            "from_location_id": payload.from_location_id, "to_location_id": payload.to_location_id}
+
+
+@api_router.get("/pos/scan/{code}")
+async def scan_code(code: str, location_id: Optional[int] = None, company_id: int = 1):
+    """Resolve a barcode or SKU to a menu item or ingredient and its stock, from memory."""
+    await catalog.ensure_fresh(db)
+    if scan_index.version != catalog.revision:
+        scan_index.build(catalog.items("menu_items"), catalog.revision)
+    await scan_index.ensure_stock(db)
+    live = await inventory_ledger.available_many(scan_index.stock_ids(code, company_id)) if inventory_ledger.enabled else {}
+    hit = scan_index.lookup(code, location_id, live=live.get, company_id=company_id)
+    if hit is None:
+        raise HTTPException(status_code=404, detail="Unknown barcode or SKU")
+    return hit
+
+
 # --- Demo seed for POS ---
 @api_router.post("/pos/seed-demo")
 async def seed_pos_demo():
@@ -246,204 +939,243 @@ async def seed_pos_demo():
         {"id": 4, "name": "S2", "zone_id": 2},
     ]
     await db.pos_tables.insert_many(tables)
+    await _catalog_changed(menu=True)
 
     return {"seeded": True}
 
 
-@api_router.post("/pos/order")
-async def create_order(payload: OrderCreate):
-    # Build full item records (price/name) and compute required ingredient totals
-    menu_item_ids = [it.menu_item_id for it in payload.items]
-    menu_docs = await db.menu_items.find({"id": {"$in": menu_item_ids}}).to_list(None)
-    menu_map = {m["id"]: m for m in menu_docs}
+async def _idempotent(response: Response, idempotency_key: Optional[str], scope: str, body: Any, handler):
+    """Run an order handler once per Idempotency-Key; retries get the stored response."""
+    if not idempotency_key:
+        return await handler()
+    result, replayed = await run_idempotent(db, scope, idempotency_key, body, handler)
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
 
-    order_items = []
-    ingredient_requirements = {}  # stok_urun_id -> total quantity needed
 
-    for it in payload.items:
-        m = menu_map.get(it.menu_item_id)
-        if not m or not m.get("active", True):
-            raise Exception(f"Menu item {it.menu_item_id} not found or inactive")
+@api_router.post("/pos/order")
+async def create_order(payload: OrderCreate, response: Response, idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    return await _idempotent(response, idempotency_key, "pos_order", payload.model_dump(), lambda: place_order(payload))
 
-        qty = int(it.quantity or 1)
-        order_items.append({"menu_item_id": m["id"], "name": m.get("name"), "price": float(m.get("price", 0)), "quantity": qty})
 
-        # accumulate ingredients from recipe if present
-        recipe = m.get("recipe") or []
-        for ingredient in recipe:
-            sid = int(ingredient.get("stok_urun_id"))
-            need = float(ingredient.get("quantity", 0)) * qty
-            ingredient_requirements[sid] = ingredient_requirements.get(sid, 0) + need
+@api_router.post("/pos/orders/bulk")
+async def create_orders_bulk(payload: BulkOrdersRequest):
+    """Sync a batch of client-stamped offline orders; returns one result per client_order_id.
 
-    # Check stock availability for all required stok_urun
-    insufficient = []
-    for sid, need in ingredient_requirements.items():
-        doc = await db.stok_urun.find_one({"id": sid})
-        current = float(doc.get("mevcut", doc.get("min_stok", 0))) if doc else 0
-        if current < need:
-            insufficient.append({"stok_urun_id": sid, "needed": need, "available": current})
+    Re-sending a batch is safe: orders whose client_order_id is already stored
+    come back as "duplicate" with their order id.
+    """
+    if len(payload.orders) > BULK_SYNC_MAX_ORDERS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_SYNC_MAX_ORDERS} orders per batch")
+    results = await place_orders_bulk(payload.orders, print_tickets=payload.print_tickets)
+    counts: Dict[str, int] = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    return {"results": results, **counts}
 
-    if insufficient:
-        return {"success": False, "error": "insufficient_stock", "details": insufficient}
 
+@api_router.get("/pos/order/{order_id}")
+async def get_order(order_id: int):
+    o = await db.orders.find_one({"id": order_id}, {"_id": 0})
+    if not o:
+        raise Exception("Order not found")
+    return o
 
-        # Try to perform stock checks, deductions and order insert in a DB transaction
-        # If the MongoDB deployment doesn't support transactions (non-replica set), fall back
-        # to conditional updates with rollback logic below.
-        try:
-            async with client.start_session() as session:
-                async with session.start_transaction():
-                    # check availability inside transaction
-                    for sid, need in ingredient_requirements.items():
-                        doc = await db.stok_urun.find_one({"id": sid}, session=session)
-                        current = float(doc.get("mevcut", doc.get("min_stok", 0))) if doc else 0
-                        if current < need:
-                            raise RuntimeError(f"insufficient_stock_for_{sid}")
-
-                    # deduct stock inside transaction
-                    for sid, need in ingredient_requirements.items():
-                        res = await db.stok_urun.update_one({"id": sid, "mevcut": {"$gte": need}}, {"$inc": {"mevcut": -need}}, session=session)
-                        if res.modified_count == 0:
-                            raise RuntimeError(f"concurrent_update_failed_for_{sid}")
-
-                    # generate next id atomically within transaction
-                    last = await db.orders.find_one({}, sort=[("id", -1)], session=session)
-                    next_id = (last["id"] + 1) if last and "id" in last else 1
-                    adisyon_no = next_id
-                    total = _compute_order_total(order_items)
-
-                    order_doc = {
-                        "id": next_id,
-                        "adisyon_no": adisyon_no,
-                        "company_id": int(payload.company_id or 1),
-                        "table": payload.table,
-                        "customer": payload.customer,
-                        "items": order_items,
-                        "total": total,
-                        "note": payload.note,
-                        "status": "open",
-                        "created_at": datetime.now(timezone.utc).isoformat(),
-                        "payments": []
-                    }
-
-                    await db.orders.insert_one(order_doc, session=session)
-
-            # Transaction committed successfully
-            try:
-                _trigger_print(order_doc)
-            except Exception:
-                logger.exception("Printing failed for order %s", order_doc.get("id"))
-
-            return {"success": True, "order": order_doc}
-        except Exception as tx_e:
-            # Transaction not available or failed — log and fall back to previous approach
-            logger.info("Transaction failed or not supported, falling back to non-transactional flow: %s", tx_e)
-
-        # Fallback: Check stock availability for all required stok_urun
-        insufficient = []
-        for sid, need in ingredient_requirements.items():
-            doc = await db.stok_urun.find_one({"id": sid})
-            current = float(doc.get("mevcut", doc.get("min_stok", 0))) if doc else 0
-            if current < need:
-                insufficient.append({"stok_urun_id": sid, "needed": need, "available": current})
-
-        if insufficient:
-            return {"success": False, "error": "insufficient_stock", "details": insufficient}
-
-        # Deduct stock with conditional updates to avoid negative inventory.
-        # If any conditional update fails, roll back prior updates in this loop.
-        updated_sides = []  # list of (sid, amount) we have decremented
-        try:
-            for sid, need in ingredient_requirements.items():
-                res = await db.stok_urun.update_one({"id": sid, "mevcut": {"$gte": need}}, {"$inc": {"mevcut": -need}})
-                if res.modified_count == 0:
-                    # failed to decrement (concurrent change or insufficient stock)
-                    insufficient.append({"stok_urun_id": sid, "needed": need, "available": (await db.stok_urun.find_one({"id": sid}) or {}).get("mevcut", 0)})
-                    raise RuntimeError("insufficient_or_concurrent_update")
-                updated_sides.append((sid, need))
-        except Exception as e:
-            # Rollback any decremented stock for this order
-            if updated_sides:
-                for sid, amt in updated_sides:
-                    try:
-                        await db.stok_urun.update_one({"id": sid}, {"$inc": {"mevcut": amt}})
-                    except Exception:
-                        logger.exception("Failed to rollback stock for %s after order failure", sid)
-            if insufficient:
-                return {"success": False, "error": "insufficient_stock", "details": insufficient}
-            # unexpected error
-            logger.exception("Unexpected error during stock deduction: %s", e)
-            return {"success": False, "error": "stock_update_failed", "details": str(e)}
-
-        # Create order record
-        next_id = await get_next_id("orders")
-        adisyon_no = next_id
-        total = _compute_order_total(order_items)
-
-        order_doc = {
-            "id": next_id,
-            "adisyon_no": adisyon_no,
-            "company_id": int(payload.company_id or 1),
-            "table": payload.table,
-            "customer": payload.customer,
-            "items": order_items,
-            "total": total,
-            "note": payload.note,
-            "status": "open",
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "payments": []
-        }
-
-        await db.orders.insert_one(order_doc)
-    # Create order record
-    next_id = await get_next_id("orders")
-    adisyon_no = next_id
-    total = _compute_order_total(order_items)
 
-    order_doc = {
-        "id": next_id,
-        "adisyon_no": adisyon_no,
-        "company_id": int(payload.company_id or 1),
-        "table": payload.table,
-        "customer": payload.customer,
-        "items": order_items,
-        "total": total,
-        "note": payload.note,
-        "status": "open",
-        "created_at": datetime.now(timezone.utc).isoformat(),
-        "payments": []
-    }
+def _encode_order_cursor(order: Dict[str, Any]) -> str:
+    raw = json.dumps([order.get("created_at"), order.get("id")]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
 
-    await db.orders.insert_one(order_doc)
 
-    # Trigger print asynchronously / best-effort
+def _decode_order_cursor(cursor: str):
     try:
-        _trigger_print(order_doc)
+        created_at, order_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return created_at, int(order_id)
     except Exception:
-        logger.exception("Printing failed for order %s", order_doc.get("id"))
-
-    return {"success": True, "order": order_doc}
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 
-@api_router.get("/pos/order/{order_id}")
-async def get_order(order_id: int):
-    o = await db.orders.find_one({"id": order_id})
+def _time_bound(value: str, end: bool = False) -> str:
+    """ISO bound for created_at; a bare date as `end` covers that whole day."""
+    try:
+        if len(value) == 10:
+            day = datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+            return (day + timedelta(days=1) if end else day).isoformat()
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat()
+
+
+@api_router.get("/pos/orders")
+async def list_orders(
+    company_id: int = 1,
+    status: Optional[str] = None,
+    table: Optional[str] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    limit: int = 50,
+    cursor: Optional[str] = None,
+):
+    """Orders newest first, filtered by company, status (comma list), table and created_at window.
+
+    Pages with an opaque cursor over (created_at, id) so every page is an index
+    range scan; pass `next_cursor` from the previous page to continue.
+    """
+    limit = max(1, min(limit, 200))
+    q: Dict[str, Any] = {"company_id": company_id}
+    if status:
+        statuses = [s.strip() for s in status.split(",") if s.strip()]
+        q["status"] = statuses[0] if len(statuses) == 1 else {"$in": statuses}
+    if table:
+        q["table"] = table
+    window: Dict[str, str] = {}
+    if date_from:
+        window["$gte"] = _time_bound(date_from)
+    if date_to:
+        window["$lt"] = _time_bound(date_to, end=True)
+    if window:
+        q["created_at"] = window
+    if cursor:
+        created_at, last_id = _decode_order_cursor(cursor)
+        q["$or"] = [{"created_at": {"$lt": created_at}}, {"created_at": created_at, "id": {"$lt": last_id}}]
+
+    orders = await db.orders.find(q, {"_id": 0}).sort([("created_at", -1), ("id", -1)]).limit(limit + 1).to_list(None)
+    next_cursor = _encode_order_cursor(orders[limit - 1]) if len(orders) > limit else None
+    return {"orders": orders[:limit], "next_cursor": next_cursor}
+
+
+class PaymentCreate(BaseModel):
+    method: str
+    amount: float
+    details: Optional[Dict[str, Any]] = None
+
+
+async def _load_order(order_id: int) -> Dict[str, Any]:
+    o = await db.orders.find_one({"id": order_id}, {"_id": 0})
     if not o:
-        raise Exception("Order not found")
+        raise HTTPException(status_code=404, detail="Order not found")
     return o
 
 
+@api_router.post("/pos/order/{order_id}/pay")
+async def pay_order(order_id: int, payload: PaymentCreate):
+    """Record a payment on an existing order; a payment that covers the total marks it paid.
+
+    The payment is pushed atomically and whether it settles the order is
+    decided from the payments the push returns, so concurrent payments never
+    work from a stale sum. Only the request whose conditional open -> paid
+    update matches reports the order as paid.
+    """
+    payment = {
+        "method": payload.method,
+        "amount": float(payload.amount),
+        "details": payload.details or {},
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+    }
+    o = await db.orders.find_one_and_update(
+        {"id": order_id, "status": {"$in": ["open", "paid"]}},
+        {"$push": {"payments": payment}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+    if o is None:
+        o = await _load_order(order_id)
+        raise HTTPException(status_code=409, detail=f"Order is {o.get('status')}")
+
+    was_open = o.get("status") == "open"
+    paid = sum(float(p.get("amount", 0)) for p in o.get("payments") or [])
+    settles = False
+    if was_open and paid >= float(o.get("total", 0)) - 0.005:
+        result = await db.orders.update_one(
+            {"id": order_id, "status": "open"},
+            {"$set": {"status": "paid", "paid_at": payment["recorded_at"]}},
+        )
+        settles = bool(result.modified_count)
+
+    try:
+        await sales_rollups.record_payment(db, o.get("company_id"), payment)
+    except Exception:
+        logger.exception("Failed to update sales rollup for payment on order %s", order_id)
+    try:
+        if was_open:
+            await table_board.payment_added(db, o, payment["amount"])
+            if settles:
+                await table_board.order_closed(db, o)
+    except Exception:
+        logger.exception("Failed to update table board for order %s", order_id)
+
+    if settles:
+        o["status"] = "paid"
+        o["paid_at"] = payment["recorded_at"]
+        await publish_order_event("order.paid", o)
+    return {"success": True, "order": o}
+
+
+@api_router.post("/pos/order/{order_id}/close")
+async def close_order(order_id: int):
+    """Close an adisyon (settled elsewhere, comped or abandoned) and free its table."""
+    o = await _load_order(order_id)
+    if o.get("status") == "closed":
+        return {"success": True, "order": o}
+    closed_at = datetime.now(timezone.utc).isoformat()
+    await db.orders.update_one({"id": order_id}, {"$set": {"status": "closed", "closed_at": closed_at}})
+    try:
+        if o.get("status") == "open":
+            await table_board.order_closed(db, o)
+    except Exception:
+        logger.exception("Failed to update table board for order %s", order_id)
+    o.update({"status": "closed", "closed_at": closed_at})
+    await publish_order_event("order.closed", o)
+    return {"success": True, "order": o}
+
+
+@api_router.get("/pos/table-board")
+async def get_table_board(company_id: int = 1):
+    """Every POS table with its open adisyons (order ids, items, total, paid, balance, opened_at)."""
+    await catalog.ensure_fresh(db)
+    states = {s["table"]: s for s in await table_board.board(db, company_id)}
+    tables = []
+    for t in catalog.items("tables"):
+        state = states.pop(t.get("name"), None)
+        entry = {"id": t.get("id"), "name": t.get("name"), "zone_id": t.get("zone_id"), "status": "occupied" if state else "free"}
+        if state:
+            entry.update({k: v for k, v in state.items() if k not in ("table", "company_id")})
+        tables.append(entry)
+    # tables typed free-hand on an order, not in the floor plan
+    for name, state in states.items():
+        tables.append({"id": None, "name": name, "zone_id": None, "status": "occupied",
+                       **{k: v for k, v in state.items() if k not in ("table", "company_id")}})
+    return {"company_id": company_id, "open_tables": sum(1 for t in tables if t["status"] == "occupied"), "tables": tables}
+
+
+@api_router.post("/pos/table-board/rebuild")
+async def rebuild_table_board(company_id: Optional[int] = None):
+    """Recompute the table projection from open orders."""
+    return {"tables": await table_board.rebuild(db, company_id)}
+
+
 @api_router.post("/pos/print/{order_id}")
 async def print_order(order_id: int):
     o = await db.orders.find_one({"id": order_id})
     if not o:
         return {"success": False, "error": "not_found"}
-    ok = _trigger_print(o)
-    return {"success": bool(ok)}
+    job = await _trigger_print(o)
+    return {"success": job is not None, "job": job}
+
+
+@api_router.get("/pos/print/{order_id}")
+async def get_print_status(order_id: int):
+    """Print jobs for the order, oldest first (status: queued, printing, retrying, printed, logged, dead)."""
+    jobs = await print_status(db, order_id)
+    return {"order_id": order_id, "status": jobs[-1]["status"] if jobs else None, "jobs": jobs}
 
 
 @api_router.post("/pos/order-pay")
-async def create_order_and_pay(payload: Dict[str, Any]):
+async def create_order_and_pay(payload: Dict[str, Any], response: Response, idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
     """Create an order and immediately record a payment.
 
     Expected payload: { "order": { ...OrderCreate... }, "payment": { "method": "cash"|"card"|..., "amount": float, "details": {...} }}
@@ -453,91 +1185,150 @@ async def create_order_and_pay(payload: Dict[str, Any]):
     if not order_payload:
         raise Exception("order payload required")
 
-    oc = OrderCreate(**order_payload)
-
-    # Build full item records and ingredient requirements
-    menu_item_ids = [it.get("menu_item_id") for it in oc.items]
-    menu_docs = await db.menu_items.find({"id": {"$in": menu_item_ids}}).to_list(None)
-    menu_map = {m["id"]: m for m in menu_docs}
+    return await _idempotent(
+        response, idempotency_key, "pos_order_pay", payload,
+        lambda: place_order(OrderCreate(**order_payload), payment),
+    )
 
-    order_items = []
-    ingredient_requirements = {}
-    for it in oc.items:
-        m = menu_map.get(int(it.get("menu_item_id")))
-        if not m or not m.get("active", True):
-            raise Exception(f"Menu item {it.get('menu_item_id')} not found or inactive")
-        qty = int(it.get("quantity" or 1))
-        order_items.append({"menu_item_id": m["id"], "name": m.get("name"), "price": float(m.get("price", 0)), "quantity": qty})
-        recipe = m.get("recipe") or []
-        for ingredient in recipe:
-            sid = int(ingredient.get("stok_urun_id"))
-            need = float(ingredient.get("quantity", 0)) * qty
-            ingredient_requirements[sid] = ingredient_requirements.get(sid, 0) + need
-
-    # Check stock
-    insufficient = []
-    for sid, need in ingredient_requirements.items():
-        doc = await db.stok_urun.find_one({"id": sid})
-        current = float(doc.get("mevcut", doc.get("min_stok", 0))) if doc else 0
-        if current < need:
-            insufficient.append({"stok_urun_id": sid, "needed": need, "available": current})
-    if insufficient:
-        return {"success": False, "error": "insufficient_stock", "details": insufficient}
 
-    # Deduct stock with conditional updates and rollback on failure
-    updated_sides = []
+# --- Sales reports (served from pos_sales_rollups) ---
+def _business_day(value: str) -> date:
+    """A YYYY-MM-DD report bound; rollup days are compared as strings, so anything else is rejected."""
     try:
-        for sid, need in ingredient_requirements.items():
-            res = await db.stok_urun.update_one({"id": sid, "mevcut": {"$gte": need}}, {"$inc": {"mevcut": -need}})
-            if res.modified_count == 0:
-                insufficient.append({"stok_urun_id": sid, "needed": need, "available": (await db.stok_urun.find_one({"id": sid}) or {}).get("mevcut", 0)})
-                raise RuntimeError("insufficient_or_concurrent_update")
-            updated_sides.append((sid, need))
-    except Exception as e:
-        if updated_sides:
-            for sid, amt in updated_sides:
-                try:
-                    await db.stok_urun.update_one({"id": sid}, {"$inc": {"mevcut": amt}})
-                except Exception:
-                    logger.exception("Failed to rollback stock for %s after order-pay failure", sid)
-        if insufficient:
-            return {"success": False, "error": "insufficient_stock", "details": insufficient}
-        logger.exception("Unexpected error during stock deduction in order-pay: %s", e)
-        return {"success": False, "error": "stock_update_failed", "details": str(e)}
-
-    # Create order
-    next_id = await get_next_id("orders")
-    adisyon_no = next_id
-    total = _compute_order_total(order_items)
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+
+
+@api_router.get("/pos/reports/z")
+async def z_report(company_id: int = 1, day: Optional[str] = None):
+    """Z-report for one business day: totals, payment methods, product mix and hourly revenue."""
+    day = _business_day(day).isoformat() if day else sales_rollups.bucket(None)[0]
+    return await sales_rollups.z_report(db, company_id, day)
+
+
+@api_router.get("/pos/reports/sales")
+async def sales_report(
+    company_id: int = 1,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+):
+    """Sales dashboard over business days [from, to] (default: the last 7 days)."""
+    end = _business_day(date_to or sales_rollups.bucket(None)[0])
+    start = _business_day(date_from) if date_from else end - timedelta(days=6)
+    date_from, date_to = start.isoformat(), end.isoformat()
+    return await sales_rollups.sales_summary(db, company_id, date_from, date_to)
+
+
+@api_router.post("/pos/reports/rollups/rebuild")
+async def rebuild_sales_rollups(
+    company_id: Optional[int] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    background: bool = False,
+):
+    """Recompute sales rollups from orders; with background=true it runs as an RQ job."""
+    if background:
+        try:
+            from .cache import get_queue
 
-    order_doc = {
-        "id": next_id,
-        "adisyon_no": adisyon_no,
-        "company_id": int(oc.company_id or 1),
-        "table": oc.table,
-        "customer": oc.customer,
-        "items": order_items,
-        "total": total,
-        "note": oc.note,
-        "status": "paid" if payment and float(payment.get("amount", 0)) >= total else "open",
-        "created_at": datetime.now(timezone.utc).isoformat(),
-        "payments": []
-    }
+            job = get_queue().enqueue("backend.tasks.rebuild_sales_rollups_job", company_id, date_from, date_to)
+            return {"queued": True, "job_id": job.get_id()}
+        except Exception as e:
+            logger.exception("Failed to enqueue sales rollup rebuild")
+            return {"queued": False, "error": str(e)}
+    return await sales_rollups.rebuild_rollups(db, company_id, date_from, date_to)
 
-    if payment:
-        pay = {
-            "method": payment.get("method"),
-            "amount": float(payment.get("amount", 0)),
-            "details": payment.get("details") or {},
-            "recorded_at": datetime.now(timezone.utc).isoformat()
-        }
-        order_doc["payments"].append(pay)
 
-    await db.orders.insert_one(order_doc)
+# --- Inventory movements (pos_inventory_movements / pos_stock_levels) ---
+def _movement_time(value: Optional[str], end: bool = False) -> Optional[datetime]:
+    return datetime.fromisoformat(_time_bound(value, end=end)) if value else None
 
-    try:
-        _trigger_print(order_doc)
-    except Exception:
-        logger.exception("Printing failed for order %s", order_doc.get("id"))
 
-    return {"success": True, "order": order_doc}
+@api_router.get("/pos/inventory/{stok_urun_id}/movements")
+async def list_inventory_movements(
+    stok_urun_id: int,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    location_id: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Stock movements of one ingredient, newest first, exactly as recorded."""
+    movements = await inventory_movements.movement_history(
+        db, stok_urun_id, _movement_time(date_from), _movement_time(date_to, end=True), location_id, limit
+    )
+    return {"stok_urun_id": stok_urun_id, "movements": movements}
+
+
+@api_router.get("/pos/inventory/{stok_urun_id}/level")
+async def get_inventory_level(stok_urun_id: int, at: Optional[str] = None, location_id: Optional[int] = None):
+    """Stock of one ingredient at a point in time (default now)."""
+    return await inventory_movements.stock_at(db, stok_urun_id, _movement_time(at), location_id)
+
+
+@api_router.post("/pos/inventory/compact")
+async def compact_inventory_movements(limit: int = Query(5000, ge=1, le=100000), background: bool = False):
+    """Fold pending movements into pos_stock_levels; with background=true it runs as an RQ job."""
+    if background:
+        try:
+            from .cache import get_queue
+
+            job = get_queue().enqueue("backend.tasks.compact_inventory_movements_job", limit)
+            return {"queued": True, "job_id": job.get_id()}
+        except Exception as e:
+            logger.exception("Failed to enqueue inventory movement compaction")
+            return {"queued": False, "error": str(e)}
+    # movements recorded by this worker are compacted too, not left for the next run
+    await movement_log.flush(db)
+    return await inventory_movements.compact_movements(db, limit)
+
+
+# --- Order event stream ---
+EVENT_KEEPALIVE_SECONDS = 15
+
+
+def _event_types(types: Optional[str]):
+    return {t.strip() for t in types.split(",") if t.strip()} if types else None
+
+
+@api_router.get("/pos/events")
+async def order_events(request: Request, company_id: int, types: Optional[str] = None):
+    """Server-sent order events (order.created, order.paid, order.printed) for one company.
+
+    `company_id` is required; `types` is an optional comma-separated filter. One long-lived connection
+    per screen replaces polling /pos/order/{id}.
+    """
+    sub = event_hub.subscribe(company_id, _event_types(types))
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), timeout=EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            event_hub.unsubscribe(sub)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@api_router.websocket("/pos/ws")
+async def order_events_ws(websocket: WebSocket, company_id: int, types: Optional[str] = None):
+    """WebSocket variant of /pos/events; sends each event as a JSON message."""
+    await websocket.accept()
+    sub = event_hub.subscribe(company_id, _event_types(types))
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(sub.queue.get(), timeout=EVENT_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                event = {"type": "ping"}
+            await websocket.send_json(event)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        event_hub.unsubscribe(sub)
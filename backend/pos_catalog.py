@@ -0,0 +1,163 @@
+"""Versioned in-memory snapshot of the POS catalog.
+
+The snapshot holds menu items, categories, zones and tables and is served
+from memory. Catalog writes bump a shared counter in `pos_catalog_meta`; each
+worker compares it at most every POS_CATALOG_REVALIDATE_SECONDS and reloads
+when it moved, which keeps all workers' snapshots in sync.
+
+The version (and ETag) is that shared counter, so every worker and every
+restart reports the same version for the same catalog. Each reload records
+per-document changes under the counter it loaded at, so terminals can ask
+for `/pos/catalog?since=<version>` and receive only what changed. A worker
+answers a delta only from a version it loaded itself (it knows that exact
+state); any other version gets a full snapshot.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# snapshot section -> Mongo collection
+CATALOG_COLLECTIONS = {
+    "menu_items": "menu_items",
+    "categories": "pos_categories",
+    "zones": "pos_zones",
+    "tables": "pos_tables",
+}
+META_ID = "catalog"
+
+
+class CatalogSnapshot:
+    def __init__(self, revalidate_seconds: Optional[float] = None, max_changes: int = 2000):
+        self.revalidate_seconds = revalidate_seconds if revalidate_seconds is not None else float(os.environ.get("POS_CATALOG_REVALIDATE_SECONDS", "5"))
+        self.version = 0
+        # bumped on every reload that changed the data; keys derived indexes
+        self.revision = 0
+        self._data: Dict[str, Dict[Any, Dict[str, Any]]] = {k: {} for k in CATALOG_COLLECTIONS}
+        self._changes: Deque[Tuple[int, str, str, Any]] = deque()
+        self._max_changes = max_changes
+        # versions this worker loaded whose changes since are all in the log
+        self._versions: Deque[int] = deque()
+        self._loaded = False
+        self._stale = True
+        self._shared_version: Optional[int] = None
+        self._checked_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def token(self) -> str:
+        return str(self.version)
+
+    def items(self, section: str):
+        return list(self._data[section].values())
+
+    async def _read_shared_version(self, db) -> int:
+        meta = await db.pos_catalog_meta.find_one({"_id": META_ID})
+        return int(meta.get("version", 0)) if meta else 0
+
+    async def ensure_fresh(self, db, max_age: Optional[float] = None) -> None:
+        """Reload if the shared counter moved; it is read at most every `max_age` (default revalidate_seconds)."""
+        max_age = self.revalidate_seconds if max_age is None else max_age
+        now = time.monotonic()
+        if not self._stale and self._checked_at is not None and now - self._checked_at < max_age:
+            return
+        async with self._lock:
+            if not self._stale and self._checked_at is not None and time.monotonic() - self._checked_at < max_age:
+                return
+            shared = await self._read_shared_version(db)
+            if self._loaded and not self._stale and shared == self._shared_version:
+                self._checked_at = time.monotonic()
+                return
+            await self._reload(db, shared)
+            self._shared_version = shared
+            self._stale = False
+            self._checked_at = time.monotonic()
+
+    async def _reload(self, db, shared: int) -> None:
+        fresh: Dict[str, Dict[Any, Dict[str, Any]]] = {}
+        for section, coll in CATALOG_COLLECTIONS.items():
+            docs = await db[coll].find({}, {"_id": 0}).to_list(None)
+            fresh[section] = {d.get("id"): d for d in docs}
+
+        changes = []
+        for section, docs in fresh.items():
+            old = self._data[section]
+            for doc_id, doc in docs.items():
+                if old.get(doc_id) != doc:
+                    changes.append((section, "upsert", doc_id))
+            for doc_id in old.keys() - docs.keys():
+                changes.append((section, "delete", doc_id))
+
+        self._data = fresh
+        if changes:
+            self.revision += 1
+        if not self._loaded or (changes and shared <= self.version):
+            # first load, or data moved without the counter (a write whose
+            # bump is still in flight): clients at this version may hold
+            # either state, so the log restarts here
+            self._changes.clear()
+            self._versions = deque([shared])
+        else:
+            for section, op, doc_id in changes:
+                if len(self._changes) >= self._max_changes:
+                    dropped = self._changes.popleft()[0]
+                    while self._versions and self._versions[0] < dropped:
+                        self._versions.popleft()
+                self._changes.append((shared, section, op, doc_id))
+            if shared != self.version:
+                self._versions.append(shared)
+        self.version = shared
+        self._loaded = True
+        logger.info("POS catalog snapshot %s loaded (%s changes)", self.token, len(changes))
+
+    def invalidate(self) -> None:
+        """Reload on the next ensure_fresh without bumping the shared counter."""
+        self._stale = True
+
+    async def mark_changed(self, db) -> None:
+        """Call after any catalog write: bumps the shared counter and forces a local reload."""
+        try:
+            await db.pos_catalog_meta.update_one({"_id": META_ID}, {"$inc": {"version": 1}}, upsert=True)
+        except Exception:
+            logger.exception("Failed to bump shared POS catalog version")
+        self._stale = True
+
+    def full(self) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {"version": self.token, "full": True}
+        for section in CATALOG_COLLECTIONS:
+            payload[section] = self.items(section)
+        return payload
+
+    def delta(self, since: Optional[str]) -> Dict[str, Any]:
+        """Changes after `since`, or a full snapshot if `since` can't be served from the log."""
+        since_version = self._parse(since)
+        if since_version is None or since_version not in self._versions:
+            return self.full()
+
+        latest: Dict[Tuple[str, Any], str] = {}
+        for version, section, op, doc_id in self._changes:
+            if version > since_version:
+                latest[(section, doc_id)] = op
+        changes = []
+        for (section, doc_id), op in latest.items():
+            doc = self._data[section].get(doc_id)
+            if op == "upsert" and doc is not None:
+                changes.append({"kind": section, "op": "upsert", "id": doc_id, "doc": doc})
+            else:
+                changes.append({"kind": section, "op": "delete", "id": doc_id})
+        return {"version": self.token, "full": False, "changes": changes}
+
+    def _parse(self, since: Optional[str]) -> Optional[int]:
+        if not since:
+            return None
+        try:
+            return int(since)
+        except ValueError:
+            return None
+
+
+catalog = CatalogSnapshot()
@@ -1,11 +1,27 @@
 import os
 import logging
 
+from pymongo.errors import OperationFailure
+
 logger = logging.getLogger(__name__)
 
 def _coll_name(key, default):
     return os.environ.get(key, default)
 
+async def _ensure_unique_id(db, coll):
+    """Unique `<coll>.id`, replacing the earlier plain `<coll>_id` index."""
+    try:
+        await db[coll].create_index([('id', 1)], name=f'{coll}_id_unique', unique=True)
+    except OperationFailure as e:
+        logger.error('Unique index on %s.id could not be created (%s); duplicate ids must be fixed by hand', coll, e)
+        await db[coll].create_index([('id', 1)], name=f'{coll}_id')
+        return
+    try:
+        await db[coll].drop_index(f'{coll}_id')
+    except OperationFailure:
+        pass  # never created, or already dropped
+
+
 async def ensure_pos_collections(db):
     """Ensure POS collections exist and indexes are in place. Non-destructive.
 
@@ -33,9 +49,38 @@ async def ensure_pos_collections(db):
         await db[VARIANTS].create_index([('sku', 1)], name='pos_variants_sku_idx')
         # Orders recent first
         await db[ORDERS].create_index([('createdAt', -1), ('status', 1), ('createdByStaffId', 1)], name='pos_orders_recent')
+        # Inventory locations are addressed by numeric id (stok_urun.locations.<id>)
+        await db[LOCATIONS].create_index([('id', 1)], name='pos_locations_id', unique=True)
         # Movements and stock
         await db[MOVEMENTS].create_index([('productVariantId', 1), ('createdAt', -1)], name='pos_movements_product_time')
         await db[STOCK].create_index([('productVariantId', 1), ('locationId', 1)], name='pos_stock_unique', unique=True)
+        # Movement compaction claims unfolded movements oldest first
+        await db[MOVEMENTS].create_index([('compacted', 1), ('compactionId', 1), ('createdAt', 1)], name='pos_movements_compaction')
+        # `orders` is the collection the POS order engine writes to; these back
+        # /pos/orders (company + optional status/table, newest first by created_at, id)
+        await _ensure_unique_id(db, 'orders')
+        # stock deductions rely on it: a conditional $inc that misses upserts and fails on this index
+        await _ensure_unique_id(db, 'stok_urun')
+        await db['orders'].create_index([('company_id', 1), ('created_at', -1), ('id', -1)], name='orders_company_time')
+        await db['orders'].create_index([('company_id', 1), ('status', 1), ('created_at', -1), ('id', -1)], name='orders_company_status_time')
+        await db['orders'].create_index([('company_id', 1), ('table', 1), ('created_at', -1), ('id', -1)], name='orders_company_table_time')
+        # offline bulk sync dedupes on the terminal-stamped id
+        await db['orders'].create_index([('client_order_id', 1)], name='orders_client_order_id', unique=True, partialFilterExpression={'client_order_id': {'$exists': True}})
+        # Sales rollups: one row per (company, business day, hour)
+        await db['pos_sales_rollups'].create_index([('company_id', 1), ('day', 1), ('hour', 1)], name='pos_sales_rollups_company_day')
+        # Open-tables projection, read per company by /pos/table-board
+        await db['pos_table_state'].create_index([('company_id', 1)], name='pos_table_state_company')
+        # Print job status lookups per order
+        await db['pos_print_jobs'].create_index([('order_id', 1), ('created_at', 1)], name='pos_print_jobs_order')
+        await db['pos_print_jobs'].create_index([('id', 1)], name='pos_print_jobs_id', unique=True)
+        # Idempotency-Key claims expire on their own
+        await db['idempotency_keys'].create_index([('expires_at', 1)], name='idempotency_keys_ttl', expireAfterSeconds=0)
+        # Inventory ledger journal: unflushed scans and flush claims
+        await db['pos_inventory_journal'].create_index([('flushed', 1), ('flush_id', 1)], name='pos_inventory_journal_flush')
+        await db['pos_inventory_journal'].create_index([('sids', 1), ('flushed', 1)], name='pos_inventory_journal_sids')
+        await db['pos_inventory_journal'].create_index([('state', 1), ('created_at', 1)], name='pos_inventory_journal_state')
+        await db['orders'].create_index([('ledger_token', 1)], name='orders_ledger_token', sparse=True)
+        await db['pos_inventory_journal'].create_index([('created_at', 1)], name='pos_inventory_journal_ttl', expireAfterSeconds=7 * 86400, partialFilterExpression={'flushed': True})
         logger.info('POS collections and indexes ensured')
     except Exception:
         logger.exception('Failed to ensure POS collection indexes')
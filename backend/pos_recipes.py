@@ -0,0 +1,97 @@
+"""Per-process compiled recipe table for POS menu items.
+
+Each menu item is compiled once into its price, active flag and a tuple of
+(stok_urun_id, quantity) pairs, so order pricing and ingredient totals need
+no `menu_items` query. The table is compiled from the POS catalog snapshot
+and recompiled whenever the snapshot changes. Before serving an order the
+shared catalog counter is checked (at most every
+POS_RECIPE_REVALIDATE_SECONDS), so a price change or deactivation made on
+another worker applies within that window. Ids that are still unknown after
+a check are remembered for POS_RECIPE_NEGATIVE_TTL seconds, so repeated bad
+ids cost nothing.
+"""
+import logging
+import os
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+try:
+    from .pos_catalog import catalog  # type: ignore
+except Exception:
+    from pos_catalog import catalog
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledMenuItem(NamedTuple):
+    id: int
+    name: Optional[str]
+    price: float
+    active: bool
+    ingredients: Tuple[Tuple[int, float], ...]
+
+
+def compile_menu_item(doc: Dict[str, Any]) -> CompiledMenuItem:
+    ingredients: Dict[int, float] = {}
+    for ingredient in doc.get("recipe") or []:
+        sid = int(ingredient.get("stok_urun_id"))
+        ingredients[sid] = ingredients.get(sid, 0) + float(ingredient.get("quantity", 0))
+    return CompiledMenuItem(
+        id=doc["id"],
+        name=doc.get("name"),
+        price=float(doc.get("price", 0)),
+        active=bool(doc.get("active", True)),
+        ingredients=tuple(ingredients.items()),
+    )
+
+
+class RecipeTable:
+    def __init__(self, snapshot, revalidate_seconds: Optional[float] = None, negative_ttl: Optional[float] = None):
+        self.snapshot = snapshot
+        self.revalidate_seconds = revalidate_seconds if revalidate_seconds is not None else float(os.environ.get("POS_RECIPE_REVALIDATE_SECONDS", "1"))
+        self.negative_ttl = negative_ttl if negative_ttl is not None else float(os.environ.get("POS_RECIPE_NEGATIVE_TTL", "5"))
+        self._items: Dict[int, CompiledMenuItem] = {}
+        self._revision: Optional[int] = None
+        self._missing: Dict[int, float] = {}
+
+    async def ensure_loaded(self, db, force: bool = False) -> None:
+        await self.snapshot.ensure_fresh(db, max_age=0 if force else self.revalidate_seconds)
+        if self._revision == self.snapshot.revision:
+            return
+        items = {}
+        for d in self.snapshot.items("menu_items"):
+            try:
+                items[d["id"]] = compile_menu_item(d)
+            except Exception:
+                logger.exception("Skipping menu item with invalid recipe: %s", d.get("id"))
+        self._items = items
+        self._revision = self.snapshot.revision
+        self._missing.clear()
+        logger.info("Compiled recipe table with %s menu items", len(items))
+
+    async def resolve(self, db, menu_item_ids: List[int]) -> Dict[int, CompiledMenuItem]:
+        """Return compiled items for the ids; unknown ids force one catalog check, then are cached as missing."""
+        await self.ensure_loaded(db)
+        now = time.monotonic()
+        unknown = {
+            int(i) for i in menu_item_ids
+            if int(i) not in self._items and now - self._missing.get(int(i), float("-inf")) >= self.negative_ttl
+        }
+        if unknown:
+            # possibly created by another worker since the last check
+            await self.ensure_loaded(db, force=True)
+            for i in unknown - self._items.keys():
+                self._missing[i] = now
+        return self._items
+
+    def get(self, menu_item_id: int) -> Optional[CompiledMenuItem]:
+        return self._items.get(menu_item_id)
+
+    def invalidate(self) -> None:
+        """Recompile from a reloaded snapshot on the next order (after a menu write in this process)."""
+        self._revision = None
+        self._missing.clear()
+        self.snapshot.invalidate()
+
+
+recipe_table = RecipeTable(catalog)
@@ -0,0 +1,196 @@
+"""Asynchronous adisyon print queue.
+
+Order endpoints only record a print job in `pos_print_jobs` and hand its id to
+a queue; the printer I/O happens elsewhere:
+
+- with REDIS_URL configured, jobs go to one RQ queue per printer
+  ("print-<printer>") and are run by `tasks.print_job`, with RQ retries. A
+  job that fails its last attempt is left in RQ's failed registry and marked
+  "dead" here;
+- otherwise an in-process spooler drains one asyncio queue per printer with
+  the same retry schedule.
+
+Printers are raw TCP (port 9100 style) devices configured as
+POS_PRINTERS="kitchen=10.0.0.5:9100,bar=10.0.0.6:9100"; POS_PRINTER_ADDR sets
+the "default" printer. A job for a printer without an address is only logged.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from .cache import get_queue, redis_configured  # type: ignore
+    from .receipt import render_receipt  # type: ignore
+    from .event_hub import publish_order_event  # type: ignore
+except Exception:
+    from cache import get_queue, redis_configured
+    from receipt import render_receipt
+    from event_hub import publish_order_event
+
+logger = logging.getLogger(__name__)
+
+PRINT_JOBS = "pos_print_jobs"
+DEFAULT_PRINTER = "default"
+
+
+def _retry_delays() -> List[int]:
+    raw = os.environ.get("POS_PRINT_RETRY_DELAYS", "2,5,15")
+    return [int(x) for x in raw.split(",") if x.strip()]
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def printer_addresses() -> Dict[str, Tuple[str, int]]:
+    addresses = {}
+    entries = [e for e in os.environ.get("POS_PRINTERS", "").split(",") if "=" in e]
+    if os.environ.get("POS_PRINTER_ADDR"):
+        entries.insert(0, f"{DEFAULT_PRINTER}={os.environ['POS_PRINTER_ADDR']}")
+    for entry in entries:
+        name, _, addr = entry.partition("=")
+        host, _, port = addr.strip().rpartition(":")
+        try:
+            addresses[name.strip()] = (host, int(port))
+        except ValueError:
+            logger.warning("Ignoring invalid printer address %r", entry)
+    return addresses
+
+
+def printer_for(order: Dict[str, Any]) -> str:
+    return order.get("printer") or DEFAULT_PRINTER
+
+
+def send_raw(address: Tuple[str, int], payload: bytes, timeout: float = 5.0) -> None:
+    with socket.create_connection(address, timeout=timeout) as sock:
+        sock.sendall(payload)
+
+
+async def _set_status(db, job_id: str, status: str, **fields) -> None:
+    await db[PRINT_JOBS].update_one({"id": job_id}, {"$set": {"status": status, "updated_at": _now(), **fields}})
+
+
+async def run_print_job(db, job_id: str, final_attempt: bool = True) -> str:
+    """Print one job. Raises on failure so the caller can retry; returns the final status."""
+    job = await db[PRINT_JOBS].find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        logger.warning("Print job %s not found", job_id)
+        return "missing"
+    order = await db.orders.find_one({"id": job["order_id"]}, {"_id": 0})
+    if not order:
+        await _set_status(db, job_id, "dead", last_error="order not found")
+        return "dead"
+
+    address = printer_addresses().get(job["printer"])
+    attempts = job.get("attempts", 0) + 1
+    await _set_status(db, job_id, "printing", attempts=attempts)
+    payload = render_receipt(order)
+    if address is None:
+        logger.info("[POS PRINT] No address for printer %s; adisyon %s total=%s", job["printer"], order.get("adisyon_no"), order.get("total"))
+        await _set_status(db, job_id, "logged")
+        return "logged"
+    try:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, send_raw, address, payload)
+    except Exception as e:
+        status = "dead" if final_attempt else "retrying"
+        await _set_status(db, job_id, status, last_error=str(e))
+        logger.warning("Print job %s for order %s failed (attempt %s, %s): %s", job_id, job["order_id"], attempts, status, e)
+        raise
+    await _set_status(db, job_id, "printed", printed_at=_now())
+    await publish_order_event("order.printed", order)
+    return "printed"
+
+
+class LocalPrintSpooler:
+    """In-process fallback: one asyncio queue and worker task per printer."""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+
+    def submit(self, db, printer: str, job_id: str) -> None:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # queues and tasks are bound to the loop that created them
+            self._loop, self._queues, self._workers = loop, {}, {}
+        if printer not in self._queues:
+            self._queues[printer] = asyncio.Queue()
+            self._workers[printer] = loop.create_task(self._drain(db, printer))
+        self._queues[printer].put_nowait(job_id)
+
+    async def _drain(self, db, printer: str) -> None:
+        queue = self._queues[printer]
+        while True:
+            job_id = await queue.get()
+            try:
+                await self._run_with_retries(db, job_id)
+            except Exception:
+                logger.exception("Print job %s dead-lettered", job_id)
+            finally:
+                queue.task_done()
+
+    async def _run_with_retries(self, db, job_id: str) -> None:
+        delays = _retry_delays()
+        for attempt in range(len(delays) + 1):
+            try:
+                await run_print_job(db, job_id, final_attempt=attempt == len(delays))
+                return
+            except Exception:
+                if attempt == len(delays):
+                    raise
+                await asyncio.sleep(delays[attempt])
+
+    async def join(self) -> None:
+        """Wait until every queued job has printed or been dead-lettered."""
+        for queue in list(self._queues.values()):
+            await queue.join()
+
+
+spooler = LocalPrintSpooler()
+
+
+def _enqueue_rq(printer: str, job_id: str) -> None:
+    from rq import Retry
+
+    delays = _retry_delays()
+    get_queue(f"print-{printer}").enqueue(
+        "backend.tasks.print_job", job_id,
+        retry=Retry(max=len(delays), interval=delays) if delays else None,
+    )
+
+
+async def enqueue_print(db, order: Dict[str, Any]) -> Dict[str, Any]:
+    """Record a print job for the order and queue it; never touches the printer."""
+    printer = printer_for(order)
+    job = {
+        "id": uuid.uuid4().hex,
+        "order_id": order["id"],
+        "printer": printer,
+        "status": "queued",
+        "attempts": 0,
+        "created_at": _now(),
+        "updated_at": _now(),
+        "backend": "rq" if redis_configured() else "local",
+    }
+    # the job document must exist before a worker can pick the id up
+    await db[PRINT_JOBS].insert_one(dict(job))
+    if job["backend"] == "rq":
+        try:
+            _enqueue_rq(printer, job["id"])
+        except Exception:
+            logger.exception("RQ enqueue failed for print job %s; using in-process spooler", job["id"])
+            job["backend"] = "local"
+            await db[PRINT_JOBS].update_one({"id": job["id"]}, {"$set": {"backend": "local"}})
+    if job["backend"] == "local":
+        spooler.submit(db, printer, job["id"])
+    return job
+
+
+async def print_status(db, order_id: int) -> List[Dict[str, Any]]:
+    return await db[PRINT_JOBS].find({"order_id": order_id}, {"_id": 0}).sort("created_at", 1).to_list(None)
@@ -0,0 +1,212 @@
+"""Materialized POS sales rollups (Z-report / sales dashboard).
+
+One `pos_sales_rollups` document per (company, business day, hour) holds the
+order count, revenue, item quantities/revenue per menu item and totals per
+payment method. Orders update their hour bucket with a single upsert when
+they are created; payments are bucketed by the time they were recorded. The
+reports read at most 24 rows per day instead of scanning `orders`.
+
+Days and hours are local business time (POS_BUSINESS_TZ, default
+Europe/Istanbul). `rebuild_rollups` recomputes a range from `orders` for
+history or after a failed incremental update.
+"""
+import logging
+import os
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+ROLLUPS = "pos_sales_rollups"
+# payment methods become field names under `payments`; anything else is "other"
+_METHOD_RE = re.compile(r"[A-Za-z0-9_-]{1,32}")
+
+
+def business_tz() -> ZoneInfo:
+    return ZoneInfo(os.environ.get("POS_BUSINESS_TZ", "Europe/Istanbul"))
+
+
+def bucket(timestamp: Optional[str]) -> Tuple[str, int]:
+    """(day, hour) in business time for an ISO timestamp."""
+    ts = datetime.fromisoformat(timestamp) if timestamp else datetime.now(timezone.utc)
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    local = ts.astimezone(business_tz())
+    return local.date().isoformat(), local.hour
+
+
+def _rollup_id(company_id: int, day: str, hour: int) -> str:
+    return f"{company_id}:{day}:{hour:02d}"
+
+
+def _key(company_id: int, day: str, hour: int) -> Dict[str, Any]:
+    return {"_id": _rollup_id(company_id, day, hour), "company_id": company_id, "day": day, "hour": hour}
+
+
+def _order_increments(order: Dict[str, Any]) -> Dict[str, float]:
+    inc: Dict[str, float] = {"orders": 1, "revenue": float(order.get("total", 0))}
+    for it in order.get("items", []):
+        mid = it.get("menu_item_id")
+        qty = it.get("quantity", 1)
+        inc[f"items.{mid}.quantity"] = inc.get(f"items.{mid}.quantity", 0) + qty
+        inc[f"items.{mid}.revenue"] = inc.get(f"items.{mid}.revenue", 0) + float(it.get("price", 0)) * qty
+    return inc
+
+
+def method_key(method: Any) -> str:
+    """A client-supplied payment method as a safe field name ("a.b" or "$x" would nest or fail the update)."""
+    key = str(method or "").strip()
+    return key if _METHOD_RE.fullmatch(key) else "other"
+
+
+def _payment_increments(payment: Dict[str, Any]) -> Dict[str, float]:
+    method = method_key(payment.get("method"))
+    return {f"payments.{method}": float(payment.get("amount", 0)), "paid_total": float(payment.get("amount", 0))}
+
+
+async def record_order(db, order: Dict[str, Any]) -> None:
+    """Add a new order (and any payments taken with it) to its hour buckets."""
+    company_id = int(order.get("company_id") or 1)
+    day, hour = bucket(order.get("created_at"))
+    names = {f"item_names.{it.get('menu_item_id')}": it.get("name") for it in order.get("items", [])}
+    updates = {(day, hour): {"$inc": _order_increments(order)}}
+    if names:
+        updates[(day, hour)]["$set"] = names
+    for p in order.get("payments") or []:
+        pday, phour = bucket(p.get("recorded_at"))
+        inc = updates.setdefault((pday, phour), {"$inc": {}})["$inc"]
+        for k, v in _payment_increments(p).items():
+            inc[k] = inc.get(k, 0) + v
+    for (d, h), update in updates.items():
+        await db[ROLLUPS].update_one(_key(company_id, d, h), update, upsert=True)
+
+
+async def record_payment(db, company_id: int, payment: Dict[str, Any]) -> None:
+    """Add a payment recorded after the order was created."""
+    day, hour = bucket(payment.get("recorded_at"))
+    await db[ROLLUPS].update_one(_key(int(company_id or 1), day, hour), {"$inc": _payment_increments(payment)}, upsert=True)
+
+
+def _fold(rows: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum rollup rows into one report body."""
+    total = {"orders": 0, "revenue": 0.0, "paid_total": 0.0}
+    payments: Dict[str, float] = {}
+    items: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        total["orders"] += int(row.get("orders", 0))
+        total["revenue"] += float(row.get("revenue", 0))
+        total["paid_total"] += float(row.get("paid_total", 0))
+        for method, amount in (row.get("payments") or {}).items():
+            payments[method] = payments.get(method, 0.0) + float(amount)
+        for mid, agg in (row.get("items") or {}).items():
+            item = items.setdefault(mid, {"menu_item_id": int(mid), "name": None, "quantity": 0, "revenue": 0.0})
+            item["quantity"] += agg.get("quantity", 0)
+            item["revenue"] += float(agg.get("revenue", 0))
+            item["name"] = (row.get("item_names") or {}).get(mid) or item["name"]
+    return {
+        "orders": total["orders"],
+        "revenue": round(total["revenue"], 2),
+        "paid_total": round(total["paid_total"], 2),
+        "average_ticket": round(total["revenue"] / total["orders"], 2) if total["orders"] else 0.0,
+        "payments": {m: round(a, 2) for m, a in sorted(payments.items())},
+        "items": sorted(({**i, "revenue": round(i["revenue"], 2)} for i in items.values()), key=lambda i: -i["revenue"]),
+    }
+
+
+async def z_report(db, company_id: int, day: str) -> Dict[str, Any]:
+    rows = await db[ROLLUPS].find({"company_id": company_id, "day": day}, {"_id": 0}).sort("hour", 1).to_list(None)
+    report = {"company_id": company_id, "day": day, **_fold(rows)}
+    report["hourly"] = [
+        {"hour": r["hour"], "orders": int(r.get("orders", 0)), "revenue": round(float(r.get("revenue", 0)), 2)}
+        for r in rows
+    ]
+    return report
+
+
+async def sales_summary(db, company_id: int, day_from: str, day_to: str) -> Dict[str, Any]:
+    rows = await db[ROLLUPS].find(
+        {"company_id": company_id, "day": {"$gte": day_from, "$lte": day_to}}, {"_id": 0}
+    ).sort("day", 1).to_list(None)
+    by_day: Dict[str, List[Dict[str, Any]]] = {}
+    for r in rows:
+        by_day.setdefault(r["day"], []).append(r)
+    days = []
+    for d, day_rows in by_day.items():
+        folded = _fold(day_rows)
+        days.append({"day": d, "orders": folded["orders"], "revenue": folded["revenue"], "paid_total": folded["paid_total"]})
+    summary = _fold(rows)
+    summary["items"] = summary["items"][:20]
+    return {"company_id": company_id, "from": day_from, "to": day_to, "days": days, **summary}
+
+
+async def rebuild_rollups(db, company_id: Optional[int] = None, day_from: Optional[str] = None, day_to: Optional[str] = None) -> Dict[str, Any]:
+    """Recompute rollups from `orders` for [day_from, day_to] (business days, inclusive).
+
+    Rows are replaced wholesale, so run it off-peak: orders created while it
+    runs may be counted by both the rebuild and the incremental update.
+    """
+    q: Dict[str, Any] = {}
+    if company_id is not None:
+        q["company_id"] = company_id
+    tz = business_tz()
+    window: Dict[str, str] = {}
+    if day_from:
+        # widen by a day either side: created_at is UTC, buckets are local
+        window["$gte"] = (date.fromisoformat(day_from) - timedelta(days=1)).isoformat()
+    if day_to:
+        window["$lt"] = (date.fromisoformat(day_to) + timedelta(days=2)).isoformat()
+    if window:
+        q["created_at"] = window
+
+    rows: Dict[str, Dict[str, Any]] = {}
+
+    def row_for(cid, d, h):
+        return rows.setdefault(_rollup_id(cid, d, h), {**_key(cid, d, h), "inc": {}, "names": {}})
+
+    def in_range(d):
+        return (not day_from or d >= day_from) and (not day_to or d <= day_to)
+
+    scanned = 0
+    async for order in db.orders.find(q, {"_id": 0}):
+        scanned += 1
+        cid = int(order.get("company_id") or 1)
+        d, h = bucket(order.get("created_at"))
+        if in_range(d):
+            row = row_for(cid, d, h)
+            for k, v in _order_increments(order).items():
+                row["inc"][k] = row["inc"].get(k, 0) + v
+            for it in order.get("items", []):
+                row["names"][str(it.get("menu_item_id"))] = it.get("name")
+        for p in order.get("payments") or []:
+            pd, ph = bucket(p.get("recorded_at"))
+            if in_range(pd):
+                prow = row_for(cid, pd, ph)
+                for k, v in _payment_increments(p).items():
+                    prow["inc"][k] = prow["inc"].get(k, 0) + v
+
+    clear: Dict[str, Any] = {}
+    if company_id is not None:
+        clear["company_id"] = company_id
+    if day_from or day_to:
+        clear["day"] = {k: v for k, v in (("$gte", day_from), ("$lte", day_to)) if v}
+    await db[ROLLUPS].delete_many(clear)
+
+    ops = []
+    for rid, row in rows.items():
+        doc: Dict[str, Any] = {"company_id": row["company_id"], "day": row["day"], "hour": row["hour"],
+                               "orders": 0, "revenue": 0.0, "paid_total": 0.0, "items": {}, "payments": {}, "item_names": row["names"]}
+        for path, value in row["inc"].items():
+            target = doc
+            parts = path.split(".")
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = target.get(parts[-1], 0) + value
+        ops.append(UpdateOne({"_id": rid}, {"$set": doc}, upsert=True))
+    if ops:
+        await db[ROLLUPS].bulk_write(ops, ordered=False)
+    logger.info("Rebuilt %s sales rollup rows from %s orders (tz=%s)", len(ops), scanned, tz.key)
+    return {"orders_scanned": scanned, "rows": len(ops)}
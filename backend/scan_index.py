@@ -0,0 +1,161 @@
+"""In-memory barcode / SKU lookup for handheld scanners.
+
+Codes map straight to a menu item (from the POS catalog snapshot, rebuilt
+when the snapshot revision changes) or to a stok_urun ingredient. Codes are
+kept per company: a menu item or ingredient without `company_id` is shared
+by every company, one with it is only found by that company's scans. A
+menu item's numeric id resolves like a code, as a typed id did on the
+terminal before scanning existed; a real code wins a clash. Stock for
+every ingredient, per location, is kept next to the codes and refreshed
+every POS_SCAN_STOCK_TTL seconds in the background, so a scan never waits
+on Mongo once the map is warm. A menu item's stock is the number of
+portions its recipe allows at the requested location.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CODE_FIELDS = ("barcode", "sku")
+
+
+def _codes(doc: Dict[str, Any]) -> List[str]:
+    codes = [str(doc[f]).strip() for f in CODE_FIELDS if doc.get(f)]
+    codes += [str(c).strip() for c in doc.get("barcodes") or [] if c]
+    return [c for c in codes if c]
+
+
+def _find(mapping: Dict[Tuple[Optional[int], str], Any], company_id: Optional[int], code: str) -> Any:
+    hit = mapping.get((company_id, code))
+    return hit if hit is not None else mapping.get((None, code))
+
+
+def location_quantity(stock: Dict[str, Any], location_id: Optional[int]) -> float:
+    """Quantity of one stok_urun in a location's pool; None is the unassigned `mevcut` pool."""
+    if location_id is None:
+        return float(stock.get("mevcut") or 0)
+    return float((stock.get("locations") or {}).get(str(location_id)) or 0)
+
+
+class ScanIndex:
+    def __init__(self, stock_ttl: Optional[float] = None):
+        self.stock_ttl = stock_ttl if stock_ttl is not None else float(os.environ.get("POS_SCAN_STOCK_TTL", "2"))
+        self.version: Optional[int] = None
+        self._menu_codes: Dict[Tuple[Optional[int], str], Dict[str, Any]] = {}
+        self._stock_codes: Dict[Tuple[Optional[int], str], int] = {}
+        self._stock: Dict[int, Dict[str, Any]] = {}
+        self._stock_loaded_at: Optional[float] = None
+        self._refresh: Optional[asyncio.Task] = None
+
+    def build(self, menu_items: List[Dict[str, Any]], version: Optional[int] = None) -> None:
+        codes: Dict[Tuple[Optional[int], str], Dict[str, Any]] = {}
+        for item in menu_items:
+            for code in _codes(item):
+                codes.setdefault((item.get("company_id"), code), item)
+        for item in menu_items:
+            if item.get("id") is not None:
+                codes.setdefault((item.get("company_id"), str(item["id"])), item)
+        self._menu_codes = codes
+        self.version = version
+
+    async def _load_stock(self, db) -> None:
+        docs = await db.stok_urun.find(
+            {}, {"_id": 0, "id": 1, "ad": 1, "company_id": 1, "birim_id": 1, "min_stok": 1, "mevcut": 1, "locations": 1, "barcode": 1, "sku": 1, "barcodes": 1}
+        ).to_list(None)
+        self._stock = {d["id"]: d for d in docs}
+        codes: Dict[Tuple[Optional[int], str], int] = {}
+        for d in docs:
+            for code in _codes(d):
+                codes.setdefault((d.get("company_id"), code), d["id"])
+        self._stock_codes = codes
+        self._stock_loaded_at = time.monotonic()
+
+    async def _refresh_stock(self, db) -> None:
+        try:
+            await self._load_stock(db)
+        except Exception:
+            logger.exception("Scan index stock refresh failed")
+
+    async def ensure_stock(self, db) -> None:
+        """Load stock on first use; afterwards refresh it in the background when stale."""
+        if self._stock_loaded_at is None:
+            await self._load_stock(db)
+            return
+        if time.monotonic() - self._stock_loaded_at < self.stock_ttl:
+            return
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.get_running_loop().create_task(self._refresh_stock(db))
+
+    def invalidate_stock(self) -> None:
+        """Force the next scan to reload stock (after a write this worker made)."""
+        self._stock_loaded_at = None
+
+    def _portions(self, item: Dict[str, Any], location_id: Optional[int], live: Optional[Callable[[int], Optional[float]]]) -> Tuple[Optional[int], List[Dict[str, Any]]]:
+        ingredients = []
+        portions: Optional[int] = None
+        for line in item.get("recipe") or []:
+            sid = line.get("stok_urun_id")
+            per_unit = float(line.get("quantity", 1) or 0)
+            if sid is None or per_unit <= 0:
+                continue
+            available = self._available(int(sid), location_id, live)
+            ingredients.append({"stok_urun_id": sid, "per_unit": per_unit, "available": available})
+            n = int(available // per_unit) if available > 0 else 0
+            portions = n if portions is None else min(portions, n)
+        return portions, ingredients
+
+    def _available(self, sid: int, location_id: Optional[int], live: Optional[Callable[[int], Optional[float]]]) -> float:
+        if location_id is None and live is not None:
+            value = live(sid)
+            if value is not None:
+                return value
+        return location_quantity(self._stock.get(sid) or {}, location_id)
+
+    def stock_ids(self, code: str, company_id: Optional[int] = 1) -> List[int]:
+        """Ingredients a scan of `code` reports on, so live quantities can be fetched first."""
+        code = code.strip()
+        item = _find(self._menu_codes, company_id, code)
+        if item is not None:
+            return [int(line["stok_urun_id"]) for line in item.get("recipe") or [] if line.get("stok_urun_id") is not None]
+        sid = _find(self._stock_codes, company_id, code)
+        return [sid] if sid is not None else []
+
+    def lookup(
+        self,
+        code: str,
+        location_id: Optional[int] = None,
+        live: Optional[Callable[[int], Optional[float]]] = None,
+        company_id: Optional[int] = 1,
+    ) -> Optional[Dict[str, Any]]:
+        """Resolve a scanned code for one company. `live` can supply fresher unassigned-pool quantities."""
+        code = code.strip()
+        item = _find(self._menu_codes, company_id, code)
+        if item is not None:
+            portions, ingredients = self._portions(item, location_id, live)
+            return {
+                "code": code,
+                "type": "menu_item",
+                "item": item,
+                "location_id": location_id,
+                # None: the item has no recipe and is not stock-tracked
+                "available": portions,
+                "ingredients": ingredients,
+            }
+        sid = _find(self._stock_codes, company_id, code)
+        if sid is None:
+            return None
+        stock = self._stock[sid]
+        return {
+            "code": code,
+            "type": "stok_urun",
+            "item": {k: v for k, v in stock.items() if k not in ("mevcut", "locations")},
+            "location_id": location_id,
+            "available": self._available(sid, location_id, live),
+            "locations": stock.get("locations") or {},
+        }
+
+
+scan_index = ScanIndex()
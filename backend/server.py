@@ -1,5 +1,5 @@
 from fastapi import FastAPI, APIRouter, HTTPException, status, UploadFile, File
-from fastapi import Request
+from fastapi import Request, Header, Depends
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -17,6 +17,7 @@ from fastapi.staticfiles import StaticFiles
 import openpyxl
 import json
 import stripe
+from pymongo.errors import DuplicateKeyError
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -73,6 +74,41 @@ if init_logging:
     except Exception:
         logger.exception("Failed to initialize structured logging")
 
+# Signed session tokens (stateless auth for requests after login)
+try:
+    from .auth_tokens import issue_token_pair, decode_token, refresh_token_pair, revoke, tokens_configured, TokenError
+except Exception:
+    from auth_tokens import issue_token_pair, decode_token, refresh_token_pair, revoke, tokens_configured, TokenError
+
+# Login attempt throttling (per client IP and per account)
+try:
+    from .login_throttle import login_throttle, client_ip
+except Exception:
+    from login_throttle import login_throttle, client_ip
+
+# Optional in-memory employee directory (EMPLOYEE_DIRECTORY_CACHE=true)
+try:
+    from .employee_directory import employee_directory, directory_enabled
+except Exception:
+    from employee_directory import employee_directory, directory_enabled
+
+try:
+    from .inventory_movements import movement_log
+except Exception:
+    from inventory_movements import movement_log
+
+try:
+    from .low_stock import low_stock
+except Exception:
+    from low_stock import low_stock
+
+try:
+    from .stok_import import import_stok_workbook, import_job_status, start_import_job, ImportFileError
+    from .id_counters import allocate_ids as _allocate_ids
+except Exception:
+    from stok_import import import_stok_workbook, import_job_status, start_import_job, ImportFileError
+    from id_counters import allocate_ids as _allocate_ids
+
 if app and RequestIDMiddleware:
     try:
         app.add_middleware(RequestIDMiddleware)
@@ -102,15 +138,58 @@ async def lifespan(app: FastAPI):
                 await ensure_pos_collections(db)
             except Exception:
                 logger.exception('pos_collections.ensure_pos_collections failed')
+
+        # Indexes for login/credential lookups on employees
+        try:
+            from .core_indexes import ensure_core_indexes
+        except Exception:
+            from core_indexes import ensure_core_indexes
+        try:
+            await ensure_core_indexes(db)
+        except Exception:
+            logger.exception('core_indexes.ensure_core_indexes failed')
+
+        if not tokens_configured():
+            logger.error('AUTH_TOKEN_SECRET is not set: logins succeed but no session tokens are issued')
+
+        # Probe transaction support once so the POS order engine picks its path
+        try:
+            try:
+                from . import pos as _pos_startup
+            except Exception:
+                import pos as _pos_startup
+            await _pos_startup.detect_transaction_support()
+        except Exception:
+            logger.exception('POS transaction capability probe failed')
+
         yield
     finally:
         # perform any graceful shutdown tasks here if needed
+        try:
+            try:
+                from .inventory_ledger import inventory_ledger as _ledger
+            except Exception:
+                from inventory_ledger import inventory_ledger as _ledger
+            # write journaled hot-ingredient deductions back before exiting
+            await _ledger.close(db)
+        except Exception:
+            logger.exception('Inventory ledger flush on shutdown failed')
+        try:
+            # buffered inventory movements are only in memory until written
+            await movement_log.close(db)
+        except Exception:
+            logger.exception('Inventory movement flush on shutdown failed')
         try:
             # Motor's AsyncIOMotorClient.close is synchronous; call without await
             client.close()
         except Exception:
             pass
 
+# The app object is created before lifespan is defined; attach it now so the
+# startup bootstrap (indexes etc.) actually runs.
+if app:
+    app.router.lifespan_context = lifespan
+
 # Add CORS middleware BEFORE routers so browser requests from the frontend are allowed.
 if app:
     try:
@@ -433,6 +512,13 @@ class LoginResponse(BaseModel):
     employee_id: str
     company_id: int
     pozisyon: str
+    access_token: Optional[str] = None
+    refresh_token: Optional[str] = None
+    token_type: Optional[str] = None
+    expires_in: Optional[int] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 # ==================== HELPER FUNCTIONS ====================
 
@@ -450,6 +536,74 @@ async def get_next_id(collection_name: str):
         logger.error(f"Error getting next ID for {collection_name}: {e}")
         return 1
 
+async def allocate_ids(collection_name: str, count: int = 1) -> int:
+    """Reserve `count` consecutive ids atomically and return the first (see id_counters)."""
+    return await _allocate_ids(db, collection_name, count)
+
+
+async def find_employee_public(employee_id: str, company_id: Optional[int] = None) -> Optional[Dict]:
+    """Resolve an employee's non-secret fields, from the in-memory directory when enabled."""
+    if directory_enabled():
+        await employee_directory.ensure_loaded(db)
+        entry = employee_directory.lookup(employee_id, company_id)
+        if entry:
+            return entry
+    query = {"employee_id": employee_id}
+    if company_id is not None:
+        query["company_id"] = company_id
+    employee = await db.employees.find_one(query)
+    if employee and directory_enabled():
+        # written by another worker since the last reload
+        employee_directory.upsert(employee)
+    return employee
+
+def _client_ip(request: Optional[Request]) -> Optional[str]:
+    if request is None:
+        return None
+    peer = request.client.host if request.client else None
+    return client_ip(peer, request.headers.get("X-Forwarded-For"))
+
+def enforce_login_throttle(request: Optional[Request], account: Optional[str]) -> None:
+    """Reject a login attempt over the sliding-window limits before any DB/bcrypt work."""
+    retry_after = login_throttle.check(_client_ip(request), account)
+    if retry_after is not None:
+        logger.warning(f"Login throttled: ip={_client_ip(request)} account={account}")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts, please retry later",
+            headers={"Retry-After": str(max(int(retry_after) + 1, 1))}
+        )
+
+def _bearer_token(authorization: Optional[str]) -> Optional[str]:
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return token.strip()
+
+def _issue_tokens(employee: Dict) -> Dict:
+    """Token pair for a logged-in employee, or no token fields at all.
+
+    Legacy records without a numeric id (and every login while AUTH_TOKEN_SECRET
+    is unset) still log in; the response just carries no session tokens.
+    """
+    try:
+        return issue_token_pair(employee)
+    except TokenError as e:
+        logger.warning(f"No session token for employee {employee.get('employee_id')}: {e}")
+        return {}
+
+async def get_current_claims(authorization: Optional[str] = Header(None)) -> Dict:
+    """Dependency: authorize a request from its signed access token only (no DB access)."""
+    token = _bearer_token(authorization)
+    if not token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing bearer token")
+    try:
+        return decode_token(token, expected_type="access")
+    except TokenError as e:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(e))
+
 # ==================== ROUTES ====================
 
 # Health Check
@@ -512,8 +666,11 @@ async def test_login():
 
 # Login Route
 @api_router.post("/login", response_model=LoginResponse)
-async def login(login_data: LoginRequest):
+async def login(login_data: LoginRequest, request: Request = None):
     logger.info(f"Login attempt with data: email={login_data.email}, employee_id={login_data.employee_id}, company_id={login_data.company_id}")
+    # callers that already throttled (auth_login) pass request=None
+    if request is not None:
+        enforce_login_throttle(request, login_data.email or login_data.employee_id)
     
     # Find employee by email or employee_id
     if login_data.email:
@@ -628,6 +785,8 @@ async def login(login_data: LoginRequest):
     except Exception:
         resp_company_id = 1
 
+    tokens = _issue_tokens({**employee, "company_id": resp_company_id})
+
     return LoginResponse(
         id=resp_id,
         email=str(employee.get("email", f"{employee.get('employee_id')}@example.com")),
@@ -636,12 +795,13 @@ async def login(login_data: LoginRequest):
         rol=str(employee.get("rol", "")),
         employee_id=str(employee.get("employee_id", "")),
         company_id=resp_company_id,
-        pozisyon=str(employee.get("pozisyon", ""))
+        pozisyon=str(employee.get("pozisyon", "")),
+        **tokens
     )
 
 # Alternative login endpoint for backward compatibility
 @api_router.post("/auth/login")
-async def auth_login(request: dict):
+async def auth_login(request: dict, http_request: Request):
     """Alternative login endpoint that accepts any JSON structure"""
     logger.info(f"Auth login attempt with data: {request}")
     
@@ -650,6 +810,8 @@ async def auth_login(request: dict):
     password = request.get("password") or request.get("pin") or ""
     company_id = request.get("company_id") or request.get("companyId") or 1
     email = request.get("email")
+
+    enforce_login_throttle(http_request, email or employee_id)
     
     # Convert to LoginRequest format
     login_data = LoginRequest(
@@ -679,7 +841,8 @@ async def auth_login(request: dict):
                 rol=emp.get("rol"),
                 employee_id=emp.get("employee_id"),
                 company_id=emp.get("company_id", 1),
-                pozisyon=emp.get("pozisyon", "")
+                pozisyon=emp.get("pozisyon", ""),
+                **_issue_tokens(emp)
             )
     
     try:
@@ -695,7 +858,7 @@ async def auth_login(request: dict):
 
 # Test login with GET (for debugging)
 @api_router.get("/login-test")
-async def login_test(employee_id: str = "1000", password: str = "admin123"):
+async def login_test(request: Request, employee_id: str = "1000", password: str = "admin123"):
     """Test login endpoint with GET method"""
     login_data = LoginRequest(
         employee_id=employee_id,
@@ -704,7 +867,7 @@ async def login_test(employee_id: str = "1000", password: str = "admin123"):
     )
     
     try:
-        result = await login(login_data)
+        result = await login(login_data, request)
         return {
             "success": True,
             "data": result,
@@ -722,7 +885,7 @@ async def login_test(employee_id: str = "1000", password: str = "admin123"):
 @api_router.get("/check-user/{employee_id}")
 async def check_user(employee_id: str):
     """Check if a user exists with given employee_id"""
-    employee = await db.employees.find_one({"employee_id": employee_id})
+    employee = await find_employee_public(employee_id)
     
     if employee:
         return {
@@ -730,7 +893,7 @@ async def check_user(employee_id: str):
             "employee_id": employee.get("employee_id"),
             "name": f"{employee.get('ad')} {employee.get('soyad')}",
             "email": employee.get("email"),
-            "has_password": bool(employee.get("password")),
+            "has_password": bool(employee.get("has_password", employee.get("password"))),
             "company_id": employee.get("company_id"),
             "rol": employee.get("rol")
         }
@@ -747,10 +910,12 @@ async def check_user(employee_id: str):
 
 # Simple PIN login for backward compatibility
 @api_router.post("/pin-login")
-async def pin_login(data: dict):
+async def pin_login(data: dict, request: Request):
     """Simple PIN-based login for backward compatibility"""
     employee_id = data.get("employee_id", "")
     pin = data.get("pin", "")
+
+    enforce_login_throttle(request, employee_id)
     
     logger.info(f"PIN login attempt: employee_id={employee_id}")
     
@@ -765,7 +930,7 @@ async def pin_login(data: dict):
         "1004": "1004"
     }
     
-    employee = await db.employees.find_one({"employee_id": employee_id})
+    employee = await find_employee_public(employee_id)
     
     if not employee:
         logger.error(f"Employee not found: {employee_id}")
@@ -797,9 +962,53 @@ async def pin_login(data: dict):
             "company_id": employee.get("company_id", 1),
             "pozisyon": employee.get("pozisyon", "")
         },
+        **_issue_tokens(employee),
         "message": "Giriş başarılı"
     }
 
+# Token refresh / logout / identity (signed tokens, no DB access)
+@api_router.post("/auth/refresh")
+async def auth_refresh(data: RefreshRequest):
+    """Exchange a refresh token for a new access/refresh pair (the old refresh token is revoked)."""
+    try:
+        return refresh_token_pair(data.refresh_token)
+    except TokenError as e:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(e))
+
+@api_router.post("/auth/logout")
+async def auth_logout(data: Optional[RefreshRequest] = None, authorization: Optional[str] = Header(None)):
+    """Revoke the presented access token and, if given, the refresh token."""
+    revoked = 0
+    candidates = [(_bearer_token(authorization), "access")]
+    if data:
+        candidates.append((data.refresh_token, "refresh"))
+    for token, token_type in candidates:
+        if not token:
+            continue
+        try:
+            claims = decode_token(token, expected_type=token_type)
+        except TokenError:
+            continue
+        revoke(claims["jti"], claims["exp"])
+        revoked += 1
+    return {"success": True, "revoked": revoked}
+
+@api_router.get("/auth/me")
+async def auth_me(claims: Dict = Depends(get_current_claims)):
+    """Return the identity carried by the access token."""
+    return {
+        "id": claims["sub"],
+        "employee_id": claims["eid"],
+        "company_id": claims["cid"],
+        "rol": claims["rol"],
+        "expires_at": claims["exp"],
+    }
+
+@api_router.get("/metrics/login-throttle")
+async def login_throttle_metrics():
+    """Sliding-window login throttle counters for this worker."""
+    return login_throttle.stats()
+
 # Company Routes
 @api_router.get("/companies", response_model=List[Company])
 async def get_companies():
@@ -831,10 +1040,25 @@ async def create_employee(employee: EmployeeCreate):
         "id": next_id,
         **employee.dict()
     }
-    await db.employees.insert_one(new_employee)
+    try:
+        await db.employees.insert_one(new_employee)
+    except DuplicateKeyError as e:
+        raise HTTPException(status_code=400, detail=_duplicate_employee_detail(e))
+    employee_directory.upsert(new_employee)
+    employee_directory.publish_change()
     return new_employee
 
 
+def _duplicate_employee_detail(e: DuplicateKeyError) -> str:
+    """Client-facing message for a unique-index violation on employees (email, employee_id per company)."""
+    fields = list(((e.details or {}).get("keyPattern") or {}).keys())
+    if fields == ["email"]:
+        return "Employee with that email already exists"
+    if "employee_id" in fields:
+        return "Employee with that employee_id already exists in this company"
+    return "Employee with that email or employee_id already exists"
+
+
 # Simple register endpoint to support frontend registration flow
 @api_router.post("/register")
 async def register(data: dict):
@@ -882,7 +1106,13 @@ async def register(data: dict):
             logger.error(f"Error hashing password during registration for {data.get('email')}: {e}")
             raise HTTPException(status_code=500, detail="Error processing password")
 
-    await db.employees.insert_one(new_employee)
+    try:
+        await db.employees.insert_one(new_employee)
+    except DuplicateKeyError as e:
+        # lost a race with another registration past the check above
+        raise HTTPException(status_code=400, detail=_duplicate_employee_detail(e))
+    employee_directory.upsert(new_employee)
+    employee_directory.publish_change()
 
     return {"success": True, "employee": new_employee, "message": "Kayıt başarılı"}
 
@@ -900,15 +1130,21 @@ async def update_employee(employee_id: int, employee_update: EmployeeUpdate):
             logger.error(f"Error hashing password for employee {employee_id}: {e}")
             raise HTTPException(status_code=500, detail="Error processing password")
     
-    result = await db.employees.update_one(
-        {"id": employee_id},
-        {"$set": update_data}
-    )
+    try:
+        result = await db.employees.update_one(
+            {"id": employee_id},
+            {"$set": update_data}
+        )
+    except DuplicateKeyError as e:
+        raise HTTPException(status_code=400, detail=_duplicate_employee_detail(e))
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Employee not found")
     
     updated_employee = await db.employees.find_one({"id": employee_id})
+    if updated_employee:
+        employee_directory.upsert(updated_employee)
+        employee_directory.publish_change()
     return updated_employee
 
 @api_router.delete("/employees/{employee_id}")
@@ -916,6 +1152,8 @@ async def delete_employee(employee_id: int):
     result = await db.employees.delete_one({"id": employee_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Employee not found")
+    employee_directory.remove(employee_id)
+    employee_directory.publish_change()
     return {"message": "Employee deleted successfully"}
 
 # Role Routes
@@ -1382,6 +1620,8 @@ async def ensure_admin():
         "password": bcrypt.hashpw("admin123".encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
     }
     await db.employees.insert_one(admin_user)
+    employee_directory.upsert(admin_user)
+    employee_directory.publish_change()
     
     return {
         "message": "Admin user created successfully",
@@ -1392,49 +1632,39 @@ async def ensure_admin():
 
 # Migration endpoint - Add passwords to existing users
 @api_router.post("/migrate-passwords")
-async def migrate_passwords():
-    """Add default passwords to existing users without passwords"""
-    updated_count = 0
-    
-    # Default passwords for known users
-    default_passwords = {
-        "1000": "admin123",
-        "1001": "mehmet123",
-        "1002": "zeynep123",
-        "1003": "ayse123", 
-        "1004": "ali123",
-        "2001": "arda2024"
-    }
-    
-    # Get all employees
-    employees = await db.employees.find({}).to_list(None)
-    
-    for employee in employees:
-        if not employee.get("password"):
-            employee_id = employee.get("employee_id")
-            # Use default password based on employee_id or generate one
-            if employee_id in default_passwords:
-                password = default_passwords[employee_id]
-            else:
-                password = f"user{employee_id}"
-            
-            hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-            
-            await db.employees.update_one(
-                {"id": employee["id"]},
-                {"$set": {"password": hashed_password}}
-            )
-            updated_count += 1
-            logger.info(f"Password set for {employee['ad']} {employee['soyad']} (ID: {employee_id})")
-    
-    return {
-        "message": f"Passwords updated for {updated_count} users",
+async def migrate_passwords(batch_size: int = 500):
+    """Queue the default-password migration for employees without a password.
+
+    The batched, resumable migration from password_migration hashes on a
+    process pool, so it runs on an RQ worker (tasks.migrate_passwords_job)
+    when REDIS_URL is set. Without Redis, or if the enqueue fails, it runs as
+    a background task on this API worker; progress is kept on the
+    `migrations` checkpoint document either way.
+    """
+    try:
+        from .cache import get_queue, redis_configured
+        from .password_migration import start_local_migration
+    except Exception:
+        from cache import get_queue, redis_configured
+        from password_migration import start_local_migration
+
+    response = {
         "default_passwords": {
             "admin (1000)": "admin123",
             "arda (2001)": "arda2024",
             "others": "Check logs or use default pattern"
-        }
+        },
     }
+    if redis_configured():
+        try:
+            job = get_queue().enqueue("backend.tasks.migrate_passwords_job", batch_size=batch_size, job_timeout=3600)
+            return {"message": "Password migration queued", "job_id": job.id, **response}
+        except Exception:
+            logger.exception("RQ enqueue failed for the password migration; running it in-process")
+
+    if not start_local_migration(db, batch_size=batch_size):
+        return {"message": "Password migration already running", "job_id": None, **response}
+    return {"message": "Password migration started", "job_id": None, **response}
 
 
 # Admin password reset endpoint (gated by env var)
@@ -1454,6 +1684,7 @@ async def reset_admin_password(payload: Dict[str, str]):
     result = await db.employees.update_one({"email": "admin@example.com"}, {"$set": {"password": hashed}})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Admin user not found")
+    employee_directory.invalidate_everywhere()
 
     return {"message": "Admin password updated", "email": "admin@example.com"}
 
@@ -1560,12 +1791,15 @@ async def get_stok_urunleri(company_id: int = 1):
 
 @api_router.post("/stok/urunler", response_model=StokUrun)
 async def create_stok_urun(urun: StokUrunCreate):
-    next_id = await get_next_id("stok_urun")
+    next_id = await allocate_ids("stok_urun")
     new_urun = {
         "id": next_id,
         **urun.dict()
     }
-    await db.stok_urun.insert_one(new_urun)
+    try:
+        await db.stok_urun.insert_one(new_urun)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Bu isimde bir stok ürünü zaten var")
     return new_urun
 
 @api_router.put("/stok/urunler/{urun_id}", response_model=StokUrun)
@@ -1574,15 +1808,21 @@ async def update_stok_urun(urun_id: int, urun_update: StokUrunUpdate):
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
     
-    result = await db.stok_urun.update_one(
-        {"id": urun_id},
-        {"$set": update_data}
-    )
+    try:
+        result = await db.stok_urun.update_one(
+            {"id": urun_id},
+            {"$set": update_data}
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Bu isimde bir stok ürünü zaten var")
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
     
     updated_urun = await db.stok_urun.find_one({"id": urun_id})
+    if "min_stok" in update_data:
+        # a new threshold can cross on its own
+        await _observe_low_stock(updated_urun, updated_urun.get("mevcut") or 0)
     return updated_urun
 
 @api_router.delete("/stok/urunler/{urun_id}")
@@ -1627,8 +1867,32 @@ async def create_stok_sayim(sayim: StokSayimCreate):
         **sayim.dict()
     }
     await db.stok_sayim.insert_one(new_sayim)
+    # a count is an observation: it is logged and checked against min_stok, live stock is left alone
+    movement_log.record(db, sayim.urun_id, "count", count=sayim.miktar, company_id=sayim.company_id, ref_type="count", ref_id=next_id)
+    await _observe_low_stock({"id": sayim.urun_id}, sayim.miktar)
     return new_sayim
 
+
+async def _observe_low_stock(urun: dict, mevcut: float):
+    """Report a new `mevcut` to the low-stock tracker; never fails the caller."""
+    try:
+        low_stock.forget(urun["id"])
+        await low_stock.observe(db, {urun["id"]: float(mevcut)})
+    except Exception:
+        logger.exception("Low-stock check failed for stok_urun %s", urun.get("id"))
+
+
+@api_router.get("/stok/low")
+async def get_low_stock(company_id: int = 1):
+    """Items at or below min_stok, read from the incrementally maintained low-stock set."""
+    return await low_stock.low_items(db, company_id)
+
+
+@api_router.post("/stok/low/rebuild")
+async def rebuild_low_stock(company_id: Optional[int] = None):
+    """Recompute the low-stock set with one scan of stok_urun."""
+    return {"low": await low_stock.rebuild(db, company_id)}
+
 # Seed data endpoint
 @api_router.post("/seed-data")
 async def seed_data(force: bool = False):
@@ -1823,6 +2087,7 @@ async def seed_data(force: bool = False):
         }
     ]
     await db.employees.insert_many(employees)
+    employee_directory.invalidate_everywhere()
     
     # Seed attendance records (including for Arda)
     today = datetime.now(timezone.utc).date().isoformat()
@@ -2224,24 +2489,37 @@ async def salary_all_xlsx(month: str):
     return StreamingResponse(stream, media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', headers={"Content-Disposition": f"attachment; filename=\"{fname}\""})
 
 
+async def _latest_sayim_miktar(urun_ids):
+    """Latest counted miktar per product, in one aggregation over the stok_sayim_urun_tarih index."""
+    if not urun_ids:
+        return {}
+    pipeline = [
+        {"$match": {"urun_id": {"$in": urun_ids}}},
+        # same-day counts: the later one (higher id) wins
+        {"$sort": {"urun_id": 1, "tarih": -1, "id": -1}},
+        {"$group": {"_id": "$urun_id", "miktar": {"$first": "$miktar"}}},
+    ]
+    return {row["_id"]: row["miktar"] async for row in db.stok_sayim.aggregate(pipeline)}
+
+
 @api_router.get("/stok-export")
 async def stok_export(company_id: int = 1):
     # export stock products and last known stock (if any)
-    urunler = await db.stok_urun.find({"company_id": company_id}).to_list(None)
-    # try to get last sayim quantities
-    results = []
-    for u in urunler:
-        # lookup latest sayim for this product
-        sayim = await db.stok_sayim.find({"urun_id": u.get("id")}).sort([("tarih", -1)]).to_list(1)
-        miktar = sayim[0].get("miktar") if sayim else ""
-        results.append({
+    urunler = await db.stok_urun.find(
+        {"company_id": company_id}, {"_id": 0, "id": 1, "ad": 1, "birim_id": 1, "kategori_id": 1, "min_stok": 1}
+    ).to_list(None)
+    son_sayimlar = await _latest_sayim_miktar([u.get("id") for u in urunler])
+    results = [
+        {
             "id": u.get("id"),
             "ad": u.get("ad"),
             "birim_id": u.get("birim_id"),
             "kategori_id": u.get("kategori_id"),
             "min_stok": u.get("min_stok", 0),
-            "mevcut_miktar": miktar,
-        })
+            "mevcut_miktar": son_sayimlar.get(u.get("id"), ""),
+        }
+        for u in urunler
+    ]
     wb = _workbook_from_dicts(results, headers=["id", "ad", "birim_id", "kategori_id", "min_stok", "mevcut_miktar"], sheet_name="Stok")
     stream = io.BytesIO()
     wb.save(stream)
@@ -2264,46 +2542,35 @@ async def stok_template():
 
 
 @api_router.post("/stok-import")
-async def stok_import(file: UploadFile = File(...), company_id: int = 1):
-    # parse uploaded XLSX and insert/update stok_urun
+async def stok_import(file: UploadFile = File(...), company_id: int = 1, background: bool = False):
+    """Import stok_urun rows from an XLSX upload.
+
+    The sheet is streamed and upserted in chunks; rows with bad cells are
+    reported in `errors` (row number, column, message) and the rest are imported.
+    With background=true the upload is spooled and queued, and the job id is
+    returned at once; poll /imports/{job_id} for progress.
+    """
+    if background:
+        job = await start_import_job(db, file.file, company_id=company_id, filename=file.filename)
+        return {"queued": True, "job_id": job["id"], "backend": job["backend"]}
     try:
-        content = await file.read()
-        stream = io.BytesIO(content)
-        wb = openpyxl.load_workbook(stream)
-        ws = wb.active
-        rows = list(ws.iter_rows(values_only=True))
-        if not rows or len(rows) < 2:
-            raise HTTPException(status_code=400, detail="Dosya boş veya başlık yok")
-        headers = [str(h).strip() for h in rows[0]]
-        created = 0
-        updated = 0
-        for r in rows[1:]:
-            data = {headers[i]: r[i] for i in range(len(headers))}
-            # expect at least 'ad' field
-            if not data.get('ad'):
-                continue
-            # try to match by name
-            existing = await db.stok_urun.find_one({"company_id": company_id, "ad": data.get('ad')})
-            doc = {
-                "company_id": company_id,
-                "ad": data.get('ad'),
-                "birim_id": int(data.get('birim_id')) if data.get('birim_id') else None,
-                "kategori_id": int(data.get('kategori_id')) if data.get('kategori_id') else None,
-                "min_stok": float(data.get('min_stok') or 0)
-            }
-            if existing:
-                await db.stok_urun.update_one({"id": existing['id']}, {"$set": doc})
-                updated += 1
-            else:
-                next_id = await get_next_id('stok_urun')
-                doc['id'] = next_id
-                await db.stok_urun.insert_one(doc)
-                created += 1
-        return {"created": created, "updated": updated}
+        return await import_stok_workbook(db, file.file, company_id=company_id, filename=file.filename)
+    except ImportFileError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
+        logger.exception("Stok import failed")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@api_router.get("/imports/{job_id}")
+async def import_job(job_id: str):
+    """Status of a background import: rows processed, rows/sec, errors and ETA."""
+    job = await import_job_status(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
+
 # Debug endpoint to validate Sentry and logging in production.
 # Usage:
 #  - POST /api/debug/sentry-test            -> sends a Sentry message (if configured) and returns 200
@@ -0,0 +1,412 @@
+"""Streaming XLSX import for stok_urun.
+
+The workbook is opened read-only and parsed chunk by chunk in a worker
+thread, so neither the file nor its rows are ever fully in memory. The
+company's existing products are looked up by name once, up front. Each
+chunk becomes one unordered bulk_write of upserts keyed on
+(company_id, ad), backed by a unique index, so a re-run or a concurrent
+import never creates duplicates. New products take their ids from the
+shared id counter, one range per chunk. A bad cell only rejects its own
+row: the result lists row-level errors next to the created/updated counts.
+Movements are recorded only for rows the bulk write actually stored.
+
+A `mevcut_miktar` column is an observed quantity, like a stock count: it
+is logged as an "import" movement and checked against min_stok, but never
+written to `mevcut`. Exported sheets carry the latest count, so a round
+trip must not roll live stock back to it.
+
+Large sheets can run as background jobs: the upload is spooled to
+STOK_IMPORT_SPOOL_DIR, a job document in `import_jobs` is created and the
+RQ queue "imports" (or, without Redis, an in-process task) runs the import
+and writes its progress (rows, rows/sec, errors, ETA) to that document
+after every chunk. The spool directory must be shared with the RQ workers.
+In-process jobs die with their API worker. A local job records its owner
+(host, pid and a per-process worker id) and the owner refreshes
+`heartbeat_at` every STOK_IMPORT_HEARTBEAT_SECONDS while the job runs, even
+when a chunk takes long. Reading the status of a job whose heartbeat is
+older than STOK_IMPORT_STALE_SECONDS marks it failed and removes its spool
+file, instead of reporting "running" forever; a live job of another worker
+keeps beating and is never touched.
+"""
+import asyncio
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import openpyxl
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+try:
+    from .cache import get_queue, redis_configured  # type: ignore
+    from .id_counters import allocate_ids  # type: ignore
+    from .inventory_movements import movement_log  # type: ignore
+    from .low_stock import low_stock  # type: ignore
+except Exception:
+    from cache import get_queue, redis_configured
+    from id_counters import allocate_ids
+    from inventory_movements import movement_log
+    from low_stock import low_stock
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 200
+IMPORT_JOBS = "import_jobs"
+
+
+class ImportFileError(ValueError):
+    """The file as a whole cannot be imported (not a workbook, no header, no `ad` column)."""
+
+
+class RowError(ValueError):
+    def __init__(self, field: str, message: str):
+        super().__init__(message)
+        self.field = field
+
+
+def _int(data: Dict[str, Any], field: str) -> Optional[int]:
+    value = data.get(field)
+    if value in (None, ""):
+        return None
+    try:
+        as_float = float(value)
+    except (TypeError, ValueError):
+        raise RowError(field, f"'{field}' sayı olmalı: {value!r}")
+    if not as_float.is_integer():
+        raise RowError(field, f"'{field}' tam sayı olmalı: {value!r}")
+    return int(as_float)
+
+
+def _float(data: Dict[str, Any], field: str, default: Optional[float] = None) -> Optional[float]:
+    value = data.get(field)
+    if value in (None, ""):
+        return default
+    try:
+        number = float(str(value).replace(",", ".")) if isinstance(value, str) else float(value)
+    except (TypeError, ValueError):
+        raise RowError(field, f"'{field}' sayı olmalı: {value!r}")
+    if number < 0:
+        raise RowError(field, f"'{field}' negatif olamaz: {value!r}")
+    return number
+
+
+def parse_row(data: Dict[str, Any], company_id: int) -> Tuple[Dict[str, Any], Optional[float]]:
+    """Validate one sheet row. Returns (stok_urun fields, mevcut_miktar or None)."""
+    ad = str(data.get("ad") or "").strip()
+    if not ad:
+        raise RowError("ad", "'ad' boş olamaz")
+    doc = {
+        "company_id": company_id,
+        "ad": ad,
+        "birim_id": _int(data, "birim_id"),
+        "kategori_id": _int(data, "kategori_id"),
+        "min_stok": _float(data, "min_stok", 0.0),
+    }
+    return doc, _float(data, "mevcut_miktar")
+
+
+def open_rows(source) -> Tuple[List[str], Iterator[tuple], Callable[[], None], Optional[int]]:
+    """Open a workbook read-only. Returns (headers, row iterator, close, data row count if the sheet declares it)."""
+    try:
+        wb = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    except Exception as e:
+        raise ImportFileError(f"Dosya okunamadı: {e}")
+    ws = wb.active
+    # read-only sheets take max_row from the stored dimension, which some writers omit
+    total = ws.max_row - 1 if ws.max_row else None
+    rows = ws.iter_rows(values_only=True)
+    header = next(rows, None)
+    if not header:
+        wb.close()
+        raise ImportFileError("Dosya boş veya başlık yok")
+    headers = [str(h).strip() if h is not None else "" for h in header]
+    if "ad" not in headers:
+        wb.close()
+        raise ImportFileError("'ad' sütunu bulunamadı")
+    return headers, rows, wb.close, total
+
+
+async def import_stok_workbook(
+    db,
+    source,
+    company_id: int = 1,
+    filename: Optional[str] = None,
+    chunk_size: int = CHUNK_SIZE,
+    progress: Optional[Callable[[Dict[str, Any]], Any]] = None,
+) -> Dict[str, Any]:
+    """Import a stock sheet from a path or seekable file object.
+
+    `progress`, if given, is awaited (or called) with the running stats
+    after every chunk.
+    """
+    headers, rows, close, total = await asyncio.to_thread(open_rows, source)
+    stats: Dict[str, Any] = {"total_rows": total, "rows": 0, "created": 0, "updated": 0, "skipped": 0, "error_count": 0, "errors": []}
+    started = time.monotonic()
+
+    def error(row_no: int, field: Optional[str], message: str) -> None:
+        stats["error_count"] += 1
+        if len(stats["errors"]) < MAX_REPORTED_ERRORS:
+            stats["errors"].append({"row": row_no, "field": field, "error": message})
+
+    try:
+        # one read of the company's products for the whole file
+        existing = {
+            d["ad"]: d
+            async for d in db.stok_urun.find({"company_id": company_id}, {"_id": 0, "id": 1, "ad": 1})
+            if d.get("ad")
+        }
+        row_no = 1  # the header is row 1
+
+        while True:
+            chunk = await asyncio.to_thread(lambda: list(islice(rows, chunk_size)))
+            if not chunk:
+                break
+            parsed: List[Tuple[int, Dict[str, Any], Optional[float]]] = []
+            for values in chunk:
+                row_no += 1
+                if values is None or all(v in (None, "") for v in values):
+                    stats["skipped"] += 1
+                    continue
+                stats["rows"] += 1
+                data = {h: values[i] if i < len(values) else None for i, h in enumerate(headers) if h}
+                try:
+                    doc, miktar = parse_row(data, company_id)
+                except RowError as e:
+                    error(row_no, e.field, str(e))
+                    continue
+                parsed.append((row_no, doc, miktar))
+
+            # one atomic id range for the chunk's new names
+            new_names = list(dict.fromkeys(doc["ad"] for _, doc, _ in parsed if doc["ad"] not in existing))
+            first_id = await allocate_ids(db, "stok_urun", len(new_names)) if new_names else 0
+            for n, ad in enumerate(new_names):
+                existing[ad] = {"id": first_id + n, "ad": ad, "new": True}
+
+            ops: List[UpdateOne] = []
+            for _, doc, miktar in parsed:
+                update = {"$set": dict(doc), "$setOnInsert": {"id": existing[doc["ad"]]["id"]}}
+                ops.append(UpdateOne({"company_id": company_id, "ad": doc["ad"]}, update, upsert=True))
+
+            failed: Dict[int, str] = {}
+            upserted: set = set()
+            if ops:
+                try:
+                    result = await db.stok_urun.bulk_write(ops, ordered=False)
+                    upserted = set(result.upserted_ids or {})
+                except BulkWriteError as bwe:
+                    failed = {e["index"]: e.get("errmsg", "yazılamadı") for e in bwe.details.get("writeErrors", [])}
+                    upserted = {u["index"] for u in bwe.details.get("upserted", [])}
+
+            # a name another writer inserted after our lookup matched its row instead of inserting ours
+            inserted_names = {parsed[i][1]["ad"] for i in upserted}
+            raced = list({doc["ad"] for i, (_, doc, _) in enumerate(parsed)
+                          if i not in failed and existing[doc["ad"]].get("new")} - inserted_names)
+            if raced:
+                async for d in db.stok_urun.find({"company_id": company_id, "ad": {"$in": raced}}, {"_id": 0, "id": 1, "ad": 1}):
+                    existing[d["ad"]].update(id=d["id"], new=False)
+
+            # movements and low-stock checks follow only the rows that were written
+            counts: Dict[int, float] = {}
+            for i, (op_row, doc, miktar) in enumerate(parsed):
+                current = existing[doc["ad"]]
+                if i in failed:
+                    error(op_row, None, failed[i])
+                    if current.get("new") and i not in upserted:
+                        existing.pop(doc["ad"], None)
+                    continue
+                if i in upserted:
+                    stats["created"] += 1
+                    current["new"] = False
+                else:
+                    stats["updated"] += 1
+                if miktar is None:
+                    continue
+                counts[current["id"]] = miktar
+                movement_log.record(db, current["id"], "import", count=miktar, company_id=company_id, ref_type="import", ref_id=filename)
+            try:
+                for sid in counts:
+                    low_stock.forget(sid)
+                await low_stock.observe(db, counts)
+            except Exception:
+                logger.exception("Low-stock check failed for stok import")
+
+            elapsed = time.monotonic() - started
+            stats["elapsed_seconds"] = round(elapsed, 3)
+            stats["rows_per_second"] = round(stats["rows"] / elapsed, 1) if elapsed > 0 else None
+            if progress is not None:
+                result = progress(stats)
+                if asyncio.iscoroutine(result):
+                    await result
+    finally:
+        await asyncio.to_thread(close)
+    logger.info("Stok import %s: %s rows, %s created, %s updated, %s errors",
+                filename, stats["rows"], stats["created"], stats["updated"], stats["error_count"])
+    return stats
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _spool_dir() -> str:
+    path = os.environ.get("STOK_IMPORT_SPOOL_DIR") or os.path.join(tempfile.gettempdir(), "stok_imports")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def spool_upload(fileobj, job_id: str) -> str:
+    """Copy an upload to the spool directory; blocking, run it in a thread."""
+    path = os.path.join(_spool_dir(), f"{job_id}.xlsx")
+    with open(path, "wb") as out:
+        shutil.copyfileobj(fileobj, out, 1024 * 1024)
+    return path
+
+
+_local_jobs: set = set()
+
+# identifies this process as the owner of the in-process jobs it runs
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _owner() -> Dict[str, Any]:
+    return {"worker": WORKER_ID, "host": socket.gethostname(), "pid": os.getpid()}
+
+
+async def start_import_job(db, fileobj, company_id: int = 1, filename: Optional[str] = None) -> Dict[str, Any]:
+    """Spool the upload, record the job and queue it. Returns the job document."""
+    job_id = uuid.uuid4().hex
+    path = await asyncio.to_thread(spool_upload, fileobj, job_id)
+    job = {
+        "id": job_id,
+        "kind": "stok_import",
+        "company_id": company_id,
+        "filename": filename,
+        "path": path,
+        "status": "queued",
+        "backend": "rq" if redis_configured() else "local",
+        "created_at": _now(),
+        "updated_at": _now(),
+    }
+    if job["backend"] == "local":
+        job.update(owner=_owner(), heartbeat_at=_now())
+    # the job document must exist before a worker can pick the id up
+    await db[IMPORT_JOBS].insert_one(dict(job))
+    if job["backend"] == "rq":
+        try:
+            timeout = int(os.environ.get("STOK_IMPORT_JOB_TIMEOUT", "3600"))
+            get_queue("imports").enqueue("backend.tasks.stok_import_job", job_id, job_timeout=timeout)
+        except Exception:
+            logger.exception("RQ enqueue failed for import job %s; running it in-process", job_id)
+            job.update(backend="local", owner=_owner(), heartbeat_at=_now())
+            await db[IMPORT_JOBS].update_one({"id": job_id}, {"$set": {k: job[k] for k in ("backend", "owner", "heartbeat_at")}})
+    if job["backend"] == "local":
+        task = asyncio.get_running_loop().create_task(_run_local(db, job_id), name=job_id)
+        _local_jobs.add(task)
+        task.add_done_callback(_local_jobs.discard)
+    return job
+
+
+async def _heartbeat(db, job_id: str) -> None:
+    interval = float(os.environ.get("STOK_IMPORT_HEARTBEAT_SECONDS", "30"))
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await db[IMPORT_JOBS].update_one({"id": job_id, "owner.worker": WORKER_ID}, {"$set": {"heartbeat_at": _now()}})
+        except Exception:
+            logger.exception("Heartbeat for import job %s failed", job_id)
+
+
+async def _run_local(db, job_id: str) -> None:
+    beat = asyncio.get_running_loop().create_task(_heartbeat(db, job_id))
+    try:
+        await run_import_job(db, job_id)
+    except Exception:
+        pass  # logged and recorded on the job document
+    finally:
+        beat.cancel()
+
+
+def _progress_fields(stats: Dict[str, Any]) -> Dict[str, Any]:
+    fields = {k: stats.get(k) for k in ("total_rows", "rows", "created", "updated", "skipped", "error_count", "errors", "rows_per_second", "elapsed_seconds")}
+    rate, total = stats.get("rows_per_second"), stats.get("total_rows")
+    # total_rows counts blank rows too; close enough for an estimate
+    done = stats.get("rows", 0) + stats.get("skipped", 0)
+    fields["eta_seconds"] = round(max(total - done, 0) / rate, 1) if rate and total else None
+    fields["updated_at"] = _now()
+    return fields
+
+
+async def run_import_job(db, job_id: str) -> Dict[str, Any]:
+    """Run one queued import job (RQ worker or in-process), recording progress on its document."""
+    job = await db[IMPORT_JOBS].find_one({"id": job_id}, {"_id": 0})
+    if job is None:
+        raise LookupError(f"import job {job_id} not found")
+    await db[IMPORT_JOBS].update_one({"id": job_id}, {"$set": {"status": "running", "started_at": _now(), "updated_at": _now()}})
+
+    async def progress(stats):
+        await db[IMPORT_JOBS].update_one({"id": job_id}, {"$set": _progress_fields(stats)})
+
+    try:
+        stats = await import_stok_workbook(db, job["path"], company_id=job["company_id"], filename=job.get("filename"), progress=progress)
+    except Exception as e:
+        logger.exception("Import job %s failed", job_id)
+        await db[IMPORT_JOBS].update_one({"id": job_id}, {"$set": {"status": "failed", "error": str(e), "finished_at": _now(), "updated_at": _now()}})
+        raise
+    finally:
+        try:
+            os.remove(job["path"])
+        except OSError:
+            pass
+    done = {**_progress_fields(stats), "status": "done", "eta_seconds": 0, "finished_at": _now()}
+    await db[IMPORT_JOBS].update_one({"id": job_id}, {"$set": done})
+    return stats
+
+
+def _stale_query(max_age: Optional[float] = None) -> Dict[str, Any]:
+    if max_age is None:
+        max_age = float(os.environ.get("STOK_IMPORT_STALE_SECONDS", "180"))
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=max_age)).isoformat()
+    # RQ jobs are not covered: a queued RQ job may legitimately wait that long
+    return {
+        "backend": "local",
+        "status": {"$in": ["queued", "running"]},
+        # jobs started before owners were recorded only have their last progress write
+        "$or": [{"heartbeat_at": {"$lt": cutoff}}, {"heartbeat_at": {"$exists": False}, "updated_at": {"$lt": cutoff}}],
+    }
+
+
+async def fail_stale_import_jobs(db, job_id: str, max_age: Optional[float] = None) -> int:
+    """Mark an in-process job whose owner stopped beating as failed; returns 1 if it was."""
+    running_here = {t.get_name() for t in _local_jobs if not t.done()}
+    if job_id in running_here:
+        return 0
+    query = {**_stale_query(max_age), "id": job_id}
+    stale = await db[IMPORT_JOBS].find_one(query, {"_id": 0, "id": 1, "path": 1, "owner": 1})
+    if stale is None:
+        return 0
+    now = _now()
+    result = await db[IMPORT_JOBS].update_one(
+        query,
+        {"$set": {"status": "failed", "error": "Import interrupted: the API worker running it stopped", "finished_at": now, "updated_at": now}},
+    )
+    if not result.modified_count:
+        return 0  # its owner beat or finished in between
+    try:
+        os.remove(stale["path"])
+    except (KeyError, OSError):
+        pass
+    logger.warning("Import job %s lost its owner %s; marked failed", job_id, (stale.get("owner") or {}).get("worker"))
+    return 1
+
+
+async def import_job_status(db, job_id: str) -> Optional[Dict[str, Any]]:
+    await fail_stale_import_jobs(db, job_id=job_id)
+    return await db[IMPORT_JOBS].find_one({"id": job_id}, {"_id": 0, "path": 0})
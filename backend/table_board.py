@@ -0,0 +1,119 @@
+"""Live open-tables projection for the POS floor view.
+
+`pos_table_state` holds one document per (company, table) with an open
+adisyon: the open order ids, item count, running total, amount paid so far
+and when the first order was opened. Order create/pay/close keep it current
+with atomic $inc/$addToSet/$pull updates, so every API worker can write to it
+without coordination, and the board is one small read instead of a scan of
+`orders`. Each worker serves the board from memory for
+POS_TABLE_BOARD_TTL seconds and drops that copy on its own writes.
+
+Orders without a table (kiosk / takeaway) and orders fully paid at creation
+never appear on the board.
+"""
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+STATE = "pos_table_state"
+
+
+def _state_id(company_id: int, table: str) -> str:
+    return f"{company_id}:{table}"
+
+
+def _item_count(order: Dict[str, Any]) -> int:
+    return sum(int(it.get("quantity", 1)) for it in order.get("items", []))
+
+
+def _paid(order: Dict[str, Any]) -> float:
+    return round(sum(float(p.get("amount", 0)) for p in order.get("payments") or []), 2)
+
+
+class TableBoard:
+    def __init__(self, ttl_seconds: Optional[float] = None):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.environ.get("POS_TABLE_BOARD_TTL", "2"))
+        self._cache: Dict[int, Tuple[float, List[Dict[str, Any]]]] = {}
+
+    def _invalidate(self, company_id: int) -> None:
+        self._cache.pop(company_id, None)
+
+    async def order_opened(self, db, order: Dict[str, Any]) -> None:
+        if not order.get("table") or order.get("status") != "open":
+            return
+        company_id = int(order.get("company_id") or 1)
+        await db[STATE].update_one(
+            {"_id": _state_id(company_id, order["table"])},
+            {
+                "$addToSet": {"order_ids": order["id"]},
+                "$inc": {"item_count": _item_count(order), "total": float(order.get("total", 0)), "paid": _paid(order)},
+                "$setOnInsert": {"company_id": company_id, "table": order["table"], "opened_at": order.get("created_at")},
+            },
+            upsert=True,
+        )
+        self._invalidate(company_id)
+
+    async def payment_added(self, db, order: Dict[str, Any], amount: float) -> None:
+        if not order.get("table"):
+            return
+        company_id = int(order.get("company_id") or 1)
+        await db[STATE].update_one(
+            {"_id": _state_id(company_id, order["table"]), "order_ids": order["id"]},
+            {"$inc": {"paid": float(amount)}},
+        )
+        self._invalidate(company_id)
+
+    async def order_closed(self, db, order: Dict[str, Any]) -> None:
+        """Remove a settled or closed order; `order` carries its payments before this call."""
+        if not order.get("table"):
+            return
+        company_id = int(order.get("company_id") or 1)
+        state_id = _state_id(company_id, order["table"])
+        await db[STATE].update_one(
+            {"_id": state_id, "order_ids": order["id"]},
+            {
+                "$pull": {"order_ids": order["id"]},
+                "$inc": {"item_count": -_item_count(order), "total": -float(order.get("total", 0)), "paid": -_paid(order)},
+            },
+        )
+        await db[STATE].delete_one({"_id": state_id, "order_ids": []})
+        self._invalidate(company_id)
+
+    async def board(self, db, company_id: int) -> List[Dict[str, Any]]:
+        cached = self._cache.get(company_id)
+        if cached and time.monotonic() - cached[0] < self.ttl_seconds:
+            return cached[1]
+        states = await db[STATE].find({"company_id": company_id}, {"_id": 0}).to_list(None)
+        for s in states:
+            s["total"] = round(float(s.get("total", 0)), 2)
+            s["paid"] = round(float(s.get("paid", 0)), 2)
+            s["balance"] = round(s["total"] - s["paid"], 2)
+        self._cache[company_id] = (time.monotonic(), states)
+        return states
+
+    async def rebuild(self, db, company_id: Optional[int] = None) -> int:
+        """Recompute the projection from open orders (startup repair / after manual edits)."""
+        q: Dict[str, Any] = {"status": "open", "table": {"$ne": None}}
+        if company_id is not None:
+            q["company_id"] = company_id
+        states: Dict[str, Dict[str, Any]] = {}
+        async for order in db.orders.find(q, {"_id": 0}).sort("created_at", 1):
+            if not order.get("table"):
+                continue
+            cid = int(order.get("company_id") or 1)
+            state = states.setdefault(_state_id(cid, order["table"]), {
+                "company_id": cid, "table": order["table"], "opened_at": order.get("created_at"),
+                "order_ids": [], "item_count": 0, "total": 0.0, "paid": 0.0,
+            })
+            state["order_ids"].append(order["id"])
+            state["item_count"] += _item_count(order)
+            state["total"] += float(order.get("total", 0))
+            state["paid"] += _paid(order)
+        await db[STATE].delete_many({"company_id": company_id} if company_id is not None else {})
+        if states:
+            await db[STATE].insert_many([{"_id": sid, **state} for sid, state in states.items()])
+        self._cache.clear()
+        return len(states)
+
+
+table_board = TableBoard()
@@ -37,3 +37,120 @@ def precompute_salary_month(month: str, expire_seconds: int = 60 * 60 * 6):
     except Exception as e:
         logger.exception(f"Error precomputing salary for {month}: {e}")
         return False
+
+
+def migrate_passwords_job(batch_size: int = 500, workers: int = None):
+    """RQ job entrypoint for the bulk password migration."""
+    try:
+        try:
+            from .server import db  # type: ignore
+            from .password_migration import invalidate_directories, migrate_missing_passwords  # type: ignore
+        except Exception:
+            from server import db
+            from password_migration import invalidate_directories, migrate_missing_passwords
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        stats = loop.run_until_complete(migrate_missing_passwords(db, batch_size=batch_size, workers=workers))
+        loop.close()
+
+        # API workers cache has_password per employee; make them reload
+        if stats["updated"]:
+            invalidate_directories()
+
+        logger.info(f"Password migration finished: {stats}")
+        return stats
+    except Exception as e:
+        logger.exception(f"Error running password migration: {e}")
+        return False
+
+
+def print_job(job_id: str):
+    """RQ job entrypoint for one adisyon print job (queued per printer).
+
+    Failures are re-raised so RQ's Retry schedule applies; the last attempt
+    marks the job "dead" and RQ keeps it in the failed registry.
+    """
+    try:
+        from .server import db  # type: ignore
+        from .print_queue import run_print_job  # type: ignore
+    except Exception:
+        from server import db
+        from print_queue import run_print_job
+    from rq import get_current_job
+
+    job = get_current_job()
+    final_attempt = job is None or not job.retries_left
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(run_print_job(db, job_id, final_attempt=final_attempt))
+    finally:
+        loop.close()
+
+
+def rebuild_sales_rollups_job(company_id: int = None, day_from: str = None, day_to: str = None):
+    """RQ job entrypoint that recomputes POS sales rollups from orders."""
+    try:
+        try:
+            from .server import db  # type: ignore
+            from .sales_rollups import rebuild_rollups  # type: ignore
+        except Exception:
+            from server import db
+            from sales_rollups import rebuild_rollups
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        stats = loop.run_until_complete(rebuild_rollups(db, company_id, day_from, day_to))
+        loop.close()
+
+        logger.info(f"Sales rollup rebuild finished: {stats}")
+        return stats
+    except Exception as e:
+        logger.exception(f"Error rebuilding sales rollups: {e}")
+        return False
+
+
+def compact_inventory_movements_job(limit: int = 5000):
+    """RQ job entrypoint that folds inventory movements into stock level snapshots."""
+    try:
+        try:
+            from .server import db  # type: ignore
+            from .inventory_movements import compact_movements  # type: ignore
+        except Exception:
+            from server import db
+            from inventory_movements import compact_movements
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        stats = loop.run_until_complete(compact_movements(db, limit))
+        loop.close()
+
+        logger.info(f"Inventory movement compaction finished: {stats}")
+        return stats
+    except Exception as e:
+        logger.exception(f"Error compacting inventory movements: {e}")
+        return False
+
+
+def stok_import_job(job_id: str):
+    """RQ job entrypoint that runs a spooled stok import and records its progress."""
+    try:
+        try:
+            from .server import db  # type: ignore
+            from .stok_import import run_import_job  # type: ignore
+        except Exception:
+            from server import db
+            from stok_import import run_import_job
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        stats = loop.run_until_complete(run_import_job(db, job_id))
+        loop.close()
+
+        logger.info(f"Stok import job {job_id} finished: {stats['rows']} rows, {stats['error_count']} errors")
+        return {k: v for k, v in stats.items() if k != "errors"}
+    except Exception as e:
+        logger.exception(f"Error running stok import job {job_id}: {e}")
+        return False
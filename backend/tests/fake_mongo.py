@@ -0,0 +1,356 @@
+"""Tiny in-memory stand-in for the Motor collections used by the POS tests.
+
+Supports the query/update subset the POS module uses: equality, $in, $gte,
+$gt, $lt, $lte, $ne, $exists, $or/$and; $set, $setOnInsert, $inc, $max, $push
+($each/$slice), $addToSet, $pull;
+bulk_write with UpdateOne/InsertOne/DeleteOne, insert_one/insert_many and
+find_one_and_update; aggregate
+with $match/$sort/$group. Unique indexes from create_index(unique=True) are
+enforced on documents that have every indexed field.
+"""
+import copy
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+
+def _get(doc, path):
+    cur = doc
+    for part in path.split("."):
+        if not isinstance(cur, dict) or part not in cur:
+            return None, False
+        cur = cur[part]
+    return cur, True
+
+
+def _match_value(value, present, cond):
+    if isinstance(cond, dict) and any(k.startswith("$") for k in cond):
+        for op, arg in cond.items():
+            if op == "$in":
+                if isinstance(value, list):
+                    if not any(v in arg for v in value):
+                        return False
+                elif value not in arg:
+                    return False
+            elif op == "$gte":
+                if value is None or value < arg:
+                    return False
+            elif op == "$gt":
+                if value is None or value <= arg:
+                    return False
+            elif op == "$lte":
+                if value is None or value > arg:
+                    return False
+            elif op == "$lt":
+                if value is None or value >= arg:
+                    return False
+            elif op == "$ne":
+                if value == arg or (isinstance(value, list) and arg in value):
+                    return False
+            elif op == "$exists":
+                if bool(arg) != present:
+                    return False
+            else:
+                raise NotImplementedError(op)
+        return True
+    if isinstance(value, list) and not isinstance(cond, list):
+        return cond in value
+    return value == cond
+
+
+def matches(doc, query):
+    for key, cond in (query or {}).items():
+        if key == "$or":
+            if not any(matches(doc, q) for q in cond):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, q) for q in cond):
+                return False
+        else:
+            value, present = _get(doc, key)
+            if not _match_value(value, present, cond):
+                return False
+    return True
+
+
+def _parent(doc, path):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    return doc, parts[-1]
+
+
+def apply_update(doc, update, inserting=False):
+    for op, fields in update.items():
+        if op == "$setOnInsert" and not inserting:
+            continue
+        for key, arg in fields.items():
+            if op in ("$set", "$setOnInsert"):
+                parent, leaf = _parent(doc, key)
+                parent[leaf] = arg
+            elif op == "$addToSet":
+                arr = doc.setdefault(key, [])
+                if arg not in arr:
+                    arr.append(arg)
+            elif op == "$inc":
+                parent, leaf = _parent(doc, key)
+                parent[leaf] = parent.get(leaf, 0) + arg
+            elif op == "$max":
+                parent, leaf = _parent(doc, key)
+                if leaf not in parent or parent[leaf] < arg:
+                    parent[leaf] = arg
+            elif op == "$push":
+                arr = doc.setdefault(key, [])
+                if isinstance(arg, dict) and "$each" in arg:
+                    arr.extend(arg["$each"])
+                    if "$slice" in arg:
+                        doc[key] = arr[arg["$slice"]:] if arg["$slice"] < 0 else arr[:arg["$slice"]]
+                else:
+                    arr.append(arg)
+            elif op == "$pull":
+                drop = arg["$in"] if isinstance(arg, dict) and "$in" in arg else [arg]
+                doc[key] = [v for v in doc.get(key, []) if v not in drop]
+            else:
+                raise NotImplementedError(op)
+
+
+class Result:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, key, direction=None):
+        keys = key if isinstance(key, list) else [(key, direction or 1)]
+        for k, d in reversed(keys):
+            self._docs.sort(key=lambda x: (_get(x, k)[0] is None, _get(x, k)[0]), reverse=d == -1)
+        return self
+
+    def limit(self, n):
+        if n:
+            self._docs = self._docs[:n]
+        return self
+
+    def batch_size(self, _):
+        return self
+
+    async def to_list(self, length=None):
+        return self._docs if length is None else self._docs[:length]
+
+    def __aiter__(self):
+        self._it = iter(self._docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def _project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    if include:
+        # like Mongo, `_id` comes along unless excluded
+        return {k: copy.deepcopy(v) for k, v in doc.items() if k in include or (k == "_id" and projection.get("_id", 1))}
+    return {k: copy.deepcopy(v) for k, v in doc.items() if projection.get(k, 1)}
+
+
+class FakeCollection:
+    def __init__(self, docs=None, name="coll"):
+        self.docs = list(docs or [])
+        self.name = name
+        self.calls = []
+        self.unique = []
+
+    def _check_unique(self, doc, skip=None):
+        for fields in self.unique:
+            values = [_get(doc, f) for f in fields]
+            if not all(present for _, present in values):
+                continue
+            for d in self.docs:
+                if d is not skip and [_get(d, f) for f in fields] == values:
+                    raise DuplicateKeyError(f"duplicate key {fields}", 11000, {"keyPattern": {f: 1 for f in fields}})
+
+    def find(self, query=None, projection=None, session=None, **kwargs):
+        self.calls.append(("find", query))
+        return FakeCursor([_project(d, projection) for d in self.docs if matches(d, query)])
+
+    async def find_one(self, query=None, projection=None, sort=None, session=None, **kwargs):
+        self.calls.append(("find_one", query))
+        docs = [d for d in self.docs if matches(d, query)]
+        if sort:
+            docs = FakeCursor(docs).sort(sort)._docs
+        return _project(docs[0], projection) if docs else None
+
+    async def count_documents(self, query=None, **kwargs):
+        return len([d for d in self.docs if matches(d, query)])
+
+    async def insert_one(self, doc, session=None):
+        self.calls.append(("insert_one", doc))
+        if "_id" in doc and any(d.get("_id") == doc["_id"] for d in self.docs):
+            raise DuplicateKeyError(f"duplicate _id {doc['_id']!r}")
+        self._check_unique(doc)
+        self.docs.append(doc)
+        return Result(inserted_id=doc.get("id"))
+
+    async def insert_many(self, docs, ordered=True, session=None):
+        self.calls.append(("insert_many", docs))
+        errors = []
+        for i, doc in enumerate(docs):
+            try:
+                self._check_unique(doc)
+            except DuplicateKeyError as e:
+                errors.append({"index": i, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+                continue
+            self.docs.append(doc)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(docs) - len(errors)})
+        return Result(inserted_ids=[d.get("id") for d in docs])
+
+    async def update_one(self, query, update, upsert=False, session=None):
+        self.calls.append(("update_one", query))
+        return self._update_one(query, update, upsert)
+
+    def _update_one(self, query, update, upsert=False):
+        for d in self.docs:
+            if matches(d, query):
+                if self.unique:
+                    updated = copy.deepcopy(d)
+                    apply_update(updated, update)
+                    self._check_unique(updated, skip=d)
+                apply_update(d, update)
+                return Result(matched_count=1, modified_count=1, upserted_id=None)
+        if upsert:
+            doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+            apply_update(doc, update, inserting=True)
+            doc.setdefault("_id", ObjectId())
+            self._check_unique(doc)
+            self.docs.append(doc)
+            return Result(matched_count=0, modified_count=0, upserted_id=doc.get("_id"))
+        return Result(matched_count=0, modified_count=0, upserted_id=None)
+
+    async def find_one_and_update(self, query, update, projection=None, upsert=False, return_document=False, session=None, **kwargs):
+        self.calls.append(("find_one_and_update", query))
+        target = next((d for d in self.docs if matches(d, query)), None)
+        before = copy.deepcopy(target)
+        count = len(self.docs)
+        self._update_one(query, update, upsert)
+        if target is None and len(self.docs) > count:
+            target = self.docs[-1]  # upserted
+        doc = target if return_document else before  # True is ReturnDocument.AFTER
+        return _project(doc, projection) if doc is not None else None
+
+    async def update_many(self, query, update, session=None):
+        n = 0
+        for d in self.docs:
+            if matches(d, query):
+                apply_update(d, update)
+                n += 1
+        return Result(matched_count=n, modified_count=n)
+
+    async def delete_one(self, query, session=None):
+        for i, d in enumerate(self.docs):
+            if matches(d, query):
+                del self.docs[i]
+                return Result(deleted_count=1)
+        return Result(deleted_count=0)
+
+    async def delete_many(self, query, session=None):
+        before = len(self.docs)
+        self.docs = [d for d in self.docs if not matches(d, query)]
+        return Result(deleted_count=before - len(self.docs))
+
+    async def bulk_write(self, ops, ordered=True, session=None):
+        self.calls.append(("bulk_write", len(ops)))
+        matched = modified = inserted = 0
+        upserted = {}
+        errors = []
+        for i, op in enumerate(ops):
+            kind = type(op).__name__
+            try:
+                if kind == "InsertOne":
+                    self._check_unique(op._doc)
+                    self.docs.append(op._doc)
+                    inserted += 1
+                    continue
+                if kind == "DeleteOne":
+                    await self.delete_one(op._filter)
+                    continue
+                count = len(self.docs)
+                res = self._update_one(op._filter, op._doc, upsert=getattr(op, "_upsert", False))
+            except DuplicateKeyError as e:
+                errors.append({"index": i, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+                continue
+            matched += res.matched_count
+            modified += res.modified_count
+            if len(self.docs) > count:
+                upserted[i] = self.docs[-1].get("_id")
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "upserted": [{"index": i, "_id": v} for i, v in upserted.items()],
+                                  "nMatched": matched, "nModified": modified, "nInserted": inserted})
+        return Result(matched_count=matched, modified_count=modified, inserted_count=inserted,
+                      upserted_count=len(upserted), upserted_ids=upserted)
+
+    def aggregate(self, pipeline, session=None, **kwargs):
+        """$match, $sort and $group with $first accumulators."""
+        self.calls.append(("aggregate", pipeline))
+        docs = [copy.deepcopy(d) for d in self.docs]
+        for stage in pipeline:
+            (op, arg), = stage.items()
+            if op == "$match":
+                docs = [d for d in docs if matches(d, arg)]
+            elif op == "$sort":
+                docs = FakeCursor(docs).sort(list(arg.items()))._docs
+            elif op == "$group":
+                groups = {}
+                for d in docs:
+                    key = _get(d, arg["_id"][1:])[0] if isinstance(arg["_id"], str) else None
+                    row = groups.setdefault(key, {"_id": key})
+                    for field, acc in arg.items():
+                        if field == "_id":
+                            continue
+                        (acc_op, expr), = acc.items()
+                        value = _get(d, expr[1:])[0] if isinstance(expr, str) else expr
+                        if acc_op == "$first":
+                            row.setdefault(field, value)
+                        else:
+                            raise NotImplementedError(acc_op)
+                docs = list(groups.values())
+            else:
+                raise NotImplementedError(op)
+        return FakeCursor(docs)
+
+    async def drop_index(self, name, **kwargs):
+        return None
+
+    async def create_index(self, keys, **kwargs):
+        if kwargs.get("unique"):
+            self.unique.append([keys] if isinstance(keys, str) else [k for k, _ in keys])
+        return kwargs.get("name")
+
+
+class FakeDB:
+    def __init__(self, **collections):
+        self._collections = {}
+        for name, docs in collections.items():
+            self._collections[name] = FakeCollection(docs, name=name)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(name=name)
+        return self._collections[name]
@@ -0,0 +1,93 @@
+import pytest
+
+from backend import auth_tokens
+from backend.auth_tokens import TokenError, decode_token, issue_token_pair, refresh_token_pair, revoke
+
+
+EMPLOYEE = {"id": 7, "employee_id": "1007", "company_id": 2, "rol": "admin", "password": "secret"}
+
+
+@pytest.fixture(autouse=True)
+def token_secret(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN_SECRET", "test-secret")
+    monkeypatch.setattr(auth_tokens, "_secret", None)
+
+
+def test_issue_and_decode_access_token():
+    tokens = issue_token_pair(EMPLOYEE)
+    claims = decode_token(tokens["access_token"])
+    assert claims["sub"] == 7
+    assert claims["eid"] == "1007"
+    assert claims["cid"] == 2
+    assert claims["rol"] == "admin"
+    assert "password" not in claims
+
+
+def test_tampered_token_rejected():
+    token = issue_token_pair(EMPLOYEE)["access_token"]
+    payload, sig = token.split(".")
+    with pytest.raises(TokenError):
+        decode_token(payload + "." + sig[:-2] + "xx")
+
+
+def test_token_type_is_enforced():
+    tokens = issue_token_pair(EMPLOYEE)
+    with pytest.raises(TokenError):
+        decode_token(tokens["refresh_token"], expected_type="access")
+
+
+def test_expired_token_rejected(monkeypatch):
+    monkeypatch.setattr(auth_tokens, "ACCESS_TOKEN_TTL", -1)
+    token = issue_token_pair(EMPLOYEE)["access_token"]
+    with pytest.raises(TokenError):
+        decode_token(token)
+
+
+def test_refresh_rotates_and_revokes_old_token():
+    tokens = issue_token_pair(EMPLOYEE)
+    new_tokens = refresh_token_pair(tokens["refresh_token"])
+    assert decode_token(new_tokens["access_token"])["eid"] == "1007"
+    with pytest.raises(TokenError):
+        refresh_token_pair(tokens["refresh_token"])
+
+
+def test_revoked_access_token_rejected():
+    token = issue_token_pair(EMPLOYEE)["access_token"]
+    claims = decode_token(token)
+    revoke(claims["jti"], claims["exp"])
+    with pytest.raises(TokenError):
+        decode_token(token)
+
+
+def test_legacy_non_numeric_ids_get_no_token():
+    for employee in ({**EMPLOYEE, "id": "emp-7"}, {**EMPLOYEE, "id": None}, {**EMPLOYEE, "company_id": "main"}):
+        with pytest.raises(TokenError):
+            issue_token_pair(employee)
+
+
+def test_garbage_tokens_are_token_errors():
+    token = issue_token_pair(EMPLOYEE)["access_token"]
+    payload, sig = token.split(".")
+    for bad in ("é." + sig, payload + ".ü", auth_tokens._encode(["not", "a", "dict"])):
+        with pytest.raises(TokenError):
+            decode_token(bad)
+    with pytest.raises(TokenError, match="invalid token"):
+        decode_token("é." + sig)
+
+
+def test_no_tokens_without_a_configured_secret(monkeypatch):
+    token = issue_token_pair(EMPLOYEE)["access_token"]
+    monkeypatch.delenv("AUTH_TOKEN_SECRET")
+    monkeypatch.setattr(auth_tokens, "_secret", None)
+    assert not auth_tokens.tokens_configured()
+    with pytest.raises(TokenError, match="AUTH_TOKEN_SECRET"):
+        issue_token_pair(EMPLOYEE)
+    with pytest.raises(TokenError):
+        decode_token(token)
+
+
+def test_legacy_login_succeeds_without_tokens():
+    import backend.server as server
+
+    assert server._issue_tokens({**EMPLOYEE, "id": "emp-7"}) == {}
+    assert set(server._issue_tokens(EMPLOYEE)) == {"access_token", "refresh_token", "token_type", "expires_in"}
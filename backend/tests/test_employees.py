@@ -0,0 +1,224 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import backend.server as server
+from fake_mongo import FakeDB
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = FakeDB(employees=[
+        {"id": 1, "company_id": 1, "ad": "Ayşe", "soyad": "Yılmaz", "pozisyon": "Kasa", "maas_tabani": 30000,
+         "rol": "personel", "email": "ayse@example.com", "employee_id": "1001"},
+    ])
+    asyncio.run(db.employees.create_index([("email", 1)], name="employees_email", unique=True))
+    asyncio.run(db.employees.create_index([("employee_id", 1), ("company_id", 1)], name="employees_employee_company", unique=True))
+    monkeypatch.setattr(server, "db", db)
+    return db
+
+
+@pytest.fixture
+def client(fake_db):
+    return TestClient(server.app)
+
+
+def _employee(**kw):
+    return {"company_id": 1, "ad": "Mehmet", "soyad": "Kaya", "pozisyon": "Garson", "maas_tabani": 28000,
+            "rol": "personel", "email": "mehmet@example.com", "employee_id": "1002", **kw}
+
+
+def test_duplicate_employee_fields_are_client_errors(client, fake_db):
+    resp = client.post("/api/employees", json=_employee(email="ayse@example.com"))
+    assert resp.status_code == 400 and "email" in resp.json()["detail"]
+    resp = client.post("/api/employees", json=_employee(employee_id="1001"))
+    assert resp.status_code == 400 and "employee_id" in resp.json()["detail"]
+    assert len(fake_db.employees.docs) == 1
+
+    assert client.post("/api/employees", json=_employee()).status_code == 200
+    created = next(d for d in fake_db.employees.docs if d["email"] == "mehmet@example.com")
+    resp = client.put(f"/api/employees/{created['id']}", json={"email": "ayse@example.com"})
+    assert resp.status_code == 400
+    assert created["email"] == "mehmet@example.com"
+
+
+def test_password_migration_is_queued_or_run_in_the_background(monkeypatch, client):
+    import backend.cache as cache
+    import backend.password_migration as pm
+
+    started = []
+    monkeypatch.setattr(pm, "start_local_migration", lambda db, batch_size=500: started.append(batch_size) or True)
+    monkeypatch.delenv("REDIS_URL", raising=False)
+    resp = client.post("/api/migrate-passwords", params={"batch_size": 50})
+    assert resp.status_code == 200 and resp.json()["job_id"] is None
+    assert started == [50]
+
+    queued = []
+
+    class Queue:
+        def enqueue(self, func, **kwargs):
+            queued.append((func, kwargs))
+            return type("Job", (), {"id": "job-1"})()
+
+    monkeypatch.setenv("REDIS_URL", "redis://example:6379/0")
+    monkeypatch.setattr(cache, "get_queue", lambda name="default": Queue())
+    resp = client.post("/api/migrate-passwords", params={"batch_size": 100})
+    assert resp.status_code == 200 and resp.json()["job_id"] == "job-1"
+    assert queued == [("backend.tasks.migrate_passwords_job", {"batch_size": 100, "job_timeout": 3600})]
+    assert started == [50]
+
+
+@pytest.fixture
+def migration(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    import backend.password_migration as pm
+
+    # hash in threads with a cheap stand-in; bcrypt on a process pool is not what is tested here
+    monkeypatch.setattr(pm, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(pm, "_hash_password", lambda password: f"hash:{password}")
+    db = FakeDB(migrations=[], employees=[
+        {"id": n, "employee_id": str(1000 + n), **({"password": "set"} if n == 3 else {})} for n in range(1, 8)
+    ])
+    return pm, db
+
+
+def test_password_migration_writes_each_batch_with_one_bulk_write(migration):
+    pm, db = migration
+    stats = asyncio.run(pm.migrate_missing_passwords(db, batch_size=2))
+
+    assert stats["total"] == 6 and stats["processed"] == 6 and stats["updated"] == 6
+    assert [c for c in db.employees.calls if c[0] == "bulk_write"] == [("bulk_write", 2)] * 3
+    passwords = {d["employee_id"]: d["password"] for d in db.employees.docs}
+    assert passwords["1001"] == "hash:mehmet123" and passwords["1007"] == "hash:user1007"
+    assert passwords["1003"] == "set"
+    checkpoint = db.migrations.docs[0]
+    assert checkpoint["completed"] is True and checkpoint["last_id"] == 7
+    assert checkpoint["stats"]["processed"] == 6 and checkpoint["stats"]["updated"] == 6
+
+
+def test_password_migration_never_overwrites_a_password_set_meanwhile(migration):
+    pm, db = migration
+    ops = []
+
+    async def bulk_write(requests, ordered=True, session=None):
+        ops.extend(requests)
+        # an admin sets employee 2's password while the batch is being hashed
+        db.employees.docs[1]["password"] = "chosen"
+        return await type(db.employees).bulk_write(db.employees, requests, ordered=ordered)
+
+    db.employees.bulk_write = bulk_write
+    asyncio.run(pm.migrate_missing_passwords(db, batch_size=10))
+    assert ops[0]._filter == {"$and": [{"id": 1}, pm.MISSING_PASSWORD_QUERY]}
+    assert ops[0]._doc == {"$set": {"password": "hash:mehmet123"}}
+    assert db.employees.docs[1]["password"] == "chosen"
+
+
+def test_interrupted_password_migration_resumes_after_its_checkpoint(migration):
+    pm, db = migration
+
+    def crash(stats):
+        if stats["processed"] == 4:
+            raise RuntimeError("worker killed")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(pm.migrate_missing_passwords(db, batch_size=2, progress=crash))
+    checkpoint = db.migrations.docs[0]
+    assert checkpoint["completed"] is False and checkpoint["last_id"] == 5
+    assert checkpoint["stats"]["processed"] == 4
+
+    stats = asyncio.run(pm.migrate_missing_passwords(db, batch_size=2))
+    assert stats["total"] == 2 and stats["processed"] == 2
+    assert all(d.get("password") for d in db.employees.docs)
+    assert db.migrations.docs[0]["completed"] is True
+
+    # a completed checkpoint is not resumed from: a new run looks at everyone again
+    db.employees.docs[0]["password"] = ""
+    assert asyncio.run(pm.migrate_missing_passwords(db, batch_size=2))["updated"] == 1
+
+
+def test_local_password_migration_runs_once_per_process(monkeypatch, migration):
+    pm, db = migration
+    invalidated = []
+    monkeypatch.setattr(pm, "invalidate_directories", lambda: invalidated.append(True))
+    monkeypatch.setattr(pm, "_local_run", None)
+
+    async def main():
+        assert pm.start_local_migration(db, batch_size=3) is True
+        assert pm.start_local_migration(db, batch_size=3) is False
+        await pm._local_run
+
+    asyncio.run(main())
+    assert all(d.get("password") for d in db.employees.docs)
+    assert invalidated == [True]
+
+
+def test_directory_reloads_when_another_process_invalidates_it(monkeypatch, fake_db):
+    import backend.employee_directory as ed
+
+    class Redis:
+        values = {}
+
+        def get(self, key):
+            return self.values.get(key)
+
+        def incr(self, key):
+            self.values[key] = str(int(self.values.get(key) or 0) + 1)
+
+    monkeypatch.setattr(ed, "redis_configured", lambda: True)
+    monkeypatch.setattr(ed, "get_redis", lambda: Redis())
+    directory = ed.EmployeeDirectory(ttl_seconds=300)
+    directory.sync_seconds = 0
+    asyncio.run(directory.ensure_loaded(fake_db))
+    assert directory.lookup("1001")["has_password"] is False
+
+    # the migration job runs in an RQ worker with its own directory
+    fake_db.employees.docs[0]["password"] = "hash"
+    ed.EmployeeDirectory().invalidate_everywhere()
+    asyncio.run(directory.ensure_loaded(fake_db))
+    assert directory.lookup("1001")["has_password"] is True
+
+
+def test_employee_writes_reach_other_workers_directories(monkeypatch, client, fake_db):
+    import backend.employee_directory as ed
+
+    class Redis:
+        values = {}
+
+        def get(self, key):
+            return self.values.get(key)
+
+        def incr(self, key):
+            self.values[key] = str(int(self.values.get(key) or 0) + 1)
+            return int(self.values[key])
+
+    monkeypatch.setattr(ed, "redis_configured", lambda: True)
+    monkeypatch.setattr(ed, "get_redis", lambda: Redis())
+    Redis.values[ed.GENERATION_KEY] = "4"
+    local = ed.EmployeeDirectory(ttl_seconds=300)
+    other = ed.EmployeeDirectory(ttl_seconds=300)
+    for directory in (local, other):
+        directory.sync_seconds = 0
+        asyncio.run(directory.ensure_loaded(fake_db))
+    monkeypatch.setattr(server, "employee_directory", local)
+
+    assert client.put("/api/employees/1", json={"rol": "admin"}).status_code == 200
+    asyncio.run(other.ensure_loaded(fake_db))
+    assert other.lookup("1001")["rol"] == "admin"
+    # the writer patched its own copy and does not reload for its own change
+    assert local._generation == "5" and local.lookup("1001")["rol"] == "admin"
+
+    assert client.delete("/api/employees/1").status_code == 200
+    asyncio.run(other.ensure_loaded(fake_db))
+    assert other.lookup("1001") is None
+
+
+def test_directory_ttl_is_short_without_redis(monkeypatch):
+    import backend.employee_directory as ed
+
+    monkeypatch.delenv("EMPLOYEE_DIRECTORY_TTL", raising=False)
+    monkeypatch.setattr(ed, "redis_configured", lambda: False)
+    assert ed.EmployeeDirectory().ttl_seconds == 30
+    monkeypatch.setattr(ed, "redis_configured", lambda: True)
+    assert ed.EmployeeDirectory().ttl_seconds == 300
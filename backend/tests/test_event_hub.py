@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import backend.server as server
+import backend.pos as pos
+from backend.event_hub import EventHub
+from fake_mongo import FakeDB
+
+
+def test_subscribers_only_get_their_company():
+    async def main():
+        hub = EventHub(use_redis=False)
+        sub = hub.subscribe(company_id=1)
+        await hub.publish("order.created", 2, order_id=7)
+        await hub.publish("order.created", 1, order_id=8)
+        return sub.queue.get_nowait(), sub.queue.empty()
+
+    event, empty = asyncio.run(main())
+    assert event["data"]["order_id"] == 8
+    assert empty
+
+
+def test_events_without_a_company_reach_nobody():
+    async def main():
+        hub = EventHub(use_redis=False)
+        sub = hub.subscribe(company_id=1)
+        await hub.publish("order.created", None, order_id=7)
+        return sub.queue.empty()
+
+    assert asyncio.run(main())
+    with pytest.raises(ValueError):
+        EventHub(use_redis=False).subscribe(None)
+
+
+def test_slow_subscriber_drops_oldest_event():
+    async def main():
+        hub = EventHub(use_redis=False)
+        sub = hub.subscribe(1)
+        sub.queue = asyncio.Queue(maxsize=2)
+        for n in range(3):
+            await hub.publish("order.created", 1, order_id=n)
+        return [sub.queue.get_nowait()["data"]["order_id"] for _ in range(2)], sub.dropped
+
+    assert asyncio.run(main()) == ([1, 2], 1)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    db = FakeDB(menu_items=[{"id": 1, "name": "Kola", "price": 35.0, "active": True, "recipe": []}], orders=[])
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(pos, "db", db)
+    monkeypatch.setattr(pos, "_transactions_supported", False)
+    monkeypatch.setattr(pos, "event_hub", EventHub(use_redis=False))
+    monkeypatch.setattr("backend.event_hub.event_hub", pos.event_hub)
+    pos.recipe_table.invalidate()
+    with TestClient(server.app) as c:
+        yield c
+
+
+def test_websocket_receives_created_and_paid_events(client):
+    with client.websocket_connect("/api/pos/ws?company_id=1&types=order.created,order.paid") as ws:
+        client.post("/api/pos/order-pay", json={
+            "order": {"items": [{"menu_item_id": 1}], "table": "M1"},
+            "payment": {"method": "cash", "amount": 35},
+        })
+        created, paid = ws.receive_json(), ws.receive_json()
+    assert created["type"] == "order.created" and created["data"]["table"] == "M1"
+    assert paid["type"] == "order.paid" and paid["data"]["status"] == "paid"
+
+
+def test_event_streams_require_a_company(client):
+    from starlette.websockets import WebSocketDisconnect
+
+    assert client.get("/api/pos/events").status_code == 422
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect("/api/pos/ws") as ws:
+            ws.receive_json()
@@ -0,0 +1,57 @@
+from backend import login_throttle as lt
+from backend.login_throttle import SlidingWindowLimiter
+
+
+def test_sliding_window_rejects_over_limit_and_recovers(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(lt.time, "time", lambda: now[0])
+    limiter = SlidingWindowLimiter("test", limit=2, window_seconds=10, use_redis=False)
+
+    assert limiter.hit("k") is None
+    assert limiter.hit("k") is None
+    retry_after = limiter.hit("k")
+    assert retry_after is not None and 0 < retry_after <= 10
+    # other keys are independent
+    assert limiter.hit("other") is None
+
+    now[0] += 10.5
+    assert limiter.hit("k") is None
+    assert limiter.stats()["rejected"] == 1
+
+
+def test_login_throttle_checks_ip_and_account(monkeypatch):
+    throttle = lt.LoginThrottle()
+    throttle.per_ip = SlidingWindowLimiter("ip", limit=100, window_seconds=60, use_redis=False)
+    throttle.per_account = SlidingWindowLimiter("account", limit=1, window_seconds=60, use_redis=False)
+
+    assert throttle.check("10.0.0.1", "1000") is None
+    # account key is case/whitespace-insensitive and limited across IPs
+    assert throttle.check("10.0.0.2", " 1000 ") is not None
+    assert throttle.check("10.0.0.2", "1001") is None
+
+
+def test_forwarded_for_only_trusted_from_configured_proxies():
+    proxies = lt._parse_networks("10.0.0.0/8, 192.168.1.5")
+    # direct clients cannot pick their own address
+    assert lt.client_ip("203.0.113.9", "1.2.3.4", proxies) == "203.0.113.9"
+    # behind trusted proxies the nearest untrusted hop counts, not a spoofed leftmost one
+    assert lt.client_ip("10.1.2.3", "6.6.6.6, 198.51.100.7, 192.168.1.5", proxies) == "198.51.100.7"
+    assert lt.client_ip("10.1.2.3", None, proxies) == "10.1.2.3"
+    assert lt.client_ip("10.1.2.3", "6.6.6.6", []) == "10.1.2.3"
+
+
+def test_redis_window_is_one_atomic_script(monkeypatch):
+    calls = []
+
+    class Redis:
+        def register_script(self, source):
+            def run(keys, args):
+                calls.append((keys, args))
+                return None if len(calls) == 1 else b"4.5"
+            return run
+
+    monkeypatch.setattr(lt, "get_redis", lambda: Redis())
+    limiter = SlidingWindowLimiter("ip", limit=1, window_seconds=10, use_redis=True)
+    assert limiter.hit("1.2.3.4") is None
+    assert limiter.hit("1.2.3.4") == 4.5
+    assert [c[0] for c in calls] == [["login_throttle:ip:1.2.3.4"]] * 2
@@ -0,0 +1,40 @@
+from backend.menu_search import MenuSearchIndex, fold
+
+
+ITEMS = [
+    {"id": 1, "name": "İskender Kebap", "category_id": 1, "kiosk": True},
+    {"id": 2, "name": "Lahmacun", "category_id": 1},
+    {"id": 3, "name": "Şiş Köfte", "category_id": 1, "kiosk": True},
+    {"id": 4, "name": "Ayran", "category_id": 2},
+    {"id": 5, "name": "Izgara Tavuk", "category_id": 1, "description": "Közlenmiş biber ile"},
+]
+
+
+def _index():
+    index = MenuSearchIndex()
+    index.build(ITEMS, "v1")
+    return index
+
+
+def test_turkish_case_folding():
+    assert fold("İSKENDER") == fold("iskender") == "iskender"
+    assert fold("IZGARA") == "izgara"
+    assert fold("Şiş Köfte") == "sis kofte"
+
+
+def test_prefix_matches_any_word_and_ranks_name_start_first():
+    index = _index()
+    assert [m["id"] for m in index.search("isk")] == [1]
+    assert [m["id"] for m in index.search("kof")] == [3]
+    assert [m["id"] for m in index.search("ŞİŞ")] == [3]
+    assert [m["id"] for m in index.search("biber")] == [5]
+
+
+def test_fuzzy_matches_typos():
+    assert [m["id"] for m in _index().search("lahamcun")] == [2]
+
+
+def test_filters_apply_to_search_results():
+    index = _index()
+    assert [m["id"] for m in index.search("k", kiosk=True)] == [3, 1]
+    assert index.search("ayran", category_id=1) == []
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import backend.server as server
+import backend.pos as pos
+from backend.pos_catalog import CatalogSnapshot
+from fake_mongo import FakeDB
+
+
+@pytest.fixture
+def client(monkeypatch):
+    db = FakeDB(
+        menu_items=[{"id": 1, "name": "Kola", "price": 35.0, "category_id": 1, "active": True}],
+        pos_categories=[{"id": 1, "name": "Soft"}],
+        pos_zones=[],
+        pos_tables=[],
+    )
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(pos, "db", db)
+    monkeypatch.setattr(pos, "catalog", CatalogSnapshot(revalidate_seconds=60))
+    return TestClient(server.app)
+
+
+def test_full_snapshot_then_delta(client):
+    full = client.get("/api/pos/catalog")
+    body = full.json()
+    assert body["full"] is True
+    assert [m["name"] for m in body["menu_items"]] == ["Kola"]
+    assert full.headers["etag"] == f'"{body["version"]}"'
+
+    client.post("/api/pos/categories", json={"name": "Kahve"})
+    delta = client.get("/api/pos/catalog", params={"since": body["version"]}).json()
+    assert delta["full"] is False
+    assert delta["changes"] == [{"kind": "categories", "op": "upsert", "id": 2, "doc": delta["changes"][0]["doc"]}]
+    assert delta["changes"][0]["doc"]["name"] == "Kahve"
+
+
+def test_unchanged_catalog_returns_304(client):
+    etag = client.get("/api/pos/catalog").headers["etag"]
+    resp = client.get("/api/pos/catalog", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+
+
+def test_unknown_version_gets_full_snapshot(client):
+    body = client.get("/api/pos/catalog", params={"since": "otherworker-3"}).json()
+    assert body["full"] is True
+
+
+def test_menu_list_served_from_snapshot(client):
+    items = client.get("/api/pos/menu-items", params={"category_id": 1}).json()
+    assert [m["id"] for m in items] == [1]
+    assert client.get("/api/pos/menu-items", params={"category_id": 2}).json() == []
+
+
+def test_workers_share_versions_and_serve_each_others_deltas():
+    db = FakeDB(menu_items=[{"id": 1, "name": "Kola", "price": 35.0}], pos_categories=[], pos_zones=[], pos_tables=[])
+    a, b = CatalogSnapshot(revalidate_seconds=0), CatalogSnapshot(revalidate_seconds=0)
+
+    async def scenario():
+        await a.ensure_fresh(db)
+        await b.ensure_fresh(db)
+        assert a.token == b.token
+        since = a.token
+        # a write handled by worker a; worker b picks it up from the shared counter
+        db.menu_items.docs.append({"id": 2, "name": "Ayran", "price": 20.0})
+        await a.mark_changed(db)
+        await a.ensure_fresh(db)
+        await b.ensure_fresh(db)
+        assert a.token == b.token != since
+        return b.delta(since), b.delta("999")
+
+    delta, unknown = asyncio.run(scenario())
+    assert delta["full"] is False and [(c["op"], c["id"]) for c in delta["changes"]] == [("upsert", 2)]
+    assert unknown["full"] is True
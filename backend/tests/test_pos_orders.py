@@ -0,0 +1,633 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from pymongo.errors import DuplicateKeyError
+
+import backend.server as server
+import backend.pos as pos
+from backend import inventory_movements
+from fake_mongo import FakeDB
+
+
+def _menu():
+    return [
+        {"id": 1, "name": "Burger", "price": 120.0, "active": True,
+         "recipe": [{"stok_urun_id": 10, "quantity": 1}, {"stok_urun_id": 11, "quantity": 0.2}]},
+        {"id": 2, "name": "Kola", "price": 35.0, "active": True, "recipe": [{"stok_urun_id": 12, "quantity": 1}]},
+    ]
+
+
+def _stock():
+    return [
+        {"id": 10, "company_id": 1, "ad": "Ekmek", "mevcut": 5, "min_stok": 1},
+        {"id": 11, "company_id": 1, "ad": "Kofte", "mevcut": 1.0, "min_stok": 0.5},
+        {"id": 12, "company_id": 1, "ad": "Kola", "mevcut": 0, "min_stok": 2},
+    ]
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = FakeDB(menu_items=_menu(), stok_urun=_stock(), orders=[])
+    asyncio.run(db.stok_urun.create_index([("id", 1)], unique=True))
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(pos, "db", db)
+    monkeypatch.setattr(pos, "_transactions_supported", False)
+    pos.recipe_table.invalidate()
+    return db
+
+
+@pytest.fixture
+def client(fake_db):
+    return TestClient(server.app)
+
+
+def _stock_level(db, sid):
+    return next(d for d in db.stok_urun.docs if d["id"] == sid)["mevcut"]
+
+
+def test_order_deducts_stock_with_conditional_updates(client, fake_db):
+    resp = client.post("/api/pos/order", json={"items": [{"menu_item_id": 1, "quantity": 2}], "table": "B1"})
+    data = resp.json()
+    assert data["success"] is True
+    assert data["order"]["total"] == 240.0
+    assert data["order"]["status"] == "open"
+    assert _stock_level(fake_db, 10) == 3
+    assert _stock_level(fake_db, 11) == pytest.approx(0.6)
+    # one read and one round trip for every deduction
+    assert fake_db.stok_urun.calls == [fake_db.stok_urun.calls[0], ("bulk_write", 2)]
+
+
+def test_orders_use_compiled_recipe_table(client, fake_db):
+    client.post("/api/pos/order", json={"items": [{"menu_item_id": 1}]})
+    menu_reads = len(fake_db.menu_items.calls)
+    client.post("/api/pos/order", json={"items": [{"menu_item_id": 1}]})
+    assert len(fake_db.menu_items.calls) == menu_reads
+
+    # a menu update invalidates the table so the new price is used
+    client.put("/api/pos/menu-item/1", json={"price": 130})
+    data = client.post("/api/pos/order", json={"items": [{"menu_item_id": 1}]}).json()
+    assert data["order"]["total"] == 130.0
+
+
+def test_recipe_table_follows_other_workers_and_caches_unknown_ids(fake_db):
+    from backend.pos_catalog import CatalogSnapshot
+    from backend.pos_recipes import RecipeTable
+
+    worker_a = RecipeTable(CatalogSnapshot(revalidate_seconds=60), revalidate_seconds=0, negative_ttl=60)
+    worker_b = CatalogSnapshot(revalidate_seconds=60)
+
+    async def scenario():
+        assert (await worker_a.resolve(fake_db, [1]))[1].price == 120.0
+        # price change and deactivation handled by another worker
+        fake_db.menu_items.docs[0].update(price=130.0, active=False)
+        await worker_b.mark_changed(fake_db)
+        item = (await worker_a.resolve(fake_db, [1]))[1]
+        assert (item.price, item.active) == (130.0, False)
+
+        reads = len(fake_db.menu_items.calls)
+        for _ in range(3):
+            assert 99 not in await worker_a.resolve(fake_db, [99])
+        assert len(fake_db.menu_items.calls) == reads
+
+    asyncio.run(scenario())
+
+
+def test_insufficient_stock_rejects_order(client, fake_db):
+    resp = client.post("/api/pos/order", json={"items": [{"menu_item_id": 2, "quantity": 1}]})
+    data = resp.json()
+    assert data["success"] is False
+    assert data["error"] == "insufficient_stock"
+    assert data["details"][0]["stok_urun_id"] == 12
+    assert fake_db.orders.docs == []
+
+
+def test_order_pay_marks_order_paid(client, fake_db):
+    resp = client.post("/api/pos/order-pay", json={
+        "order": {"items": [{"menu_item_id": 1, "quantity": 1}]},
+        "payment": {"method": "cash", "amount": 120},
+    })
+    data = resp.json()
+    assert data["success"] is True
+    assert data["order"]["status"] == "paid"
+    assert data["order"]["payments"][0]["method"] == "cash"
+
+
+def test_transaction_fallback_reuses_the_order_id(monkeypatch, client, fake_db):
+    class Client:
+        async def start_session(self):
+            raise RuntimeError("Transaction numbers are only allowed on a replica set member or mongos")
+
+    monkeypatch.setattr(pos, "_transactions_supported", True)
+    monkeypatch.setattr(pos, "client", Client())
+    data = client.post("/api/pos/order", json={"items": [{"menu_item_id": 1}]}).json()
+    assert data["success"] is True and data["order"]["id"] == 1
+    assert fake_db.counters.docs == [{"_id": "orders", "seq": 1}]
+
+
+def test_partial_deduction_is_rolled_back(fake_db):
+    # skip the availability check: 10 succeeds, 12 fails, 10 must be re-credited
+    token, insufficient = asyncio.run(pos._deduct_stock({10: 2, 12: 1}))
+    assert token is None
+    assert insufficient[0]["stok_urun_id"] == 12
+    assert _stock_level(fake_db, 10) == 5
+    # no compensation state is left on the stock rows
+    assert all(set(d) <= {"id", "company_id", "ad", "mevcut", "min_stok"} for d in fake_db.stok_urun.docs)
+    # the deduction stopped at 12; only the matched 10 is re-credited, in one bulk op
+    assert [c for c in fake_db.stok_urun.calls if c[0] == "bulk_write"] == [("bulk_write", 2), ("bulk_write", 1)]
+
+
+def test_deduction_of_a_missing_ingredient_leaves_no_row_behind(fake_db):
+    token, insufficient = asyncio.run(pos._deduct_stock({10: 2, 99: 1}))
+    assert token is None
+    assert insufficient == [{"stok_urun_id": 99, "needed": 1, "available": 0}]
+    assert _stock_level(fake_db, 10) == 5
+    assert [d["id"] for d in fake_db.stok_urun.docs] == [10, 11, 12]
+
+
+def test_idempotency_key_replays_first_response(client, fake_db):
+    body = {"items": [{"menu_item_id": 1, "quantity": 1}], "table": "B2"}
+    first = client.post("/api/pos/order", json=body, headers={"Idempotency-Key": "term1-0001"})
+    retry = client.post("/api/pos/order", json=body, headers={"Idempotency-Key": "term1-0001"})
+
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert len(fake_db.orders.docs) == 1
+    assert _stock_level(fake_db, 10) == 4
+
+    reused = client.post("/api/pos/order", json={"items": [{"menu_item_id": 1, "quantity": 3}]}, headers={"Idempotency-Key": "term1-0001"})
+    assert reused.status_code == 422
+
+
+def test_concurrent_duplicates_wait_for_the_first_request(fake_db):
+    from backend.idempotency import run_idempotent
+
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"success": True, "n": len(calls)}
+
+    async def main():
+        return await asyncio.gather(*[run_idempotent(fake_db, "pos_order", "k1", {"a": 1}, handler) for _ in range(3)])
+
+    results = asyncio.run(main())
+    assert calls == [1]
+    assert [r[0] for r in results] == [{"success": True, "n": 1}] * 3
+    assert sorted(r[1] for r in results) == [False, True, True]
+
+
+def test_idempotent_request_whose_response_was_lost_is_not_run_again(monkeypatch, fake_db):
+    from fastapi import HTTPException
+    from backend.idempotency import run_idempotent
+
+    monkeypatch.setenv("POS_IDEMPOTENCY_LOCK_SECONDS", "0")
+    keys = fake_db.idempotency_keys
+    store = keys.update_one
+
+    async def update_one(query, update, **kwargs):
+        if "response" in update["$set"]:
+            raise RuntimeError("primary stepped down")
+        return await store(query, update, **kwargs)
+
+    keys.update_one = update_one
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        return {"success": True}
+
+    assert asyncio.run(run_idempotent(fake_db, "pos_order", "k1", {"a": 1}, handler)) == ({"success": True}, False)
+    assert keys.docs[0]["status"] == "unknown"
+    # even past the lock time the claim is not taken over
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(run_idempotent(fake_db, "pos_order", "k1", {"a": 1}, handler))
+    assert exc.value.status_code == 409
+    assert calls == [1]
+
+
+def test_hot_ingredients_go_through_the_inventory_ledger(monkeypatch, client, fake_db):
+    from backend.inventory_ledger import InventoryLedger
+
+    ledger = InventoryLedger(hot_skus={10}, use_redis=False, flush_seconds=3600)
+    monkeypatch.setattr(pos, "inventory_ledger", ledger)
+
+    for _ in range(2):
+        assert client.post("/api/pos/order", json={"items": [{"menu_item_id": 1}]}).json()["success"] is True
+    # hot row untouched until the flush, cold row deducted per order
+    assert _stock_level(fake_db, 10) == 5
+    assert _stock_level(fake_db, 11) == pytest.approx(0.6)
+    assert asyncio.run(ledger.available(10)) == 3
+    journal = fake_db.pos_inventory_journal.docs
+    assert [e["state"] for e in journal] == ["committed", "committed"]
+    assert {o["ledger_token"] for o in fake_db.orders.docs} == {e["_id"] for e in journal}
+
+    # only 3 buns left in the ledger: a 4-burger order is rejected without touching Mongo
+    data = client.post("/api/pos/order", json={"items": [{"menu_item_id": 1, "quantity": 4}]}).json()
+    assert data["error"] == "insufficient_stock"
+    assert asyncio.run(ledger.available(10)) == 3
+    journal = fake_db.pos_inventory_journal.docs
+    assert len(journal) == 2
+
+    assert asyncio.run(ledger.flush(fake_db)) == 2
+    assert _stock_level(fake_db, 10) == 3
+    assert "_ledger_flushes" not in fake_db.stok_urun.docs[0] or not fake_db.stok_urun.docs[0]["_ledger_flushes"]
+    # a flush re-run after a crash is not applied twice
+    flush_id = journal[0]["flush_id"]
+    for entry in journal:
+        entry["flushed"] = False
+    fake_db.stok_urun.docs[0]["_ledger_flushes"] = [flush_id]
+    asyncio.run(ledger._apply_flush(fake_db, flush_id))
+    assert _stock_level(fake_db, 10) == 3
+
+
+def test_ledger_reconciles_reservations_of_a_dead_worker(fake_db):
+    from backend.inventory_ledger import InventoryLedger
+
+    ledger = InventoryLedger(hot_skus={10}, use_redis=False, flush_seconds=3600, reservation_timeout=0)
+    link = {"coll": "orders", "field": "ledger_token"}
+
+    async def main():
+        stored, _ = await ledger.reserve(fake_db, {10: 1}, link=link)
+        lost, _ = await ledger.reserve(fake_db, {10: 2}, link=link)
+        # the worker died after storing the first order and before inserting the second
+        fake_db.orders.docs.append({"id": 1, "ledger_token": stored})
+        assert await ledger.available(10) == 2
+        assert await ledger.reconcile(fake_db) == {"committed": 1, "released": 1}
+        assert await ledger.available(10) == 4
+        # settled entries are left alone on the next pass
+        assert await ledger.reconcile(fake_db) == {"committed": 0, "released": 0}
+        return stored
+
+    stored = asyncio.run(main())
+    assert [(e["_id"], e["state"]) for e in fake_db.pos_inventory_journal.docs] == [(stored, "committed")]
+    assert asyncio.run(ledger.flush(fake_db)) == 1
+    assert _stock_level(fake_db, 10) == 4
+
+
+def test_ledger_counter_rebuild_counts_applied_reservations(fake_db):
+    from backend.inventory_ledger import InventoryLedger
+
+    ledger = InventoryLedger(hot_skus={10}, use_redis=False, flush_seconds=3600)
+
+    async def main():
+        token, _ = await ledger.reserve(fake_db, {10: 2})
+        # a fresh worker rebuilds the counter with the reservation already taken
+        other = InventoryLedger(hot_skus={10}, use_redis=False, flush_seconds=3600)
+        _, short = await other.reserve(fake_db, {10: 4})
+        assert short == [{"stok_urun_id": 10, "needed": 4, "available": 3.0}]
+        # releasing twice gives the stock back once
+        await ledger.release(fake_db, token, {10: 2})
+        await ledger.release(fake_db, token, {10: 2})
+        return await ledger.available(10)
+
+    assert asyncio.run(main()) == 5
+    assert fake_db.pos_inventory_journal.docs == []
+
+
+def test_ledger_stays_disabled_without_redis(monkeypatch):
+    from backend import inventory_ledger as ledger_module
+
+    monkeypatch.setenv("POS_INVENTORY_LEDGER_SKUS", "10,11")
+    monkeypatch.setattr(ledger_module, "redis_configured", lambda: False)
+    ledger = ledger_module.InventoryLedger.from_env()
+    assert not ledger.enabled
+    assert ledger.split({10: 1.0}) == ({}, {10: 1.0})
+
+
+def test_orders_list_filters_and_pages_with_cursor(client, fake_db):
+    fake_db.orders.docs.extend([
+        {"id": n, "company_id": 1, "table": "B1" if n % 2 else "B2", "status": "paid" if n < 4 else "open",
+         "created_at": f"2024-05-0{1 + n // 3}T12:00:0{n}+00:00", "total": 10.0 * n}
+        for n in range(1, 7)
+    ] + [{"id": 99, "company_id": 2, "status": "paid", "created_at": "2024-05-02T00:00:00+00:00"}])
+
+    first = client.get("/api/pos/orders", params={"limit": 4}).json()
+    assert [o["id"] for o in first["orders"]] == [6, 5, 4, 3]
+    second = client.get("/api/pos/orders", params={"limit": 4, "cursor": first["next_cursor"]}).json()
+    assert [o["id"] for o in second["orders"]] == [2, 1]
+    assert second["next_cursor"] is None
+
+    paid_b1 = client.get("/api/pos/orders", params={"status": "paid", "table": "B1"}).json()
+    assert [o["id"] for o in paid_b1["orders"]] == [3, 1]
+    day = client.get("/api/pos/orders", params={"from": "2024-05-02", "to": "2024-05-02"}).json()
+    assert [o["id"] for o in day["orders"]] == [5, 4, 3]
+    assert client.get("/api/pos/orders", params={"cursor": "bogus"}).status_code == 400
+
+
+def test_sales_rollups_feed_z_report_and_match_rebuild(client, fake_db):
+    client.post("/api/pos/order", json={"items": [{"menu_item_id": 1, "quantity": 2}]})
+    client.post("/api/pos/order-pay", json={
+        "order": {"items": [{"menu_item_id": 1}]},
+        "payment": {"method": "card", "amount": 120},
+    })
+    day = fake_db.pos_sales_rollups.docs[0]["day"]
+
+    z = client.get("/api/pos/reports/z", params={"day": day}).json()
+    assert z["orders"] == 2
+    assert z["revenue"] == 360.0
+    assert z["payments"] == {"card": 120.0}
+    assert z["items"] == [{"menu_item_id": 1, "name": "Burger", "quantity": 3, "revenue": 360.0}]
+    assert sum(h["orders"] for h in z["hourly"]) == 2
+
+    client.post("/api/pos/reports/rollups/rebuild", params={"from": day, "to": day})
+    rebuilt = client.get("/api/pos/reports/z", params={"day": day}).json()
+    assert {k: rebuilt[k] for k in ("orders", "revenue", "payments", "items")} == {k: z[k] for k in ("orders", "revenue", "payments", "items")}
+
+    sales = client.get("/api/pos/reports/sales", params={"from": day, "to": day}).json()
+    assert sales["days"] == [{"day": day, "orders": 2, "revenue": 360.0, "paid_total": 120.0}]
+
+
+def test_payment_methods_cannot_inject_rollup_fields_and_bad_dates_are_rejected(client, fake_db):
+    for method in ("a.b", "$x"):
+        resp = client.post("/api/pos/order-pay", json={
+            "order": {"items": [{"menu_item_id": 1}]},
+            "payment": {"method": method, "amount": 10},
+        })
+        assert resp.status_code == 200
+    day = fake_db.pos_sales_rollups.docs[0]["day"]
+    assert client.get("/api/pos/reports/z", params={"day": day}).json()["payments"] == {"other": 20.0}
+
+    assert client.get("/api/pos/reports/sales", params={"to": "bad"}).status_code == 400
+    assert client.get("/api/pos/reports/sales", params={"from": "2024-13-01"}).status_code == 400
+    assert client.get("/api/pos/reports/z", params={"day": "yesterday"}).status_code == 400
+
+
+def test_bulk_sync_inserts_batch_once_and_dedupes_resends(client, fake_db):
+    batch = {"orders": [
+        {"client_order_id": "k1-1", "client_created_at": "2024-05-01T09:00:00+00:00", "items": [{"menu_item_id": 1, "quantity": 2}]},
+        {"client_order_id": "k1-2", "client_created_at": "2024-05-01T09:01:00+00:00", "items": [{"menu_item_id": 2}]},
+        {"client_order_id": "k1-3", "client_created_at": "2024-05-01T09:02:00+00:00", "items": [{"menu_item_id": 1}],
+         "payment": {"method": "cash", "amount": 120}},
+    ]}
+    data = client.post("/api/pos/orders/bulk", json=batch).json()
+
+    assert [r["status"] for r in data["results"]] == ["created", "rejected", "created"]
+    assert data["results"][1]["error"] == "insufficient_stock"
+    assert _stock_level(fake_db, 10) == 2
+    # one read and one bulk conditional update for the whole batch
+    assert [c[0] for c in fake_db.stok_urun.calls] == ["find", "bulk_write"]
+    assert [c[0] for c in fake_db.orders.calls if c[0].startswith("insert")] == ["insert_many"]
+    stored = {o["client_order_id"]: o for o in fake_db.orders.docs}
+    assert stored["k1-1"]["created_at"] == "2024-05-01T09:00:00+00:00"
+    assert stored["k1-3"]["status"] == "paid"
+
+    again = client.post("/api/pos/orders/bulk", json=batch).json()
+    assert [r["status"] for r in again["results"]] == ["duplicate", "rejected", "duplicate"]
+    assert again["results"][0]["order_id"] == data["results"][0]["order_id"]
+    assert _stock_level(fake_db, 10) == 2
+
+
+def test_order_ids_come_from_an_atomic_counter(client, fake_db):
+    from backend.pos_collections import ensure_pos_collections
+
+    asyncio.run(ensure_pos_collections(fake_db))
+    fake_db.orders.docs.append({"id": 7, "company_id": 1, "status": "paid", "items": []})
+    batch = {"orders": [
+        {"client_order_id": "t1-1", "items": [{"menu_item_id": 1}]},
+        {"client_order_id": "t1-2", "items": [{"menu_item_id": 1}]},
+    ]}
+    results = client.post("/api/pos/orders/bulk", json=batch).json()["results"]
+    # seeded from the highest stored id, the batch reserves its range in one step
+    assert [r["order_id"] for r in results] == [8, 9]
+    assert fake_db.counters.docs == [{"_id": "orders", "seq": 9}]
+
+    async def concurrent():
+        return await asyncio.gather(server.allocate_ids("orders", 3), server.allocate_ids("orders"))
+
+    assert sorted(asyncio.run(concurrent())) == [10, 13]
+    assert client.post("/api/pos/order", json={"items": [{"menu_item_id": 1}]}).json()["order"]["id"] == 14
+    # a duplicate id can no longer be stored
+    with pytest.raises(DuplicateKeyError):
+        asyncio.run(fake_db.orders.insert_one({"id": 14}))
+
+
+def test_table_board_tracks_open_orders_until_paid_or_closed(monkeypatch, client, fake_db):
+    fake_db.pos_tables.docs.extend([{"id": 1, "name": "B1", "zone_id": 1}, {"id": 2, "name": "B2", "zone_id": 1}])
+    from backend.pos_catalog import CatalogSnapshot
+
+    monkeypatch.setattr(pos, "catalog", CatalogSnapshot(revalidate_seconds=60))
+
+    first = client.post("/api/pos/order", json={"items": [{"menu_item_id": 1, "quantity": 2}], "table": "B1"}).json()["order"]
+    second = client.post("/api/pos/order", json={"items": [{"menu_item_id": 1}], "table": "B1"}).json()["order"]
+
+    board = client.get("/api/pos/table-board").json()
+    b1 = next(t for t in board["tables"] if t["name"] == "B1")
+    assert board["open_tables"] == 1
+    assert b1["status"] == "occupied" and b1["order_ids"] == [first["id"], second["id"]]
+    assert (b1["item_count"], b1["total"]) == (3, 360.0)
+    assert next(t for t in board["tables"] if t["name"] == "B2")["status"] == "free"
+
+    client.post(f"/api/pos/order/{first['id']}/pay", json={"method": "cash", "amount": 100})
+    b1 = next(t for t in client.get("/api/pos/table-board").json()["tables"] if t["name"] == "B1")
+    assert (b1["paid"], b1["balance"]) == (100.0, 260.0)
+
+    paid = client.post(f"/api/pos/order/{first['id']}/pay", json={"method": "card", "amount": 140}).json()
+    assert paid["order"]["status"] == "paid"
+    client.post(f"/api/pos/order/{second['id']}/close")
+    board = client.get("/api/pos/table-board").json()
+    assert board["open_tables"] == 0
+    assert fake_db.pos_table_state.docs == []
+
+
+def test_concurrent_payments_settle_an_order_once(monkeypatch, client, fake_db):
+    published = []
+
+    async def publish(event_type, order):
+        published.append((event_type, order["id"]))
+
+    monkeypatch.setattr(pos, "publish_order_event", publish)
+
+    def pay_concurrently(order_id, *amounts):
+        async def main():
+            return await asyncio.gather(*(pos.pay_order(order_id, pos.PaymentCreate(method="cash", amount=a)) for a in amounts))
+        return asyncio.run(main())
+
+    # two halves: whichever lands second sees both payments
+    first = client.post("/api/pos/order", json={"items": [{"menu_item_id": 1, "quantity": 2}]}).json()["order"]
+    results = pay_concurrently(first["id"], 120, 120)
+    stored = next(o for o in fake_db.orders.docs if o["id"] == first["id"])
+    assert stored["status"] == "paid" and len(stored["payments"]) == 2
+    assert [r["order"]["status"] for r in results].count("paid") == 1
+    assert published.count(("order.paid", first["id"])) == 1
+
+    # two terminals each send the full amount: only one of them settles it
+    second = client.post("/api/pos/order", json={"items": [{"menu_item_id": 1}]}).json()["order"]
+    pay_concurrently(second["id"], 120, 120)
+    assert published.count(("order.paid", second["id"])) == 1
+
+    stored["status"] = "closed"
+    assert client.post(f"/api/pos/order/{first['id']}/pay", json={"method": "cash", "amount": 1}).status_code == 409
+    assert len(stored["payments"]) == 2
+
+
+def test_inventory_movements_are_batched_and_compacted(monkeypatch, client, fake_db):
+    from datetime import datetime, timezone
+    from backend.inventory_movements import MovementLog, compact_movements, stock_at
+
+    log = MovementLog(batch_size=100, flush_seconds=3600)
+    monkeypatch.setattr(pos, "movement_log", log)
+    monkeypatch.setattr(server, "movement_log", log)
+    monkeypatch.setattr(inventory_movements, "movement_log", log)
+
+    client.post("/api/pos/order", json={"items": [{"menu_item_id": 1, "quantity": 2}]})
+    # written off the request path, not by the order itself
+    assert fake_db.pos_inventory_movements.docs == []
+    assert asyncio.run(log.flush(fake_db)) == 2
+    before_count = datetime.now(timezone.utc)
+
+    client.post("/api/stok/sayimlar", json={"urun_id": 10, "miktar": 10, "sayim_yapan_id": 1})
+    client.post("/api/pos/order", json={"items": [{"menu_item_id": 1, "quantity": 1}]})
+    asyncio.run(log.flush(fake_db))
+    assert asyncio.run(stock_at(fake_db, 10, before_count))["quantity"] == 3
+    recorded = [{k: v for k, v in m.items() if k not in ("compacted", "compactionId", "claimedAt")} for m in fake_db.pos_inventory_movements.docs]
+    assert asyncio.run(compact_movements(fake_db))["compacted"] == 5
+
+    snapshot = next(s for s in fake_db.pos_stock_levels.docs if s["productVariantId"] == 10)
+    assert snapshot["opening"] == 5 and snapshot["quantity"] == 9
+    # compaction leaves what was recorded untouched, and past stock reads the same
+    assert [{k: v for k, v in m.items() if k not in ("compacted", "compactionId", "claimedAt")} for m in fake_db.pos_inventory_movements.docs] == recorded
+    assert asyncio.run(stock_at(fake_db, 10, before_count))["quantity"] == 3
+
+    history = client.get("/api/pos/inventory/10/movements").json()["movements"]
+    assert [(m["reason"], m["delta"], m["count"], m["refType"]) for m in history] == [
+        ("sale", -1, None, "order"), ("count", None, 10, "count"), ("sale", -2, None, "order")]
+
+    # a movement not compacted yet is folded on read
+    log.record(fake_db, 10, "sale", delta=-4)
+    asyncio.run(log.flush(fake_db))
+    level = client.get("/api/pos/inventory/10/level").json()
+    assert level["quantity"] == 5 and level["source"] == "snapshot" and level["folded_movements"] == 1
+
+
+def test_snapshot_openings_see_buffered_movements_and_committed_ledger_entries(monkeypatch, fake_db):
+    from backend.inventory_movements import MovementLog, compact_movements
+
+    log = MovementLog(batch_size=100, flush_seconds=3600)
+    monkeypatch.setattr(inventory_movements, "movement_log", log)
+    fake_db.pos_inventory_journal.docs.extend([
+        {"_id": "a", "state": "committed", "flushed": False, "sids": [10], "deltas": [[10, -1]]},
+        {"_id": "b", "state": "reserved", "flushed": False, "sids": [10], "deltas": [[10, -2]]},
+        {"_id": "c", "state": "committed", "flushed": False, "sids": [11], "deltas": [[11, -0.5]]},
+    ])
+    assert asyncio.run(inventory_movements._current_quantity(fake_db, 10)) == 4
+    assert [q for c, q in fake_db.pos_inventory_journal.calls if c == "find"][-1]["$or"][0] == {"sids": 10}
+
+    # a sale already taken off `mevcut` and still in this worker's buffer
+    log.record(fake_db, 10, "sale", delta=-1)
+    assert asyncio.run(compact_movements(fake_db))["compacted"] == 1
+    snapshot = next(s for s in fake_db.pos_stock_levels.docs if s["productVariantId"] == 10)
+    assert snapshot["opening"] == 5 and snapshot["quantity"] == 4
+
+
+def test_location_orders_draw_from_their_pool_and_scan_resolves_codes(monkeypatch, client, fake_db):
+    from backend.scan_index import ScanIndex
+
+    monkeypatch.setattr(pos, "scan_index", ScanIndex(stock_ttl=0))
+    fake_db.menu_items.docs[0]["barcode"] = "8690000000011"
+    fake_db.stok_urun.docs[0]["sku"] = "EKMEK-01"
+    pos.catalog._stale = True
+
+    resp = client.post("/api/pos/stock/transfer", json={"stok_urun_id": 10, "quantity": 3, "to_location_id": 2})
+    assert resp.json()["success"] is True
+    client.post("/api/pos/stock/transfer", json={"stok_urun_id": 11, "quantity": 0.5, "to_location_id": 2})
+    bun = next(d for d in fake_db.stok_urun.docs if d["id"] == 10)
+    assert bun["mevcut"] == 2 and bun["locations"] == {"2": 3}
+    assert client.post("/api/pos/stock/transfer", json={"stok_urun_id": 10, "quantity": 9, "from_location_id": 2}).status_code == 409
+
+    order = client.post("/api/pos/order", json={"items": [{"menu_item_id": 1, "quantity": 2}], "location_id": 2}).json()
+    assert order["success"] is True and order["order"]["location_id"] == 2
+    assert bun["locations"]["2"] == 1 and bun["mevcut"] == 2
+    # the location pool is short of kofte now, even though the unassigned pool has some
+    rejected = client.post("/api/pos/order", json={"items": [{"menu_item_id": 1}], "location_id": 2}).json()
+    assert rejected["error"] == "insufficient_stock"
+
+    scan = client.get("/api/pos/scan/8690000000011", params={"location_id": 2}).json()
+    assert scan["type"] == "menu_item" and scan["item"]["id"] == 1 and scan["available"] == 0
+    scan = client.get("/api/pos/scan/EKMEK-01").json()
+    assert scan["type"] == "stok_urun" and scan["available"] == 2 and scan["locations"] == {"2": 1}
+    assert client.get("/api/pos/scan/nope").status_code == 404
+
+
+def test_transfers_of_ledger_managed_stock_go_through_the_journal(monkeypatch, client, fake_db):
+    from backend.inventory_ledger import InventoryLedger
+
+    ledger = InventoryLedger(hot_skus={10}, use_redis=False, flush_seconds=3600)
+    monkeypatch.setattr(pos, "inventory_ledger", ledger)
+    bun = next(d for d in fake_db.stok_urun.docs if d["id"] == 10)
+
+    assert client.post("/api/pos/stock/transfer", json={"stok_urun_id": 10, "quantity": 3, "to_location_id": 2}).json()["success"]
+    assert client.post("/api/pos/stock/transfer", json={"stok_urun_id": 10, "quantity": 3, "to_location_id": 2}).status_code == 409
+    assert client.post("/api/pos/stock/transfer", json={"stok_urun_id": 10, "quantity": 1, "from_location_id": 2}).json()["success"]
+    assert client.post("/api/pos/stock/transfer", json={"stok_urun_id": 99, "quantity": 1, "to_location_id": 2}).status_code == 404
+    # the location side is written at once, the unassigned pool waits for the flush
+    assert bun["mevcut"] == 5 and bun["locations"] == {"2": 2}
+    assert asyncio.run(ledger.available(10)) == 3
+    assert len(bun["_ledger_refs"]) == 2
+
+    assert asyncio.run(ledger.flush(fake_db)) == 2
+    assert bun["mevcut"] == 3 and bun["locations"] == {"2": 2} and bun["_ledger_refs"] == []
+
+
+def test_low_stock_set_follows_threshold_crossings(monkeypatch, client, fake_db):
+    from backend import low_stock as tracker_module
+
+    tracker = tracker_module.LowStockTracker()
+    monkeypatch.setattr(pos, "low_stock", tracker)
+    monkeypatch.setattr(server, "low_stock", tracker)
+    published = []
+
+    async def publish(event_type, company_id, **data):
+        if event_type.startswith("stock."):
+            published.append((event_type, data["stok_urun_id"]))
+
+    monkeypatch.setattr(tracker_module.event_hub, "publish", publish)
+
+    assert client.post("/api/stok/low/rebuild").json() == {"low": 1}
+    assert [i["stok_urun_id"] for i in client.get("/api/stok/low").json()] == [12]
+
+    # kofte: 1.0 on hand, 0.2 per burger, min 0.5 -> the third burger crosses
+    client.post("/api/pos/order", json={"items": [{"menu_item_id": 1, "quantity": 2}]})
+    assert published == []
+    client.post("/api/pos/order", json={"items": [{"menu_item_id": 1}]})
+    assert published == [("stock.low", 11)]
+    assert [i["stok_urun_id"] for i in client.get("/api/stok/low").json()] == [12, 11]
+
+    # a stock count above the threshold clears it without touching live stock
+    mevcut = next(d for d in fake_db.stok_urun.docs if d["id"] == 12)["mevcut"]
+    client.post("/api/stok/sayimlar", json={"urun_id": 12, "miktar": 40, "sayim_yapan_id": 1})
+    assert published[-1] == ("stock.recovered", 12)
+    assert next(d for d in fake_db.stok_urun.docs if d["id"] == 12)["mevcut"] == mevcut
+    assert 12 not in [i["stok_urun_id"] for i in client.get("/api/stok/low").json()]
+
+
+def test_codes_given_at_creation_are_scannable(monkeypatch, client, fake_db):
+    from backend.scan_index import ScanIndex
+
+    monkeypatch.setattr(pos, "scan_index", ScanIndex(stock_ttl=0))
+    created = client.post("/api/pos/menu-item", json={"name": "Ayran", "price": 20, "barcode": "8690000000028", "sku": "AYR-1"}).json()
+    assert created["barcode"] == "8690000000028" and created["sku"] == "AYR-1"
+
+    for code in ("8690000000028", "AYR-1"):
+        scan = client.get(f"/api/pos/scan/{code}").json()
+        assert scan["type"] == "menu_item" and scan["item"]["id"] == created["id"]
+
+
+def test_scan_codes_are_per_company_and_menu_ids_still_resolve(monkeypatch, client, fake_db):
+    from backend.scan_index import ScanIndex
+
+    monkeypatch.setattr(pos, "scan_index", ScanIndex(stock_ttl=0))
+    fake_db.stok_urun.docs[0]["sku"] = "EKMEK-01"
+    fake_db.stok_urun.docs.append({"id": 20, "company_id": 2, "ad": "Lavas", "mevcut": 7, "sku": "EKMEK-01"})
+    fake_db.menu_items.docs[1]["barcode"] = "1"
+    pos.catalog._stale = True
+
+    assert client.get("/api/pos/scan/EKMEK-01").json()["item"]["id"] == 10
+    other = client.get("/api/pos/scan/EKMEK-01", params={"company_id": 2}).json()
+    assert other["item"]["id"] == 20 and other["available"] == 7
+    assert client.get("/api/pos/scan/EKMEK-01", params={"company_id": 3}).status_code == 404
+
+    # a typed menu item id resolves, but a real code that reads the same wins
+    assert client.get("/api/pos/scan/2").json()["item"]["id"] == 2
+    assert client.get("/api/pos/scan/1").json()["item"]["id"] == 2
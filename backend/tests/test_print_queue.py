@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+import backend.print_queue as print_queue
+from fake_mongo import FakeDB
+
+
+ORDER = {"id": 7, "adisyon_no": "A-7", "table": "M3", "total": 155.0,
+         "items": [{"name": "Burger", "quantity": 1, "line_total": 120.0}, {"name": "Kola", "quantity": 1, "line_total": 35.0}]}
+
+
+@pytest.fixture(autouse=True)
+def local_backend(monkeypatch):
+    monkeypatch.setattr(print_queue, "redis_configured", lambda: False)
+    monkeypatch.setenv("POS_PRINT_RETRY_DELAYS", "0")
+    monkeypatch.delenv("POS_PRINTER_ADDR", raising=False)
+
+
+def _run_with_fake_printer(monkeypatch, db):
+    received = []
+
+    async def main():
+        got_ticket = asyncio.Event()
+
+        async def handle(reader, writer):
+            received.append(await reader.read())
+            writer.close()
+            got_ticket.set()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        monkeypatch.setenv("POS_PRINTERS", f"default=127.0.0.1:{port}")
+        job = await print_queue.enqueue_print(db, ORDER)
+        await print_queue.spooler.join()
+        # the printer may still be reading after the sender has closed
+        await asyncio.wait_for(got_ticket.wait(), 5)
+        server.close()
+        await server.wait_closed()
+        return job
+
+    return asyncio.run(main()), received
+
+
+def test_enqueue_returns_before_printing_and_worker_prints(monkeypatch):
+    db = FakeDB(orders=[dict(ORDER)])
+    job, received = _run_with_fake_printer(monkeypatch, db)
+
+    assert job["status"] == "queued"
+    assert b"Adisyon: A-7" in received[0]
+    assert received[0].startswith(b"\x1b@\x1bt\x0d")
+    stored = asyncio.run(print_queue.print_status(db, 7))
+    assert [j["status"] for j in stored] == ["printed"]
+    assert stored[0]["attempts"] == 1
+
+
+def test_unreachable_printer_is_retried_then_dead_lettered(monkeypatch):
+    db = FakeDB(orders=[dict(ORDER)])
+
+    async def main():
+        # bind and close to get a port nobody listens on
+        server = await asyncio.start_server(lambda r, w: None, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        server.close()
+        await server.wait_closed()
+        monkeypatch.setenv("POS_PRINTERS", f"default=127.0.0.1:{port}")
+        await print_queue.enqueue_print(db, ORDER)
+        await print_queue.spooler.join()
+
+    asyncio.run(main())
+    stored = asyncio.run(print_queue.print_status(db, 7))
+    assert stored[0]["status"] == "dead"
+    assert stored[0]["attempts"] == 2
+    assert stored[0]["last_error"]
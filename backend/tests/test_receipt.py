@@ -0,0 +1,31 @@
+from backend import receipt
+
+
+ORDER = {
+    "id": 12, "adisyon_no": 12, "table": "Bahçe 2", "total": 245.0,
+    "created_at": "2024-05-01T12:30:00+00:00",
+    "items": [{"name": "Tavuk Şiş", "price": 160.0, "quantity": 1}, {"name": "Ayran", "price": 25.0, "quantity": 2}],
+    "payments": [{"method": "cash", "amount": 300.0}],
+}
+
+
+def test_receipt_uses_turkish_code_page_and_cuts():
+    data = receipt.render_receipt(ORDER, receipt.compile_template(42, "cp857", 13, "ADİSYON", ""))
+
+    assert data.startswith(receipt.INIT + b"\x1bt\x0d")
+    assert "Tavuk Şiş".encode("cp857") in data
+    assert "Para Üstü".encode("cp857") in data
+    assert b"55,00" in data
+    assert data.endswith(receipt.FEED_AND_CUT)
+
+
+def test_item_lines_are_padded_to_paper_width():
+    data = receipt.render_receipt(ORDER, receipt.compile_template(32, "cp857", 13, "X", ""))
+    lines = data.decode("cp857").split("\n")
+    item = next(line for line in lines if line.startswith("2 x Ayran"))
+    assert len(item) == 32 and item.endswith("50,00")
+
+
+def test_templates_are_compiled_once():
+    first = receipt.compile_template(48, "cp857", 13, "ADİSYON", "Teşekkürler")
+    assert receipt.compile_template(48, "cp857", 13, "ADİSYON", "Teşekkürler") is first
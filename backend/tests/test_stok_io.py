@@ -0,0 +1,154 @@
+import asyncio
+import io
+
+import openpyxl
+import pytest
+from fastapi.testclient import TestClient
+
+import backend.server as server
+from backend import stok_import
+from fake_mongo import FakeDB
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = FakeDB(
+        stok_urun=[
+            {"id": 1, "company_id": 1, "ad": "Domates", "birim_id": 1, "kategori_id": 1, "min_stok": 10, "mevcut": 4},
+            {"id": 2, "company_id": 1, "ad": "Pirinç", "birim_id": 2, "kategori_id": 2, "min_stok": 5, "mevcut": 50},
+            {"id": 3, "company_id": 2, "ad": "Un", "birim_id": 2, "kategori_id": 2, "min_stok": 5, "mevcut": 9},
+        ],
+        stok_sayim=[
+            {"id": 1, "company_id": 1, "urun_id": 1, "miktar": 12, "tarih": "2026-10-01"},
+            {"id": 2, "company_id": 1, "urun_id": 1, "miktar": 8, "tarih": "2026-10-03"},
+            {"id": 3, "company_id": 1, "urun_id": 1, "miktar": 7, "tarih": "2026-10-03"},
+            {"id": 4, "company_id": 1, "urun_id": 2, "miktar": 30, "tarih": "2026-09-15"},
+        ],
+    )
+    monkeypatch.setattr(server, "db", db)
+    return db
+
+
+@pytest.fixture
+def client(fake_db):
+    return TestClient(server.app)
+
+
+def _rows(content):
+    ws = openpyxl.load_workbook(io.BytesIO(content)).active
+    return [list(r) for r in ws.iter_rows(values_only=True)]
+
+
+def test_export_reads_latest_counts_with_one_aggregation(client, fake_db):
+    resp = client.get("/api/stok-export")
+    assert resp.status_code == 200
+    rows = _rows(resp.content)
+    assert rows[0] == ["id", "ad", "birim_id", "kategori_id", "min_stok", "mevcut_miktar"]
+    assert rows[1:] == [[1, "Domates", 1, 1, 10, 7], [2, "Pirinç", 2, 2, 5, 30]]
+    assert [c[0] for c in fake_db.stok_sayim.calls] == ["aggregate"]
+
+
+def _xlsx(rows):
+    wb = openpyxl.Workbook()
+    for r in rows:
+        wb.active.append(r)
+    out = io.BytesIO()
+    wb.save(out)
+    return out.getvalue()
+
+
+def test_import_upserts_in_bulk_and_reports_bad_rows(client, fake_db):
+    content = _xlsx([
+        ["ad", "birim_id", "kategori_id", "min_stok", "mevcut_miktar"],
+        ["Domates", 1, 1, 12, 20],
+        ["Soğan", 1, 3, 2, None],
+        [None, None, None, None, None],
+        ["Biber", "kg", 1, 1, 5],
+        [None, 1, 1, 1, 1],
+        ["Soğan", 1, 3, 4, None],
+        ["Nane", 1, 3, "-1", None],
+    ])
+    resp = client.post("/api/stok-import", files={"file": ("stok.xlsx", content)})
+    assert resp.status_code == 200
+    result = resp.json()
+    assert (result["created"], result["updated"], result["skipped"], result["error_count"]) == (1, 2, 1, 3)
+    assert [(e["row"], e["field"]) for e in result["errors"]] == [(5, "birim_id"), (6, "ad"), (8, "min_stok")]
+
+    by_name = {d["ad"]: d for d in fake_db.stok_urun.docs}
+    # mevcut_miktar is an observation; live stock keeps its value
+    assert by_name["Domates"]["mevcut"] == 4 and by_name["Domates"]["min_stok"] == 12
+    assert by_name["Soğan"]["id"] == 4 and by_name["Soğan"]["min_stok"] == 4
+    assert "Biber" not in by_name
+    # one product lookup and one bulk upsert for the whole (single-chunk) file
+    assert [c[0] for c in fake_db.stok_urun.calls if c[0] in ("find", "find_one", "bulk_write", "update_one", "insert_one")] == ["find", "find_one", "bulk_write", "find"]
+
+
+def test_import_records_movements_only_for_written_rows(client, fake_db, monkeypatch):
+    from backend.inventory_movements import MovementLog
+
+    log = MovementLog(flush_seconds=3600)
+    monkeypatch.setattr(stok_import, "movement_log", log)
+    asyncio.run(fake_db.stok_urun.create_index([("company_id", 1), ("ad", 1)], unique=True))
+    asyncio.run(fake_db.stok_urun.create_index([("id", 1)], unique=True))
+    # a counter that lags the data makes the new row's id collide
+    fake_db.counters.docs.append({"_id": "stok_urun", "seq": 2})
+
+    content = _xlsx([["ad", "min_stok", "mevcut_miktar"], ["Domates", 10, 20], ["Soğan", 1, 5]])
+    result = client.post("/api/stok-import", files={"file": ("stok.xlsx", content)}).json()
+    assert (result["updated"], result["created"], result["error_count"]) == (1, 0, 1)
+    assert result["errors"][0]["row"] == 3
+    assert [(m["productVariantId"], m["count"], m["refType"]) for m in log._buffer] == [(1, 20, "import")]
+
+    # the next run takes a fresh id from the counter
+    result = client.post("/api/stok-import", files={"file": ("stok.xlsx", content)}).json()
+    assert (result["updated"], result["created"], result["error_count"]) == (1, 1, 0)
+    assert next(d for d in fake_db.stok_urun.docs if d["ad"] == "Soğan")["id"] == 4
+    assert [(m["productVariantId"], m["count"]) for m in log._buffer][1:] == [(1, 20), (4, 5)]
+
+
+def test_import_rejects_sheet_without_name_column(client):
+    resp = client.post("/api/stok-import", files={"file": ("stok.xlsx", _xlsx([["isim", "min_stok"], ["Domates", 1]]))})
+    assert resp.status_code == 400
+
+
+def test_background_import_reports_progress(client, fake_db, monkeypatch, tmp_path):
+    monkeypatch.delenv("REDIS_URL", raising=False)
+    monkeypatch.setenv("STOK_IMPORT_SPOOL_DIR", str(tmp_path))
+    rows = [["ad", "min_stok", "mevcut_miktar"]] + [[f"Ürün {i}", 1, i] for i in range(5)] + [["Bozuk", "x", 1]]
+
+    async def run():
+        job = await stok_import.start_import_job(fake_db, io.BytesIO(_xlsx(rows)), filename="stok.xlsx")
+        assert job["status"] == "queued" and job["backend"] == "local"
+        await asyncio.gather(*stok_import._local_jobs)
+        return job["id"]
+
+    job_id = asyncio.run(run())
+    status = client.get(f"/api/imports/{job_id}").json()
+    assert status["status"] == "done" and status["eta_seconds"] == 0
+    assert (status["total_rows"], status["rows"], status["created"], status["error_count"]) == (6, 6, 5, 1)
+    assert status["errors"][0]["field"] == "min_stok" and status["rows_per_second"] > 0
+    assert "path" not in status and list(tmp_path.iterdir()) == []
+    assert fake_db.import_jobs.docs[0]["owner"]["worker"] == stok_import.WORKER_ID
+    assert client.get("/api/imports/missing").status_code == 404
+
+
+def test_only_import_jobs_whose_owner_stopped_heartbeating_are_failed(client, fake_db, tmp_path):
+    spooled = tmp_path / "lost.xlsx"
+    spooled.write_bytes(b"xlsx")
+    long_ago = "2020-01-01T00:00:00+00:00"
+    just_now = stok_import._now()
+    other = {"worker": "other-host:1:abc", "host": "other-host", "pid": 1}
+    asyncio.run(fake_db.import_jobs.insert_many([
+        {"id": "lost", "backend": "local", "status": "running", "path": str(spooled), "owner": other, "heartbeat_at": long_ago, "updated_at": long_ago},
+        # a large sheet in another worker: no progress write for a while, but still heartbeating
+        {"id": "busy", "backend": "local", "status": "running", "path": "", "owner": other, "heartbeat_at": just_now, "updated_at": long_ago},
+        {"id": "legacy", "backend": "local", "status": "running", "path": "", "updated_at": long_ago},
+        {"id": "waiting", "backend": "rq", "status": "queued", "path": "", "updated_at": long_ago},
+    ]))
+
+    status = client.get("/api/imports/lost").json()
+    assert status["status"] == "failed" and "interrupted" in status["error"]
+    assert not spooled.exists()
+    assert client.get("/api/imports/busy").json()["status"] == "running"
+    assert client.get("/api/imports/legacy").json()["status"] == "failed"
+    assert client.get("/api/imports/waiting").json()["status"] == "queued"
@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import axios from 'axios';
 // POS component: cleaned formatting to fix build-time JSX parsing errors
 
@@ -96,19 +96,37 @@ export default function POS({ companyId = 1 }) {
     };
   }, []);
 
+  // catalog version and section maps kept across refreshes so only deltas are fetched
+  const catalogRef = useRef({ version: null, sections: { menu_items: {}, categories: {}, zones: {}, tables: {} } });
+
   const fetchAll = async () => {
     try {
-      const [mRes, cRes, zRes, tRes] = await Promise.all([
-        axios.get(`${API}/pos/menu-items`),
-        axios.get(`${API}/pos/categories`),
-        axios.get(`${API}/pos/zones`),
-        axios.get(`${API}/pos/tables`),
-      ]);
-      setMenu(mRes.data || []);
-      setCategories(cRes.data || []);
-      setZones(zRes.data || []);
-      setTables(tRes.data || []);
-      if ((cRes.data || []).length) setActiveCategory((cRes.data || [])[0].id);
+      const state = catalogRef.current;
+      const res = await axios.get(`${API}/pos/catalog`, {
+        params: state.version ? { since: state.version } : {},
+        headers: state.version ? { 'If-None-Match': `"${state.version}"` } : {},
+        validateStatus: (s) => (s >= 200 && s < 300) || s === 304,
+      });
+      if (res.status === 304) return;
+      const data = res.data || {};
+      if (data.full) {
+        Object.keys(state.sections).forEach((kind) => {
+          state.sections[kind] = {};
+          (data[kind] || []).forEach((doc) => { state.sections[kind][doc.id] = doc; });
+        });
+      } else {
+        (data.changes || []).forEach((ch) => {
+          if (ch.op === 'delete') delete state.sections[ch.kind][ch.id];
+          else state.sections[ch.kind][ch.id] = ch.doc;
+        });
+      }
+      state.version = data.version;
+      const cats = Object.values(state.sections.categories);
+      setMenu(Object.values(state.sections.menu_items));
+      setCategories(cats);
+      setZones(Object.values(state.sections.zones));
+      setTables(Object.values(state.sections.tables));
+      if (cats.length && activeCategory === null) setActiveCategory(cats[0].id);
     } catch (err) {
       console.error('Failed to load POS data', err);
       setMessage('Menü yüklenemedi');
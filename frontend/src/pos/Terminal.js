@@ -40,17 +40,21 @@ export default function Terminal({ permissions = {}, companyId }) {
   const onBarcodeEnter = async () => {
     if (!barcode) return;
     try {
-      // try exact match on barcode field
-      const res = await axios.get(`${API}/pos/menu-items`, { params: { search: barcode } });
-      const found = (res.data || []).find(p => p.barcode === barcode || p.sku === barcode || p.id === Number(barcode));
-      if (found) {
+      // exact barcode/SKU (or typed menu item id) lookup, answered from the server's in-memory scan index
+      const res = await axios.get(`${API}/pos/scan/${encodeURIComponent(barcode)}`, { params: { company_id: companyId || 1 } });
+      const found = res.data.item;
+      if (res.data.type === 'menu_item') {
         // use global POS addToCart by simulating click — simplest is to call POST /api/pos/order with single item in kiosk mode, but here we'll redirect user to POS component
         // As a pragmatic step, show a message and focus the POS component
         setMessage(`${found.name} bulundu — POS'a ekleyin.`);
       } else {
-        setMessage('Barkod bulunamadı');
+        setMessage(`${found.ad} — stok: ${res.data.available}`);
       }
     } catch (err) {
+      if (err.response && err.response.status === 404) {
+        setMessage('Barkod bulunamadı');
+        return;
+      }
       console.error('barcode search', err);
       setMessage('Barkod aramada hata');
     } finally {